@@ -5,6 +5,21 @@ from datetime import datetime
 import SqliteHelper
 import utils
 import json
+from priority import PriorityScorer
+
+
+# 后续新增的字段, 旧数据库启动时自动补齐
+ADDED_COLUMNS = {
+    'attempts': 'INTEGER DEFAULT 0',
+    'last_error': 'TEXT DEFAULT NULL',
+    'next_retry_at': 'TEXT DEFAULT NULL',
+    'sim_duration': 'REAL DEFAULT 0',
+    'parent_sharpe': 'REAL DEFAULT NULL',
+    'priority': 'REAL DEFAULT 0',
+    'queue_time': 'REAL DEFAULT 0',
+    'post_latency': 'REAL DEFAULT 0',
+    'poll_count': 'INTEGER DEFAULT 0',
+}
 
 
 class AlphaMapper:
@@ -12,7 +27,7 @@ class AlphaMapper:
         self.db = SqliteHelper.Connect(f"{base_path}/quant_brain.db")
         """
         hash_id:simulate_data哈希值
-        location_id:回测完成后获取查询进度位于ID
+        location_id:回测提交后即保存的查询进度ID(多alpha回测为父回测ID), 回测完成后为回测ID
         alpha_id:回测完成后获取
         simulate_data:回测数据
         performance:回测完成后获取
@@ -20,6 +35,15 @@ class AlphaMapper:
         step: 1:一阶 2:二阶 3:三阶
         status: 参阅 constants.py
         parent_id: 鲁棒测试模拟回测使用的对照alpha_id
+        attempts: 回测失败次数
+        last_error: 最近一次回测失败原因
+        next_retry_at: 失败后下次可重试时间, 之前不会被取出回测
+        sim_duration: 提交到完成的回测耗时(秒), 多alpha回测为整组耗时
+        parent_sharpe: 生成该alpha的上一阶alpha的sharpe
+        priority: 回测优先级, 参阅 priority.py
+        queue_time: 进入回测队列到开始提交的等待时间(秒)
+        post_latency: 提交回测请求的耗时(秒), 含限流重试
+        poll_count: 查询回测进度的次数, 多alpha回测含父回测与子回测
         """
         self.db.table('t_alpha').create({
             'id': 'INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT',
@@ -47,18 +71,39 @@ class AlphaMapper:
             'description': 'TEXT DEFAULT NULL',
             'created_at': 'TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP',
             'updated_at': 'TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP',
-
+            **ADDED_COLUMNS,
         })
+        self.db.addColumns('t_alpha', ADDED_COLUMNS)
         self.db.createIndex('t_alpha', 'hash_id', 'uidx_hash_id', unique=True)
+        self.db.createIndex('t_alpha', 'status, priority DESC, id', 'idx_status_priority')
+        """
+        平台上的alpha索引, 用于回测前去重
+        alpha_id: 平台alpha ID
+        signature: 表达式签名, 参阅 utils.signature
+        date_created: 平台创建时间, 用于增量更新
+        """
+        self.db.table('t_platform_alpha').create({
+            'alpha_id': 'TEXT NOT NULL PRIMARY KEY',
+            'signature': 'TEXT NOT NULL',
+            'regular': 'TEXT DEFAULT NULL',
+            'settings': 'TEXT DEFAULT NULL',
+            'status': 'TEXT DEFAULT NULL',
+            'date_created': 'TEXT DEFAULT NULL',
+            'synced_at': 'TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP',
+        })
+        self.db.createIndex('t_platform_alpha', 'signature', 'idx_platform_signature')
+        self.scorer = None
 
     
-    def bath_save(self, simulate_data_list:list, field_prefix:str='', step:int=1, parent_id:str=None):
+    def bath_save(self, simulate_data_list:list, field_prefix:str='', step:int=1, parent_id:str=None, parent_sharpes:list=None):
         """"
         批量插入数据
+        @param parent_sharpes: 与 simulate_data_list 一一对应的上一阶alpha的sharpe, 用于计算回测优先级
         """
         table_data = []
         now = datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')
-        for simulate_data in simulate_data_list:
+        scorer = self.get_scorer()
+        for idx, simulate_data in enumerate(simulate_data_list):
 
             hash_id = utils.hash(simulate_data)
             
@@ -79,6 +124,9 @@ class AlphaMapper:
 
             if parent_id is not None:
                 alpha['parent_id'] = parent_id
+            if parent_sharpes is not None and parent_sharpes[idx] is not None:
+                alpha['parent_sharpe'] = parent_sharpes[idx]
+            alpha['priority'] = scorer.score(alpha)
             table_data.append(alpha)
             try:
                 self.db.table('t_alpha').add(alpha)
@@ -136,6 +184,142 @@ class AlphaMapper:
         return self.db.table('t_alpha').where(where).order('created_at asc').find(page_size, page)
         
 
+    def get_alphas_after(
+            self
+            , after:dict=None
+            , status:str=constants.ALPHA_STATUS_INIT
+            , page_size:int=100) -> list:
+        """
+        按 (优先级降序, id) 游标获取alpha数据, 不受翻页期间状态变化影响; 未到 next_retry_at 的失败重试数据不会被取出
+        @param after: 上一页最后一条数据, None 为第一页
+        @param status: 状态
+        @param page_size: 每页数量, 0 为不限
+        """
+        now = datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')
+        where = f'status = "{status}" and (next_retry_at is null or next_retry_at <= "{now}")'
+        if after is not None:
+            priority = float(after['priority'] or 0)
+            where += f' and (priority < {priority} or (priority = {priority} and id > {int(after["id"])}))'
+        return self.db.table('t_alpha').where(where).order({'priority': 'desc', 'id': 'asc'}).find(page_size)
+
+    def get_scorer(self, refresh:bool=False) -> PriorityScorer:
+        """
+        获取按已同步指标统计命中率的优先级计算器
+        """
+        if self.scorer is None or refresh:
+            cursor = self.db.query(
+                'SELECT regular, field_prefix, sharpe, fitness FROM t_alpha WHERE status in '
+                f'("{constants.ALPHA_STATUS_SYNC}", "{constants.ALPHA_STATUS_CHECKED}", "{constants.ALPHA_STATUS_SUBMITTED}")'
+            )
+            self.scorer = PriorityScorer()
+            self.scorer.refresh([
+                {'regular': regular, 'field_prefix': field_prefix, 'sharpe': sharpe, 'fitness': fitness}
+                for regular, field_prefix, sharpe, fitness in cursor.fetchall()
+            ])
+        return self.scorer
+
+    def rescore(self, status:str=constants.ALPHA_STATUS_INIT) -> int:
+        """
+        按最新命中率重新计算优先级
+        @return: 重新计算的数量
+        """
+        scorer = self.get_scorer(refresh=True)
+        cursor = self.db.query(
+            f'SELECT id, step, parent_sharpe, field_prefix, regular FROM t_alpha WHERE status = "{status}"'
+        )
+        columns = [item[0] for item in cursor.description]
+        updates = [
+            (scorer.score(alpha), alpha['id'])
+            for alpha in (dict(zip(columns, row)) for row in cursor.fetchall())
+        ]
+        conn = self.db.getConn()
+        with conn:
+            conn.executemany('UPDATE t_alpha SET priority = ? WHERE id = ?', updates)
+        return len(updates)
+
+    def get_sim_durations(self) -> list:
+        """
+        获取已有回测耗时的表达式、设置、数据集与耗时
+        """
+        cursor = self.db.query('SELECT regular, settings, field_prefix, sim_duration FROM t_alpha WHERE sim_duration > 0')
+        return [
+            {'regular': regular, 'settings': settings, 'field_prefix': field_prefix, 'sim_duration': sim_duration}
+            for regular, settings, field_prefix, sim_duration in cursor.fetchall()
+        ]
+
+    def get_pending_alphas(self) -> list:
+        """
+        获取待回测与回测中 alpha 的表达式、设置与数据集, 用于预测剩余耗时
+        """
+        cursor = self.db.query(
+            'SELECT regular, settings, field_prefix FROM t_alpha WHERE status in '
+            f'("{constants.ALPHA_STATUS_INIT}", "{constants.ALPHA_STATUS_SIMULATING}")'
+        )
+        return [
+            {'regular': regular, 'settings': settings, 'field_prefix': field_prefix}
+            for regular, settings, field_prefix in cursor.fetchall()
+        ]
+
+    def save_platform_alphas(self, alphas:list):
+        """
+        保存平台alpha索引, 已存在的覆盖
+        @param alphas: 包含 alpha_id, signature, regular, settings, status, date_created 的数据
+        """
+        now = datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')
+        conn = self.db.getConn()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO t_platform_alpha '
+                '(alpha_id, signature, regular, settings, status, date_created, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (alpha['alpha_id'], alpha['signature'], alpha['regular'], alpha['settings'], alpha['status'], alpha['date_created'], now)
+                    for alpha in alphas
+                ],
+            )
+
+    def get_platform_latest(self) -> str | None:
+        """
+        平台alpha索引中最新的创建时间, 索引为空时为 None
+        """
+        return self.db.query('SELECT MAX(date_created) FROM t_platform_alpha').fetchone()[0]
+
+    def get_platform_signatures(self) -> dict:
+        """
+        平台alpha索引中的签名与对应的 alpha_id
+        """
+        cursor = self.db.query('SELECT signature, alpha_id FROM t_platform_alpha')
+        return dict(cursor.fetchall())
+
+    def get_init_signatures(self) -> list:
+        """
+        待回测alpha的 hash_id 与签名
+        """
+        cursor = self.db.query(f'SELECT hash_id, regular, settings FROM t_alpha WHERE status = "{constants.ALPHA_STATUS_INIT}"')
+        return [
+            {'hash_id': hash_id, 'signature': utils.signature(regular, settings)}
+            for hash_id, regular, settings in cursor.fetchall()
+        ]
+
+    def bulk_update(self, alphas:list, key:str='hash_id'):
+        """
+        在同一事务内批量更新数据状态
+        @param alphas: 待更新数据, 每项须包含 key 字段
+        @param key: 定位字段
+        """
+        if not alphas:
+            return
+        now = datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')
+        conn = self.db.getConn()
+        with conn:
+            for alpha in alphas:
+                fields = {k: v for k, v in alpha.items() if k != key}
+                fields['updated_at'] = now
+                sets = ', '.join(f'{k} = ?' for k in fields)
+                conn.execute(
+                    f'UPDATE t_alpha SET {sets} WHERE {key} = ?',
+                    (*fields.values(), alpha[key])
+                )
+
     def updateById(self, id:str, alpha:dict):
         """
         更新数据状态
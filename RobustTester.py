@@ -220,7 +220,7 @@ class RobustTester:
             self.paint(alpha_id_ori, df_list)
 
 if  __name__ == "__main__":
-    wqbs= wqb.WQBSession((utils.load_credentials('~/.brain_credentials.txt')))
+    wqbs= wqb.WQBSession((utils.load_credentials('~/.brain_credentials.txt')), auth_cache='~/.brain_session.json')
     tester = RobustTester(wqbs, './results')
     start_time=datetime.fromisoformat('2025-06-22T00:00:00-05:00')
     end_time=datetime.fromisoformat('2025-06-22T00:00:00-05:00')
@@ -33,6 +33,19 @@ class Connect(object):
 
         self.getConn().execute(f"CREATE {unique_str} INDEX IF NOT EXISTS " + indexName + " ON " + tabl + "(" + field + ")")
 
+    # 添加表中缺失的字段（表结构迁移）
+    def addColumns(self, tabl, fields):
+        existing = [row[1] for row in self.getConn().execute("PRAGMA table_info(" + tabl + ")")]
+        missing = {field: definition for field, definition in fields.items() if field not in existing}
+        for field, definition in missing.items():
+            self.getConn().execute("ALTER TABLE " + tabl + " ADD COLUMN " + field + " " + definition)
+        if len(missing) > 0:
+            self.getConn().commit()
+            # 刷新缓存的表结构
+            if tabl in self.tableObj.keys():
+                self.tableObj[tabl].setTable(tabl)
+        return list(missing)
+
     # 关闭数据库连接
     def close(self):
         self.getConn().close()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+本地基准测试: 用本地替身服务器(mock_brain.py)模拟 BRAIN 回测接口, 测量 N 个回测在不同并发数下的耗时
+
+用法:
+    python benchmark.py --alphas 20 --sim-seconds 1.0 --latency 0.15 --concurrency 1 2 4 8 10
+    # PnL 解码: resp.json() + 逐个 DataFrame concat 对比 numpy 直接解码 + 一次性对齐
+    python benchmark.py --case pnl --alphas 3000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import pandas as pd
+
+import wqb
+from mock_brain import MockBrainServer
+
+
+class BlockingWQBSession(wqb.WQBSession):
+    """旧的传输方式: 在协程内直接调用同步请求, 会阻塞事件循环"""
+
+    async def arequest(self, method, url, *args, **kwargs):
+        return self.request(method, url, *args, **kwargs)
+
+
+def make_session(cls, server: MockBrainServer, concurrency: int) -> wqb.WQBSession:
+    # 关闭限流, 只测量传输层
+    wqbs = cls(('bench@example.com', 'bench'), pool_size=concurrency, rate_limiter=None)
+    return server.attach(wqbs)
+
+
+def run_once(cls, server: MockBrainServer, alphas: int, concurrency: int) -> float:
+    wqbs = make_session(cls, server, concurrency)
+    targets = [{'type': 'REGULAR', 'regular': f"rank(close) * {idx}"} for idx in range(alphas)]
+    start = time.perf_counter()
+    resps = asyncio.run(
+        wqbs.concurrent_simulate(targets, concurrency, return_exceptions=True, log=None)
+    )
+    elapsed = time.perf_counter() - start
+    stats = wqbs.pool_stats()
+    wqbs.close()
+    if cls is wqb.WQBSession:
+        print(f"    请求 {stats['requests']} 次, 新建连接 {stats['connections']} 个, 复用率 {stats['reuse_ratio']:.0%}")
+    failed = sum(1 for resp in resps if isinstance(resp, BaseException) or resp is None)
+    if failed:
+        print(f'⚠️ {failed} 个回测失败')
+    return elapsed
+
+
+def decode_pnls_dataframe(payloads: dict) -> pd.DataFrame:
+    """旧的解码方式: json 解析后逐个构造 DataFrame, 最后 concat"""
+    frames = []
+    for alpha_id, content in payloads.items():
+        pnl = json.loads(content)
+        df = pd.DataFrame(pnl['records'], columns=[item['name'] for item in pnl['schema']['properties']])
+        df = df.rename(columns={'date': 'Date', 'pnl': alpha_id})
+        frames.append(df[['Date', alpha_id]].set_index('Date'))
+    result = pd.concat(frames, axis=1)
+    result.sort_index(inplace=True)
+    return result
+
+
+def decode_pnls_arrays(payloads: dict) -> pd.DataFrame:
+    """新的解码方式: 直接解码为 numpy 数组, 按日期并集一次性对齐"""
+    pnls = {alpha_id: wqb.decode_pnl(content) for alpha_id, content in payloads.items()}
+    days, columns, matrix = wqb.align_pnls(pnls)
+    return pd.DataFrame(matrix, index=wqb.days_to_dates(days), columns=columns)
+
+
+def run_pnl(alphas: int, pnl_days: int):
+    server = MockBrainServer(alphas=0, pnl_days=pnl_days)
+    server.server_close()
+    # 与 /alphas/{id}/recordsets/pnl 相同的响应体, 只测量解码
+    payloads = {f"A{idx:06d}": json.dumps(server._pnl(f"A{idx:06d}")).encode('utf-8') for idx in range(alphas)}
+    size = sum(len(content) for content in payloads.values())
+    print(f'{alphas} 个 alpha, 每个 {pnl_days} 天, 共 {size / 1024 / 1024:.1f} MiB, JSON 后端: {wqb.JSON_BACKEND}')
+    for name, func in (('resp.json + DataFrame concat', decode_pnls_dataframe), ('numpy 数组 + 一次性对齐', decode_pnls_arrays)):
+        start = time.perf_counter()
+        df = func(payloads)
+        print(f'{name:>28}: {time.perf_counter() - start:.2f}s, 结果 {df.shape}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发回测本地基准测试')
+    parser.add_argument('--case', choices=['simulate', 'pnl'], default='simulate')
+    parser.add_argument('--alphas', type=int, default=20)
+    parser.add_argument('--pnl-days', type=int, default=1260)
+    parser.add_argument('--sim-seconds', type=float, default=1.0)
+    parser.add_argument('--retry-after', type=float, default=0.25)
+    parser.add_argument('--latency', default='0.15', help='每个请求的服务端延迟分布, 如 0.15 / lognormal:-2,0.5')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 10])
+    args = parser.parse_args()
+
+    if args.case == 'pnl':
+        run_pnl(args.alphas, args.pnl_days)
+        return
+
+    server = MockBrainServer(
+        latency=args.latency, sim_duration=args.sim_seconds, retry_after=args.retry_after, alphas=0
+    ).start()
+    print(f'替身服务器: {server.base_url}, {args.alphas} 个回测, 每个 {args.sim_seconds}s, 请求延迟 {args.latency}s')
+    print(f"{'并发':>6} | {'阻塞传输(s)':>12} | {'异步传输(s)':>12} | {'理论下限(s)':>12}")
+    try:
+        for concurrency in args.concurrency:
+            blocking = run_once(BlockingWQBSession, server, args.alphas, concurrency)
+            non_blocking = run_once(wqb.WQBSession, server, args.alphas, concurrency)
+            ideal = -(-args.alphas // concurrency) * args.sim_seconds
+            print(f'{concurrency:>6} | {blocking:>12.2f} | {non_blocking:>12.2f} | {ideal:>12.2f}')
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@
 
 # 初始状态
 ALPHA_STATUS_INIT = 'INIT'
+# 回测中（已提交, location_id 为进度查询ID）
+ALPHA_STATUS_SIMULATING = 'SIMULATING'
 # 已回测
 ALPHA_STATUS_SIMUATED = 'SIMULATED'
 # 已同步指标数据
@@ -12,6 +14,8 @@ ALPHA_STATUS_CHECKED = 'CHECKED'
 ALPHA_STATUS_SUBMITTED = 'SUBMITTED'
 # 已废弃（失败或主动自相关过高）
 ALPHA_STATUS_DISCARDED = 'DISCARDED'
+# 重复（平台上已回测过相同的表达式与设置, 跳过回测）
+ALPHA_STATUS_DUPLICATE = 'DUPLICATE'
 
 IS_SHARPE = 'sharpe'
 IS_FITNESS = 'fitness'
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import json
+
+import constants
+import utils
+import wqb
+from AlphaMapper import AlphaMapper
+
+class Deduplicator:
+    """
+    回测前去重: 用 filter_alphas 把平台上所有 alpha 的表达式签名保存到本地索引 t_platform_alpha,
+    待回测 alpha 的签名已在索引中时置为 DUPLICATE, 不占用回测配额
+    """
+    def __init__(self, wqbs: wqb.WQBSession, db_path:str="./db", mapper:AlphaMapper=None, limit:int=100000, concurrency:int=4):
+        """
+        Args:
+            wqbs: wqb.WQBSession
+            db_path: 数据库路径
+            mapper: 共用的 AlphaMapper, 默认按 db_path 新建
+            limit: 每次更新索引最多获取的 alpha 数量
+            concurrency: 翻页并发数
+        """
+        self.wqbs = wqbs
+        self.mapper = AlphaMapper(db_path) if mapper is None else mapper
+        self.limit = limit
+        self.concurrency = concurrency
+
+    def refresh(self, full:bool=False) -> int:
+        """
+        更新平台alpha索引: 默认只获取索引中最新创建时间前一天之后创建的 alpha
+        @param full: 是否全量更新
+        @return: 获取的 alpha 数量
+        """
+        latest = None if full else self.mapper.get_platform_latest()
+        date_range = None
+        if latest is not None:
+            # 前一天起重叠获取, 避免时区与同一时间创建的 alpha 遗漏
+            begin = datetime.fromisoformat(latest) - timedelta(days=1)
+            end = datetime.now(begin.tzinfo).replace(microsecond=0) + timedelta(days=1)
+            date_range = wqb.FilterRange(begin, end, lo_eq=True, hi_eq=True)
+        print(f"📋 更新平台alpha索引{'(全量)' if latest is None else f'(自{latest}起)'}...")
+        alphas = utils.filter_alphas(
+            self.wqbs,
+            status=None,
+            dateCreatedFilterRange=date_range,
+            order='dateCreated',
+            limit=self.limit,
+            log_name=f"{self.__class__.__name__}#refresh",
+            concurrency=self.concurrency,
+        )
+        rows = []
+        for alpha in alphas:
+            regular = (alpha.get('regular') or {}).get('code')
+            settings = alpha.get('settings') or {}
+            if not regular:
+                continue
+            rows.append({
+                'alpha_id': alpha['id'],
+                'signature': utils.signature(regular, settings),
+                'regular': regular,
+                'settings': json.dumps(settings, ensure_ascii=False),
+                'status': alpha.get('status'),
+                'date_created': alpha.get('dateCreated'),
+            })
+        self.mapper.save_platform_alphas(rows)
+        print(f'📋 平台alpha索引更新{len(rows)}个...')
+        return len(rows)
+
+    def run(self, refresh:bool=True) -> int:
+        """
+        待回测 alpha 中与平台上已回测的表达式、设置相同的置为 DUPLICATE, alpha_id 为平台上的 alpha
+        @param refresh: 是否先更新平台alpha索引
+        @return: 跳过的 alpha 数量
+        """
+        if refresh:
+            self.refresh()
+        signatures = self.mapper.get_platform_signatures()
+        duplicates = [
+            {'hash_id': alpha['hash_id'], 'alpha_id': signatures[alpha['signature']], 'status': constants.ALPHA_STATUS_DUPLICATE}
+            for alpha in self.mapper.get_init_signatures()
+            if alpha['signature'] in signatures
+        ]
+        self.mapper.bulk_update(duplicates)
+        print(f'📋 {len(duplicates)}个alpha平台上已回测过, 跳过回测...')
+        return len(duplicates)
@@ -25,7 +25,8 @@ class ExportFiles:
             region=self.searchScope['region'],
             delay=self.searchScope['delay'],
             universe=self.searchScope['universe'],
-            log=f'{self.__class__}#generate_datasets_file'
+            log=f'{self.__class__}#generate_datasets_file',
+            concurrency=4
         )
         for resp in resps:
             results.extend(resp.json()['results'])
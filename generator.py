@@ -110,17 +110,19 @@ class Generator:
                 break
             fo_tracker = self.handle_alphas(alphas, sharpe)
             fo_layer = self.prune(fo_tracker, 5)
-            sim_data_list = self._generate_second(group_ops, fo_layer)
+            sim_data_list, parent_sharpes = self._generate_second(group_ops, fo_layer)
             print(f'📋 生成结束，共{len(sim_data_list)}个alpha...')
             print(f'📋 开始保存alpha...')
            
-            self.mapper.bath_save(sim_data_list,step=2)
+            self.mapper.bath_save(sim_data_list,step=2,parent_sharpes=parent_sharpes)
             page += 1
         
     def _generate_second(self, group_ops:list,fo_layer):
+        """返回 alpha 列表与对应的上一阶 sharpe 列表"""
         sim_data_list = []
+        parent_sharpes = []
         settings = dataset_config.default_settings
-        for expr, decay in fo_layer:
+        for expr, decay, sharpe in fo_layer:
             for alpha in factory.get_group_second_order_factory([expr], group_ops, self.region):
                 # 更新decay
                 settings["decay"] = decay
@@ -129,9 +131,10 @@ class Generator:
                     'settings': settings,
                     'regular': alpha
                 })
+                parent_sharpes.append(sharpe)
         # random.shuffle(sim_data_list)
 
-        return sim_data_list
+        return sim_data_list, parent_sharpes
     
     def generate_third(self, third_op:str, sharpe: float=1.4, fitness: float=1.0, self_corr: float=0.6):
         """
@@ -153,17 +156,19 @@ class Generator:
                 break
             fo_tracker = self.handle_alphas(alphas, sharpe)
             fo_layer = self.prune(fo_tracker, 5)
-            sim_data_list = self._generate_second(third_op,fo_layer)
+            sim_data_list, parent_sharpes = self._generate_third(third_op,fo_layer)
             print(f'📋 生成结束，共{len(sim_data_list)}个alpha...')
             print(f'📋 开始保存alpha...')
             
-            self.mapper.bath_save(sim_data_list,step=3)
+            self.mapper.bath_save(sim_data_list,step=3,parent_sharpes=parent_sharpes)
             page += 1
 
     def _generate_third(self, third_op:str, fo_layer):
+        """返回 alpha 列表与对应的上一阶 sharpe 列表"""
         sim_data_list = []
+        parent_sharpes = []
         settings = dataset_config.default_settings
-        for expr, decay in fo_layer:
+        for expr, decay, sharpe in fo_layer:
            for alpha in factory.trade_when_factory(third_op, expr):
                 # 更新decay
                 settings["decay"] = decay
@@ -172,8 +177,9 @@ class Generator:
                     'settings': settings,
                     'regular': alpha
                 })
+                parent_sharpes.append(sharpe)
         # random.shuffle(sim_data_list)
-        return sim_data_list
+        return sim_data_list, parent_sharpes
     def handle_alphas(self, alphas: list, sharpe) -> list:
         """
         处理数据
@@ -242,5 +248,5 @@ class Generator:
                 num_dict[field] += 1
                 decay = rec[-2]
                 exp = rec[1]
-                output.append([exp,decay])
+                output.append([exp,decay,sharpe])
         return output
@@ -23,7 +23,12 @@ def main():
         if credentials == "":
             credentials = "~/.brain_credentials.txt"
 
-        wqbs= wqb.WQBSession((utils.load_credentials(credentials)), logger=wqb.wqb_logger(name='wqb_' + datetime.now().strftime('%Y%m%d')))
+        wqbs= wqb.WQBSession(
+            (utils.load_credentials(credentials)),
+            auth_cache='~/.brain_session.json',
+            response_cache=wqb.ResponseCache('./cache'),
+            logger=wqb.wqb_logger(name='wqb_' + datetime.now().strftime('%Y%m%d'))
+        )
 
         print("\n📋 请选择运行模式:")
         print("1: 生成Alpha")
@@ -33,9 +38,10 @@ def main():
         print("5: 自动提交")
         print("6: 生成数据集文件")
         print("7: 导出已提交的Alpha")
+        print("8: 回测守护进程")
 
-        mode = int(input("\n请选择模式 (1-5): "))
-        if mode not in [1, 2, 3, 4,5,6,7]:
+        mode = int(input("\n请选择模式 (1-8): "))
+        if mode not in [1, 2, 3, 4,5,6,7,8]:
             print("❌ 无效的模式选择")
             return
 
@@ -73,12 +79,23 @@ def main():
                 generator.generate_first_with_fields(fields)
 
         elif mode == 2:
-            concurrency = int(input("\n📋 请输入回测并发数: "))
-            if concurrency > 10:
-                print(f"❌ 并发数不能超过10")
-                concurrency = 10
-            simulator = Simulator(wqbs, concurrency)
-            simulator.simulate()
+            concurrency = int(input("\n📋 请输入回测最大并发数: "))
+            # 实际并发数在 1 与最大并发数之间, 根据 429/并发超限响应与延迟自动调整
+            fuse_sync = str(input("\n📋 回测完成后是否立即同步指标(y/N): ")).strip().lower() == "y"
+            dedupe = str(input("\n📋 回测前是否跳过平台上已回测过的alpha(y/N): ")).strip().lower() == "y"
+            simulate_rate = str(input(f"\n📋 请输入每秒最多提交的回测请求数(默认: {wqbs.rate_limiter.rates()[wqb.ENDPOINT_SIMULATE][0]}): ")).strip()
+            simulate_rate = float(simulate_rate) if simulate_rate else None
+            simulator = Simulator(wqbs, concurrency, adaptive=True, fuse_sync=fuse_sync, dedupe=dedupe, simulate_rate=simulate_rate)
+            simulator.simulate_stream()
+        elif mode == 8:
+            concurrency = int(input("\n📋 请输入回测最大并发数: "))
+            fuse_sync = str(input("\n📋 回测完成后是否立即同步指标(y/N): ")).strip().lower() == "y"
+            dedupe = str(input("\n📋 回测前是否跳过平台上已回测过的alpha(y/N): ")).strip().lower() == "y"
+            simulate_rate = str(input(f"\n📋 请输入每秒最多提交的回测请求数(默认: {wqbs.rate_limiter.rates()[wqb.ENDPOINT_SIMULATE][0]}): ")).strip()
+            simulate_rate = float(simulate_rate) if simulate_rate else None
+            # 持续回测新生成的alpha, kill -TERM 或 Ctrl+C 后等待进行中的回测完成再退出
+            simulator = Simulator(wqbs, concurrency, adaptive=True, fuse_sync=fuse_sync, dedupe=dedupe, simulate_rate=simulate_rate)
+            simulator.run_daemon()
         elif mode == 3:
             Synchronizer(wqbs).run()
         elif mode == 4:
@@ -135,6 +152,11 @@ def main():
 
     except Exception as e:
         print(f"❌ 程序运行出错: {str(e)}")
+    finally:
+        # 各接口耗时/重试/429 等指标, 便于分析时间花在哪里
+        metrics = wqb.get_metrics()
+        metrics.write('./results/metrics.json')
+        metrics.write('./results/metrics.prom')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+本地 BRAIN API 替身服务器: 在不消耗平台配额的情况下调试并发、轮询、限流等行为
+
+覆盖的接口:
+    POST /authentication                    登录
+    POST /simulations                       单个/多个(multi)回测, 返回 Location
+    GET  /simulations/{id}                  回测进度(Retry-After) / 结果 / 子回测
+    GET  /alphas/{id}, PATCH /alphas/{id}   alpha 详情(含 IS 指标与 checks) / 修改属性
+    GET  /alphas/{id}/check                 服务器检查(含 SELF_CORRELATION)
+    GET  /alphas/{id}/recordsets/pnl        PnL 数据
+    POST/GET /alphas/{id}/submit            提交
+    GET  /users/self/alphas                 分页查询 alpha
+    GET  /operators, /data-sets, /data-fields
+
+用法:
+    # 独立运行, 打印地址后供 wqbs.redirect(...) 使用
+    python mock_brain.py --port 8765 --sim-duration uniform:1,3 --latency lognormal:-2.5,0.5 --throttle 0.02
+
+    # 在代码中使用
+    with MockBrainServer(sim_duration='uniform:1,3') as server:
+        wqbs = wqb.WQBSession(('mock@example.com', 'mock'))
+        server.attach(wqbs)
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import wqb
+
+# 与真实平台一致的并发回测超限提示
+CONCURRENT_LIMIT_DETAIL = 'CONCURRENT_SIMULATION_LIMIT_EXCEEDED'
+
+# 预置 alpha 与未指定 settings 的回测使用的默认设置
+DEFAULT_SETTINGS = {
+    'instrumentType': 'EQUITY',
+    'region': 'USA',
+    'universe': 'TOP3000',
+    'delay': 1,
+    'decay': 0,
+    'neutralization': 'SUBINDUSTRY',
+    'truncation': 0.08,
+    'pasteurization': 'ON',
+    'unitHandling': 'VERIFY',
+    'nanHandling': 'OFF',
+    'language': 'FASTEXPR',
+    'visualization': False,
+}
+
+
+def _rng(*keys) -> random.Random:
+    """按 key 生成确定性的随机数发生器, 保证同一 alpha 每次返回相同数据"""
+    return random.Random(zlib.crc32('/'.join(map(str, keys)).encode('utf-8')))
+
+
+class MockBrainHandler(BaseHTTPRequestHandler):
+    """按路径分发请求, 所有状态保存在 MockBrainServer 上"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body=None, headers: dict = None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length > 0 else b''
+        return json.loads(raw) if raw else None
+
+    def _dispatch(self, method: str):
+        server: MockBrainServer = self.server
+        body = self._body()
+        time.sleep(server.latency.sample())
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip('/')
+        query = dict(parse_qsl(parts.query))
+        server.count(method, path)
+        if not path.startswith('/authentication') and server.down():
+            self._reply(503, {'detail': 'Service Unavailable'})
+            return
+        if not path.startswith('/authentication') and server.throttled():
+            self._reply(429, {'detail': 'Too many requests.'}, {wqb.RETRY_AFTER: f"{server.throttle_retry_after:g}"})
+            return
+        status, payload, headers = server.route(method, path, query, body)
+        self._reply(status, payload, headers)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class MockBrainServer(ThreadingHTTPServer):
+    """
+    BRAIN API 替身服务器
+
+    Args:
+        host, port: 监听地址, port=0 表示随机端口
+        latency: 每个请求的服务端延迟分布, 见 wqb.Latency.parse
+        sim_duration: 每个回测的耗时分布
+        retry_after: 轮询时返回的 Retry-After 上限(秒)
+        throttle: 随机注入 429 的概率
+        throttle_retry_after: 注入 429 时的 Retry-After(秒)
+        max_concurrent: 同时进行的回测上限, 超出返回 429 CONCURRENT_SIMULATION_LIMIT_EXCEEDED, 0 表示不限
+        fail_rate: 回测以 ERROR 结束的概率
+        lost_post_rate: 提交回测时已创建回测但返回 502 (响应丢失) 的概率
+        alphas: /users/self/alphas 中预置的 alpha 数量
+        pnl_days: PnL 数据的天数
+        seed: 随机种子
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        *,
+        latency='0',
+        sim_duration='1',
+        retry_after: float = 1.0,
+        throttle: float = 0.0,
+        throttle_retry_after: float = 1.0,
+        max_concurrent: int = 0,
+        fail_rate: float = 0.0,
+        lost_post_rate: float = 0.0,
+        alphas: int = 100,
+        pnl_days: int = 1260,
+        seed: int = None,
+    ):
+        super().__init__((host, port), MockBrainHandler)
+        self.latency = wqb.Latency.parse(latency, seed=seed)
+        self.sim_duration = wqb.Latency.parse(sim_duration, seed=seed)
+        self.retry_after = retry_after
+        self.throttle = throttle
+        self.throttle_retry_after = throttle_retry_after
+        self.max_concurrent = max_concurrent
+        self.fail_rate = fail_rate
+        self.lost_post_rate = lost_post_rate
+        self.pnl_days = pnl_days
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.sims = {}
+        self.alphas = {}
+        self.polls = {}
+        self.requests = {}
+        self.thread = None
+        self.down_until = 0.0
+        for idx in range(alphas):
+            self._new_alpha({'type': 'REGULAR', 'settings': dict(DEFAULT_SETTINGS), 'regular': f"rank(ts_delta(close, {idx + 1}))"})
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_port}"
+
+    def start(self) -> 'MockBrainServer':
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def attach(self, wqbs: wqb.WQBSession) -> wqb.WQBSession:
+        """把会话发往 BRAIN API 的请求改写到本服务器"""
+        wqbs.redirect(self.base_url)
+        return wqbs
+
+    def count(self, method: str, path: str):
+        key = f"{method} {path.split('/')[1] if '/' in path else path}"
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def outage(self, seconds: float):
+        """模拟平台故障: 接下来 seconds 秒内除登录外的请求都返回 503"""
+        with self.lock:
+            self.down_until = time.monotonic() + seconds
+
+    def down(self) -> bool:
+        with self.lock:
+            return time.monotonic() < self.down_until
+
+    def throttled(self) -> bool:
+        with self.lock:
+            return 0 < self.throttle and self.random.random() < self.throttle
+
+    # ---------------- 数据构造 ----------------
+
+    def _next_id(self, prefix: str) -> str:
+        return f"{prefix}{next(self.ids):06d}"
+
+    def _new_alpha(self, target: dict) -> str:
+        alpha_id = self._next_id('A')
+        rng = _rng(alpha_id)
+        sharpe = round(rng.gauss(0.8, 0.6), 2)
+        fitness = round(sharpe * rng.uniform(0.5, 1.2), 2)
+        turnover = round(rng.uniform(0.01, 0.8), 4)
+        checks = [
+            {'name': 'LOW_SHARPE', 'result': 'PASS' if sharpe >= 1.25 else 'FAIL', 'limit': 1.25, 'value': sharpe},
+            {'name': 'LOW_FITNESS', 'result': 'PASS' if fitness >= 1.0 else 'FAIL', 'limit': 1.0, 'value': fitness},
+            {'name': 'LOW_TURNOVER', 'result': 'PASS' if turnover >= 0.01 else 'FAIL', 'limit': 0.01, 'value': turnover},
+            {'name': 'HIGH_TURNOVER', 'result': 'PASS' if turnover <= 0.7 else 'FAIL', 'limit': 0.7, 'value': turnover},
+            {'name': 'SELF_CORRELATION', 'result': 'PENDING'},
+        ]
+        grade = 'INFERIOR' if sharpe < 1.0 else 'AVERAGE' if sharpe < 1.6 else 'GOOD'
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        regular = target.get('regular', '')
+        self.alphas[alpha_id] = {
+            'id': alpha_id,
+            'type': target.get('type', 'REGULAR'),
+            'author': 'MOCK',
+            'settings': DEFAULT_SETTINGS | (target.get('settings') or {}),
+            'regular': {'code': regular, 'description': None, 'operatorCount': regular.count('(')},
+            'dateCreated': now,
+            'dateSubmitted': None,
+            'dateModified': now,
+            'name': None,
+            'favorite': False,
+            'hidden': False,
+            'color': None,
+            'category': None,
+            'tags': [],
+            'classifications': [],
+            'grade': grade,
+            'stage': 'IS',
+            'status': 'UNSUBMITTED',
+            'is': {
+                'pnl': round(rng.uniform(-1e6, 5e6)),
+                'bookSize': 20000000,
+                'longCount': rng.randint(500, 1600),
+                'shortCount': rng.randint(500, 1600),
+                'turnover': turnover,
+                'returns': round(rng.uniform(-0.05, 0.25), 4),
+                'drawdown': round(rng.uniform(0.01, 0.3), 4),
+                'margin': round(rng.uniform(-0.0005, 0.002), 6),
+                'sharpe': sharpe,
+                'fitness': fitness,
+                'startDate': '2018-01-20',
+                'checks': checks,
+            },
+        }
+        return alpha_id
+
+    def _pnl(self, alpha_id: str) -> dict:
+        rng = _rng(alpha_id, 'pnl')
+        day = datetime.date(2018, 1, 20)
+        total = 0.0
+        records = []
+        while len(records) < self.pnl_days:
+            if day.weekday() < 5:
+                total += rng.gauss(200.0, 5000.0)
+                records.append([day.isoformat(), round(total, 2)])
+            day += datetime.timedelta(days=1)
+        return {
+            'schema': {
+                'name': 'pnl',
+                'title': 'PnL',
+                'properties': [
+                    {'name': 'date', 'title': 'Date', 'type': 'date'},
+                    {'name': 'pnl', 'title': 'PnL', 'type': 'amount'},
+                ],
+            },
+            'records': records,
+        }
+
+    # ---------------- 路由 ----------------
+
+    def route(self, method: str, path: str, query: dict, body):
+        segments = [item for item in path.split('/') if item]
+        if not segments:
+            return 404, {'detail': 'Not found.'}, None
+        head = segments[0]
+        if 'authentication' == head:
+            return self._authentication(method)
+        if 'simulations' == head:
+            if 'POST' == method and 1 == len(segments):
+                return self._post_simulation(body)
+            if 2 == len(segments):
+                return self._get_simulation(segments[1])
+        if 'alphas' == head and 2 <= len(segments):
+            return self._alpha(method, segments[1], segments[2:], body)
+        if ['users', 'self', 'alphas'] == segments:
+            self._finish_simulations()
+            return self._page(sorted(self.alphas.values(), key=lambda item: item['dateCreated']), query)
+        if 'operators' == head:
+            return 200, [{'name': name, 'category': 'Arithmetic'} for name in ('abs', 'add', 'rank', 'ts_delta', 'ts_mean')], None
+        if 'data-sets' == head:
+            return self._page([{'id': f"dataset{idx}", 'name': f"Dataset {idx}"} for idx in range(30)], query)
+        if 'data-fields' == head:
+            dataset = query.get('dataset.id', 'dataset0')
+            return self._page([{'id': f"{dataset}_field{idx}", 'type': 'MATRIX'} for idx in range(120)], query)
+        return 404, {'detail': 'Not found.'}, None
+
+    def _authentication(self, method: str):
+        if 'DELETE' == method:
+            return 204, None, None
+        body = {'user': {'id': 'MOCK'}, 'token': {'expiry': 14400.0}, 'permissions': ['MULTI_SIMULATION']}
+        headers = {'Set-Cookie': f"t=mock{next(self.ids)}; Path=/"}
+        return (201 if 'POST' == method else 200), body, headers
+
+    def _post_simulation(self, body):
+        targets = body if isinstance(body, list) else [body]
+        with self.lock:
+            now = time.time()
+            running = sum(1 for sim in self.sims.values() if sim['parent'] is None and sim['done_at'] > now)
+            if 0 < self.max_concurrent and running >= self.max_concurrent:
+                return 429, {'detail': CONCURRENT_LIMIT_DETAIL}, None
+            sim_id = self._next_id('S')
+            done_at = now + self.sim_duration.sample() * max(1.0, len(targets) ** 0.5)
+            children = []
+            for target in targets if isinstance(body, list) else []:
+                child_id = self._next_id('S')
+                self.sims[child_id] = {'target': target, 'parent': sim_id, 'done_at': done_at, 'children': [], 'alpha': None}
+                children.append(child_id)
+            self.sims[sim_id] = {
+                'target': targets[0] if not children else None,
+                'parent': None,
+                'started_at': now,
+                'done_at': done_at,
+                'children': children,
+                'alpha': None,
+                'failed': self.random.random() < self.fail_rate,
+            }
+            if self.random.random() < self.lost_post_rate:
+                return 502, {'detail': 'Bad Gateway'}, None
+        return 201, None, {wqb.LOCATION: f"{wqb.URL_SIMULATIONS}/{sim_id}"}
+
+    def _finish_simulations(self):
+        """与真实平台一样, 回测完成即产出 alpha, 不依赖是否有人轮询"""
+        with self.lock:
+            now = time.time()
+            for sim in self.sims.values():
+                parent = self.sims.get(sim['parent']) if sim['parent'] else sim
+                if sim['children'] or sim['alpha'] is not None or sim['done_at'] > now or parent.get('failed'):
+                    continue
+                sim['alpha'] = self._new_alpha(sim['target'] or {})
+
+    def _get_simulation(self, sim_id: str):
+        with self.lock:
+            sim = self.sims.get(sim_id)
+            if sim is None:
+                return 404, {'detail': 'Not found.'}, None
+            parent = self.sims.get(sim['parent']) if sim['parent'] else sim
+            now = time.time()
+            remaining = sim['done_at'] - now
+            if remaining > 0:
+                progress = (now - parent['started_at']) / max(1e-9, sim['done_at'] - parent['started_at'])
+                retry_after = min(self.retry_after, remaining)
+                return 200, {'progress': round(progress, 2)}, {wqb.RETRY_AFTER: f"{retry_after:.3f}"}
+            if parent.get('failed'):
+                return 200, {'id': sim_id, 'status': 'ERROR', 'message': 'Mock simulation error.'}, None
+            if sim['children']:
+                return 200, {'id': sim_id, 'type': 'REGULAR', 'status': 'COMPLETE', 'children': sim['children']}, None
+            if sim['alpha'] is None:
+                sim['alpha'] = self._new_alpha(sim['target'] or {})
+            target = sim['target'] or {}
+            return 200, {
+                'id': sim_id,
+                'type': target.get('type', 'REGULAR'),
+                'settings': target.get('settings', {}),
+                'regular': target.get('regular', ''),
+                'status': 'COMPLETE',
+                'alpha': sim['alpha'],
+            }, None
+
+    def _alpha(self, method: str, alpha_id: str, rest: list, body):
+        with self.lock:
+            alpha = self.alphas.get(alpha_id)
+            if alpha is None:
+                return 404, {'detail': 'Not found.'}, None
+            if not rest:
+                if 'PATCH' == method:
+                    alpha.update({key: value for key, value in (body or {}).items() if key in alpha})
+                return 200, alpha, None
+            key = (alpha_id, *rest, method)
+            polls = self.polls[key] = self.polls.get(key, 0) + 1
+        if ['check'] == rest:
+            if polls < 2:
+                return 200, None, {wqb.RETRY_AFTER: f"{self.retry_after:g}"}
+            checks = [dict(check) for check in alpha['is']['checks']]
+            for check in checks:
+                if 'SELF_CORRELATION' == check['name']:
+                    value = round(_rng(alpha_id, 'corr').uniform(0.1, 0.9), 4)
+                    check.update({'result': 'PASS' if value < 0.7 else 'FAIL', 'limit': 0.7, 'value': value})
+            return 200, {'is': {'checks': checks}}, None
+        if ['recordsets', 'pnl'] == rest:
+            if polls < 2:
+                return 200, None, {wqb.RETRY_AFTER: f"{min(self.retry_after, 0.1):g}"}
+            return 200, self._pnl(alpha_id), None
+        if ['submit'] == rest:
+            if 'POST' == method:
+                return 201, None, None
+            alpha['status'] = 'ACTIVE'
+            return 200, {'is': {'checks': alpha['is']['checks']}}, None
+        return 404, {'detail': 'Not found.'}, None
+
+    @staticmethod
+    def _page(items: list, query: dict):
+        limit = int(query.get('limit', 50))
+        offset = int(query.get('offset', 0))
+        return 200, {'count': len(items), 'next': None, 'previous': None, 'results': items[offset:offset + limit]}, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 BRAIN API 替身服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='0', help='请求延迟分布, 如 0.1 / uniform:0.05,0.2 / lognormal:-2.5,0.5')
+    parser.add_argument('--sim-duration', default='uniform:1,3', help='回测耗时分布')
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--throttle', type=float, default=0.0, help='随机注入 429 的概率')
+    parser.add_argument('--max-concurrent', type=int, default=0, help='并发回测上限, 0 表示不限')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--alphas', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockBrainServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        sim_duration=args.sim_duration,
+        retry_after=args.retry_after,
+        throttle=args.throttle,
+        max_concurrent=args.max_concurrent,
+        fail_rate=args.fail_rate,
+        alphas=args.alphas,
+        seed=args.seed,
+    )
+    print(f'替身服务器已启动: {server.base_url}, 使用 wqbs.redirect("{server.base_url}") 接入')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+import utils
+
+
+class PriorityScorer:
+    """
+    待回测 alpha 的优先级, 越大越先回测:
+        priority = step_weight * step
+                 + sharpe_weight * |parent_sharpe|
+                 + hit_weight * (数据集命中率 + 运算符命中率)
+    命中率为已同步指标的 alpha 中 |sharpe| 与 |fitness| 均达到阈值的比例,
+    以全局命中率为先验做平滑, 样本少的数据集/运算符接近全局水平
+    """
+
+    def __init__(
+            self
+            , step_weight:float=1.0
+            , sharpe_weight:float=1.0
+            , hit_weight:float=2.0
+            , sharpe:float=1.25
+            , fitness:float=1.0
+            , smoothing:int=20):
+        """
+        Args:
+            step_weight: 阶数权重
+            sharpe_weight: 父alpha sharpe 权重
+            hit_weight: 命中率权重
+            sharpe: 命中的 sharpe 阈值
+            fitness: 命中的 fitness 阈值
+            smoothing: 平滑样本数, 即先验相当于多少个样本
+        """
+        self.step_weight = step_weight
+        self.sharpe_weight = sharpe_weight
+        self.hit_weight = hit_weight
+        self.sharpe = sharpe
+        self.fitness = fitness
+        self.smoothing = smoothing
+        self.global_rate = 0.0
+        self.datasets = {}
+        self.operators = {}
+
+    @staticmethod
+    def operator(regular:str) -> str:
+        """表达式最外层运算符, 无运算符为空字符串"""
+        return utils.outer_operator(regular)
+
+    def refresh(self, alphas:list):
+        """
+        按已同步指标的 alpha 重新统计命中率
+        @param alphas: 包含 regular, field_prefix, sharpe, fitness 的数据
+        """
+        total = [0, 0]
+        datasets = defaultdict(lambda: [0, 0])
+        operators = defaultdict(lambda: [0, 0])
+        for alpha in alphas:
+            hit = int(abs(alpha['sharpe'] or 0) >= self.sharpe and abs(alpha['fitness'] or 0) >= self.fitness)
+            for stat in (total, datasets[alpha['field_prefix'] or ''], operators[self.operator(alpha['regular'])]):
+                stat[0] += hit
+                stat[1] += 1
+        self.global_rate = total[0] / total[1] if total[1] > 0 else 0.0
+        self.datasets = {key: self.rate(*stat) for key, stat in datasets.items()}
+        self.operators = {key: self.rate(*stat) for key, stat in operators.items()}
+
+    def rate(self, hits:int, count:int) -> float:
+        """以全局命中率为先验平滑后的命中率"""
+        return (hits + self.smoothing * self.global_rate) / (count + self.smoothing)
+
+    def score(self, alpha:dict) -> float:
+        """
+        计算优先级
+        @param alpha: 包含 step, parent_sharpe, field_prefix, regular 的数据
+        """
+        dataset_rate = self.datasets.get(alpha.get('field_prefix') or '', self.global_rate)
+        operator_rate = self.operators.get(self.operator(alpha.get('regular')), self.global_rate)
+        return round(
+            self.step_weight * (alpha.get('step') or 0)
+            + self.sharpe_weight * abs(alpha.get('parent_sharpe') or 0)
+            + self.hit_weight * (dataset_rate + operator_rate),
+            6,
+        )
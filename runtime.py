@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import utils
+
+# 回看窗口分档(交易日): 周、月、季、半年、年
+WINDOW_BUCKETS = (5, 22, 66, 126, 252)
+
+
+class RuntimePredictor:
+    """
+    回测耗时预测: 按历史回测耗时分层求平均, 从最具体的统计键依次回退:
+        同设置同表达式模板
+        -> 同设置、数据集、最外层运算符与回看窗口
+        -> 同设置、运算符与回看窗口
+        -> 同设置与运算符
+        -> 同设置
+        -> 全部
+    样本数不足 min_samples 的统计键不参与预测(全部除外), 无历史数据时预测为 0
+    """
+
+    def __init__(self, min_samples:int=3):
+        """
+        Args:
+            min_samples: 统计键参与预测所需的最少样本数
+        """
+        self.min_samples = max(1, min_samples)
+        self.stats = {}
+
+    @staticmethod
+    def settings_key(alpha:dict) -> tuple:
+        """设置统计键: 类型/区域/股票池/延迟"""
+        settings = alpha['settings']
+        if isinstance(settings, str):
+            settings = json.loads(settings.replace("'", '"'))
+        return (settings.get('instrumentType'), settings.get('region'), settings.get('universe'), settings.get('delay'))
+
+    @staticmethod
+    def window_bucket(regular:str) -> int:
+        """回看窗口所在分档的上限, 超过一年为 -1"""
+        window = utils.lookback_window(regular)
+        for bucket in WINDOW_BUCKETS:
+            if window <= bucket:
+                return bucket
+        return -1
+
+    def keys(self, alpha:dict) -> list:
+        """从最具体到最宽泛的统计键"""
+        settings_key = self.settings_key(alpha)
+        regular = alpha['regular']
+        operator = utils.outer_operator(regular)
+        window = self.window_bucket(regular)
+        return [
+            ('template', settings_key, utils.expression_template(regular)),
+            ('dataset', settings_key, alpha.get('field_prefix') or '', operator, window),
+            ('window', settings_key, operator, window),
+            ('operator', settings_key, operator),
+            ('settings', settings_key),
+            None,
+        ]
+
+    def learn(self, alpha:dict, duration:float):
+        """累计一个回测耗时(秒)"""
+        for key in self.keys(alpha):
+            stat = self.stats.setdefault(key, [0.0, 0])
+            stat[0] += duration
+            stat[1] += 1
+
+    def predict(self, alpha:dict) -> float:
+        """预测回测耗时(秒)"""
+        for key in self.keys(alpha):
+            stat = self.stats.get(key)
+            if stat and (stat[1] >= self.min_samples or key is None):
+                return stat[0] / stat[1]
+        return 0.0
+
+    def samples(self) -> int:
+        """已累计的回测耗时数量"""
+        stat = self.stats.get(None)
+        return stat[1] if stat else 0
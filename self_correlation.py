@@ -1,7 +1,6 @@
 import asyncio
 import pandas as pd
 import logging
-import time
 from typing import Optional, Tuple
 from typing import Tuple, Dict, List
 from typing import List, Tuple
@@ -52,28 +51,6 @@ class SelfCorrelation:
         with open(name + '.pickle', 'rb') as f:
             return pickle.load(f)
 
-    def _get_alpha_pnl(self, alpha_id: str) -> pd.DataFrame:
-        """
-        获取指定 alpha 的 PnL数据，并返回一个包含日期和 PnL 的 DataFrame。
-        此函数通过调用 WorldQuant Brain API 获取指定 alpha 的 PnL 数据，
-        并将其转换为 pandas DataFrame 格式，方便后续数据处理。
-        Args:
-            alpha_id (str): Alpha 的唯一标识符。
-        Returns:
-            pd.DataFrame: 包含日期和对应 PnL 数据的 DataFrame，列名为 'Date' 和 alpha_id。
-        """
-        # 可能会被限流
-        resp = self.wqbs.get(f"{wqb.WQB_API_URL}/alphas/{alpha_id}/recordsets/pnl")
-        retry_after = float(resp.headers.get(wqb.RETRY_AFTER, 0))
-        if retry_after > 0:
-            time.sleep(retry_after)
-            return self._get_alpha_pnl(alpha_id)
-
-        pnl = resp.json()
-        df = pd.DataFrame(pnl['records'], columns=[item['name'] for item in pnl['schema']['properties']])
-        df = df.rename(columns={'date':'Date', 'pnl':alpha_id})
-        df = df[['Date', alpha_id]]
-        return df
     def get_alpha_pnls(
         self,
         alphas: list[dict],
@@ -95,17 +72,34 @@ class SelfCorrelation:
             alpha_ids = defaultdict(list)
         if alpha_pnls is None:
             alpha_pnls = pd.DataFrame()
+        # 只保留有 PnL 数据的 id, 修复旧缓存中下载失败却已记录的 id
+        for region, ids in alpha_ids.items():
+            alpha_ids[region] = [alpha_id for alpha_id in dict.fromkeys(ids) if alpha_id in alpha_pnls.columns]
 
         new_alphas = [item for item in alphas if item['id'] not in alpha_pnls.columns]
         if not new_alphas:
             return alpha_ids, alpha_pnls
 
+        new_ids = [item['id'] for item in new_alphas]
+        # 线程数与 wqbs 连接池大小一致, 每个线程都能复用一个已建立的连接
+        # PnL 直接解码为 numpy 数组(日期为天数, pnl 为 float), 最后一次性对齐成矩阵
+        with ThreadPoolExecutor(max_workers=self.wqbs.pool_size) as executor:
+            results = executor.map(self.wqbs.get_alpha_pnl_arrays, new_ids)
+            pnls = {alpha_id: arrays for alpha_id, arrays in zip(new_ids, results) if arrays is not None}
+        # PnL 获取失败的 alpha 不记录 id, 下次下载时重试
         for item_alpha in new_alphas:
-            alpha_ids[item_alpha['settings']['region']].append(item_alpha['id'])
-        fetch_pnl_func = lambda alpha_id: self._get_alpha_pnl(alpha_id).set_index('Date')
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            results = executor.map(fetch_pnl_func, [item['id'] for item in new_alphas])
-        alpha_pnls = pd.concat([alpha_pnls] + list(results), axis=1)
+            region_ids = alpha_ids.setdefault(item_alpha['settings']['region'], [])
+            if item_alpha['id'] in pnls and item_alpha['id'] not in region_ids:
+                region_ids.append(item_alpha['id'])
+        if len(pnls) < len(new_ids):
+            print(f'{len(new_ids) - len(pnls)}个alpha的PnL获取失败, 已跳过...')
+        if not pnls:
+            return alpha_ids, alpha_pnls
+        days, columns, matrix = wqb.align_pnls(pnls)
+        # 索引保持 'YYYY-MM-DD' 字符串, 与已保存的 os_alpha_pnls 兼容
+        index = pd.Index(np.datetime_as_string(wqb.days_to_dates(days)), name='Date')
+        new_pnls = pd.DataFrame(matrix, index=index, columns=columns)
+        alpha_pnls = pd.concat([alpha_pnls, new_pnls], axis=1)
         alpha_pnls.sort_index(inplace=True)
         return alpha_ids, alpha_pnls
     # def get_os_alphas(self, limit: int = 100, get_first: bool = False) -> List[Dict]:
@@ -156,6 +150,8 @@ class SelfCorrelation:
         if alpha_pnls is None:
             _, alpha_pnls = self.get_alpha_pnls([alpha_result])
             # _, alpha_pnls = self.wqbs.get_alpha_pnls_bulk([alpha_result])
+            if alpha_id not in alpha_pnls.columns:
+                raise ValueError(f'获取alpha {alpha_id}的PnL失败')
             alpha_pnls = alpha_pnls[alpha_id]
         alpha_rets = alpha_pnls - alpha_pnls.ffill().shift(1)
         alpha_rets = alpha_rets[pd.to_datetime(alpha_rets.index)>pd.to_datetime(alpha_rets.index).max() - pd.DateOffset(years=4)]
@@ -200,7 +196,8 @@ class SelfCorrelation:
                 os_alpha_ids = self.load_obj(f'{self.data_path}/os_alpha_ids')
                 os_alpha_pnls = self.load_obj(f'{self.data_path}/os_alpha_pnls')
                 ppac_alpha_ids = self.load_obj(f'{self.data_path}/ppac_alpha_ids')
-                exist_alpha = [alpha for ids in os_alpha_ids.values() for alpha in ids]
+                # 只有已下载 PnL 的才算已存在, 之前获取失败的重新下载
+                exist_alpha = [alpha for ids in os_alpha_ids.values() for alpha in ids if alpha in os_alpha_pnls.columns]
             except Exception as e:
                 logging.error(f"Failed to load existing data: {e}")
                 os_alpha_ids = None
@@ -228,6 +225,8 @@ class SelfCorrelation:
         self.save_obj(os_alpha_pnls, f'{self.data_path}/os_alpha_pnls')
         self.save_obj(ppac_alpha_ids, f'{self.data_path}/ppac_alpha_ids')
         print(f'新下载的alpha数量: {len(alphas)}, 目前总共alpha数量: {os_alpha_pnls.shape[1]}')
+        stats = self.wqbs.pool_stats()
+        print(f"连接池: 请求{stats['requests']}次, 新建连接{stats['connections']}个, 复用率{stats['reuse_ratio']:.0%}")
     def load_data(self,tag=None):
         """
         加载数据。
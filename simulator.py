@@ -1,149 +1,721 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+from datetime import datetime, timedelta
 import json
+import os
+import signal
+import time
 
 from requests import Response
 import constants
 import utils
 import wqb
 from AlphaMapper import AlphaMapper
+from deduplicator import Deduplicator
+from runtime import RuntimePredictor
+from synchronizer import Synchronizer
+
+# 回测成功后的状态, fuse_sync 时直接为 SYNC
+SUCCESS_STATUSES = (constants.ALPHA_STATUS_SIMUATED, constants.ALPHA_STATUS_SYNC)
 
 class Simulator:
-    def __init__(self,  wqbs: wqb.WQBSession, concurrency: int = 8, db_path:str="./db"):
+    def __init__(self,  wqbs: wqb.WQBSession, concurrency: int = 8, db_path:str="./db", adaptive: bool = False, fuse_sync: bool = False, max_attempts: int = 3, retry_backoff: float = 600.0, dedupe: bool = False, simulate_rate: float | None = None):
         """
         Args:
             wqbs: wqb.WQBSession
-            concurrency: 并发数
+            concurrency: 并发数, adaptive 为 True 时为最大并发数
             batch_size: 批量回测的alpha数量, 即多少个回测完成后更新一次数据库
             db_path: 数据库路径
+            adaptive: 是否根据服务端反馈(429/并发超限/延迟)自适应调整并发数
+            fuse_sync: 是否在回测完成后立即获取 IS 指标并置为 SYNC, 省去同步指标阶段
+            max_attempts: 最多回测失败次数, 达到后置为 DISCARDED
+            retry_backoff: 首次失败后的重试间隔(秒), 之后每次失败翻倍
+            dedupe: 是否在回测前跳过平台上已回测过相同表达式与设置的 alpha, 参阅 deduplicator.py
+            simulate_rate: 每秒最多提交的回测请求数(一个多alpha回测算一次), None 时使用 wqb.RateLimiter.DEFAULT_RATES 的默认值(1次/秒),
+                与同一进程内的其他 WQBSession 共用
         """
         self.wqbs = wqbs
         self.concurrency = concurrency
+        self.fuse_sync = fuse_sync
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.controller = wqb.AdaptiveConcurrency(concurrency, logger=wqbs.logger) if adaptive else None
         self.batch_size = self.concurrency * 10
+        # 并发数 >= 3 时每 10 个打包为一个多alpha回测
+        self.multiple = 10 if self.concurrency >= 3 else 1
+        # 连接池至少容纳全部并发回测
+        self.wqbs.resize_pool(max(self.wqbs.pool_size, self.concurrency))
+        if simulate_rate is not None and self.wqbs.rate_limiter is not None:
+            # 允许突发提交一轮并发数的回测
+            self.wqbs.rate_limiter.configure({wqb.ENDPOINT_SIMULATE: (simulate_rate, max(simulate_rate, self.concurrency))})
+        # 所有进行中的回测由同一个调度器按 Retry-After 到期时间统一轮询
+        self.scheduler = wqb.PollScheduler(self.wqbs)
+        # 守护进程的退出信号
+        self.stop = None
         self.mapper = AlphaMapper(db_path)
+        # 提交记录: 提交时异常或 5xx 时不盲目重试, 核对平台上是否已创建后再重新提交
+        self.ledger = wqb.SimulationLedger(f'{db_path}/simulation_ledger.db')
+        # 提交结果未知且尚未核对出结果的 alpha, 暂不回测
+        self.ambiguous = set()
+        self.deduplicator = Deduplicator(wqbs, mapper=self.mapper) if dedupe else None
+        # 按历史回测耗时预测耗时, 用于多alpha回测打包与预计剩余时间
+        self.predictor = RuntimePredictor()
+        for alpha in self.mapper.get_sim_durations():
+            self.predictor.learn(alpha, alpha['sim_duration'])
+        if self.controller is not None and self.wqbs.metrics is not None:
+            self.wqbs.metrics.register_gauge('concurrency_limit', lambda: self.controller.current)
 
     def simulate(self):
-        """回测"""
+        """回测: 先继续轮询上次未完成的回测, 再按优先级从高到低分批回测 INIT alpha"""
+        self.prepare()
         count = self.mapper.count(f'status = "{constants.ALPHA_STATUS_INIT}"')
-        print(f'共有{count}个alpha待回测...')
-        page = 517
+        resuming = self.mapper.count(f'status = "{constants.ALPHA_STATUS_SIMULATING}"')
+        print(f'共有{count}个alpha待回测, {resuming}个回测中...')
+        stats = self.start_stats()
+        batch_num = 0
         success_count = 0
-        while True:
-            batch_num = page +1
-            alphas = self.mapper.get_alphas(page_size=self.batch_size, page=page)
+        for alphas in self.batches():
+            batch_num += 1
             total = len(alphas)
-            if total== 0:
-                break
-            print(f'第{batch_num}批次{total}个用{self.concurrency}并发回测...')
+            cost = sum(self.predictor.predict(alpha) for alpha in alphas)
+            if self.controller is None:
+                print(f'第{batch_num}批次{total}个用{self.concurrency}并发回测...')
+            else:
+                print(f'第{batch_num}批次{total}个用自适应并发回测, 当前并发{self.controller.current}/{self.concurrency}...')
             batch_success = self.do_simulate(alphas)
             success_count += batch_success
             print(f'第{batch_num}批次{total}个, ✅成功：{batch_success} 个，❌失败：{total-batch_success} 个...')
-            page += 1
-        print(f'同步结束,成功{success_count}个,失败{count-success_count}...')
-    
-    def do_simulate(self, alphas:list) -> int:
-        """回测
-        return: 
-            list of success alpha, list of failed alpha
+            stats['done'] += total
+            stats['success'] += batch_success
+            stats['predicted_done'] += cost
+            self.report(stats)
+            if self.controller is not None:
+                limit_stats = self.controller.stats()
+                print(f"自适应并发: 当前{limit_stats['limit']}, 上调{limit_stats['increases']}次, 下调{limit_stats['decreases']}次")
+        print(f'同步结束,成功{success_count}个,失败{count+resuming-success_count}...')
+
+    def prepare(self, refresh:bool=True):
+        """回测前: 跳过平台上已回测过的 alpha, 重新计算优先级
+        Args:
+            refresh: 是否先更新平台alpha索引
+        """
+        asyncio.run(self._prepare(refresh))
+
+    async def _prepare(self, refresh:bool=True):
+        # 守护进程每轮扫描前在事件循环内调用, 核对提交记录用 areconcile_simulation, 不阻塞进行中回测的轮询;
+        # refresh=False 时去重与重新计算优先级只读写本地数据库
+        await self._reconcile()
+        if self.deduplicator is not None:
+            self.deduplicator.run(refresh=refresh)
+        self.rescore()
+
+    def reconcile(self):
+        """核对提交记录: 结果未知的提交(提交时异常或 5xx)在平台上已有对应 alpha 的直接置为 SIMULATED,
+        超过 settle 时间仍没有的视为未提交, 其余暂不回测; 已不在回测中的提交记录删除
+        """
+        asyncio.run(self._reconcile())
+
+    async def _reconcile(self):
+        self.ambiguous = set()
+        updates = []
+        for entry in self.ledger.entries():
+            if wqb.SimulationLedger.LOCATED == entry['state']:
+                location_id = entry['location'].rstrip('/').rsplit('/', 1)[-1]
+                if self.mapper.count(f'location_id = "{location_id}" and status = "{constants.ALPHA_STATUS_SIMULATING}"') == 0:
+                    self.ledger.finish(entry['key'])
+                continue
+            if entry['payload'] is None:
+                self.ledger.finish(entry['key'])
+                continue
+            targets = entry['payload'] if isinstance(entry['payload'], list) else [entry['payload']]
+            hash_ids = [utils.hash(target) for target in targets]
+            if time.time() - entry['posted_at'] < 60:
+                # 可能是守护进程中正在提交的回测, 下一轮再核对
+                self.ambiguous.update(hash_ids)
+                continue
+            alpha_ids = await self.wqbs.areconcile_simulation(entry['payload'], entry['posted_at'])
+            if alpha_ids is not None:
+                updates.extend(self.to_reconciled(hash_ids, alpha_ids))
+                self.ledger.finish(entry['key'])
+            elif self.ledger.settled(entry):
+                self.ledger.finish(entry['key'])
+            else:
+                self.ambiguous.update(hash_ids)
+        self.mapper.bulk_update(updates)
+        if updates or self.ambiguous:
+            print(f'提交结果未知的alpha: {len(updates)}个平台上已回测, {len(self.ambiguous)}个暂不回测...')
+
+    def to_reconciled(self, hash_ids:list, alpha_ids:list) -> list:
+        """平台上已有提交结果未知的回测产出的 alpha, 直接置为 SIMULATED"""
+        return [
+            {'hash_id': hash_id, 'location_id': None, 'alpha_id': alpha_id, 'status': constants.ALPHA_STATUS_SIMUATED}
+            for hash_id, alpha_id in zip(hash_ids, alpha_ids)
+        ]
+
+    def rescore(self):
+        """按最新的数据集/运算符命中率重新计算待回测 alpha 的优先级"""
+        start = time.monotonic()
+        total = self.mapper.rescore()
+        print(f'重新计算{total}个alpha的回测优先级, 耗时{time.monotonic()-start:.2f}秒...')
+
+    def batches(self, exclude:set | None = None):
+        """依次产出回测中的 alpha (继续轮询, 不重新提交) 与按优先级游标分页的 INIT alpha
+        Args:
+            exclude: 跳过的 hash_id, 如守护进程中已在回测的 alpha; 提交结果未知的 alpha 总是跳过
         """
-        # 构造数据
-        alpha_list = []
-       
+        exclude = exclude or set()
+        skip = lambda alpha: alpha['hash_id'] in exclude or alpha['hash_id'] in self.ambiguous
+        # page_size=0 不限数量
+        resuming = [alpha for alpha in self.mapper.get_alphas_after(status=constants.ALPHA_STATUS_SIMULATING, page_size=0) if not skip(alpha)]
+        if len(resuming) > 0:
+            print(f'继续轮询{len(resuming)}个回测中的alpha...')
+            yield resuming
+        after = None
+        while True:
+            alphas = self.mapper.get_alphas_after(after, page_size=self.batch_size)
+            if len(alphas) == 0:
+                break
+            after = alphas[-1]
+            yield [alpha for alpha in alphas if not skip(alpha)]
+
+    def to_units(self, alphas:list) -> list:
+        """拆分为回测单元: 回测中的按 location_id 分组, 待回测的按设置与预测耗时每 self.multiple 个一组"""
+        resuming = {}
+        pending = []
         for alpha in alphas:
-            settings = alpha['settings'].replace("'", '"')
-            alpha_list.append({
-                'type': alpha['type'],
-                'settings': json.loads(settings),
-                'regular': alpha['regular']
-            })
+            if constants.ALPHA_STATUS_SIMULATING == alpha['status'] and alpha['location_id']:
+                resuming.setdefault(alpha['location_id'], []).append(alpha)
+            else:
+                pending.append(alpha)
+        # 同设置的打包在一起, 按预测耗时相近的分组, 耗时长的先回测
+        packs = wqb.pack_multi_alphas(
+            pending,
+            self.multiple,
+            key=self.predictor.settings_key,
+            cost=self.predictor.predict,
+        )
+        return [*resuming.values(), *packs]
 
-        success_count = 0
+    def simulate_stream(self, commit_size:int=50, commit_interval:float=10.0, report_interval:float=60.0):
+        """流式回测: 生产者先放入回测中的 alpha, 再按优先级游标读取 INIT alpha 放入有界队列, N 个 worker 持续回测, 消费者批量提交结果
+        Args:
+            commit_size: 累计多少条结果提交一次数据库
+            commit_interval: 最长多少秒提交一次数据库
+            report_interval: 每隔多少秒输出一次吞吐量
+        """
+        self.prepare()
+        count = self.mapper.count(f'status = "{constants.ALPHA_STATUS_INIT}"')
+        resuming = self.mapper.count(f'status = "{constants.ALPHA_STATUS_SIMULATING}"')
+        print(f'共有{count}个alpha待回测, {resuming}个回测中, 流式回测...')
+        stats = asyncio.run(self._stream(self.start_stats(), commit_size, commit_interval, report_interval))
+        self.report(stats)
+        print(f"同步结束,成功{stats['success']}个,失败{stats['done']-stats['success']}...")
 
-        if self.concurrency >= 3:
-            multi_alphas = wqb.to_multi_alphas(alpha_list, 10)
-            resps = asyncio.run(
-                self.wqbs.concurrent_simulate(
-                    multi_alphas,
-                    self.concurrency,
-                    return_exceptions=True,
-                    on_nolocation=lambda vars: print(vars['target'], vars['resp'], sep='\n'),
-                    on_start=lambda vars: print(vars['url']),
-                    # on_finish=lambda vars: print(vars['resp']),
-                    # on_success=lambda vars: print(vars['resp']),
-                    on_failure=lambda vars: print(vars['resp']),
-                    # tags=['MultiAlpha'],
-                    log=f'{self.__class__}#simulate'
-                )
+    def run_daemon(
+            self
+            , idle_interval:float=30.0
+            , health_path:str='./results/simulator_health.json'
+            , metrics_path:str='./results/metrics.prom'
+            , commit_size:int=50
+            , commit_interval:float=10.0
+            , report_interval:float=60.0):
+        """守护进程: 持续流式回测, 没有待回测 alpha 时每隔 idle_interval 秒检查一次新生成的 INIT alpha
+        收到 SIGTERM/SIGINT 后不再提交新回测, 等待进行中的回测完成并写入数据库后退出; 再次收到则立即退出,
+        未完成的回测已保存 location_id, 下次启动继续轮询
+        Args:
+            idle_interval: 没有待回测 alpha 时检查新 alpha 的间隔(秒)
+            health_path: 健康状态文件(JSON), 每隔 report_interval 秒及状态变化时更新
+            metrics_path: 接口指标文件, 以 .prom 结尾为 Prometheus 文本格式, 否则为 JSON, 为空不写
+            commit_size: 累计多少条结果提交一次数据库
+            commit_interval: 最长多少秒提交一次数据库
+            report_interval: 每隔多少秒输出一次吞吐量
+        """
+        self.prepare()
+        print(f'回测守护进程启动(pid={os.getpid()}), 每{idle_interval}秒检查新的alpha, 健康状态: {health_path}')
+        stats = self.start_stats()
+        try:
+            asyncio.run(self._daemon(stats, idle_interval, health_path, metrics_path, commit_size, commit_interval, report_interval))
+        except asyncio.CancelledError:
+            print('已立即退出, 未完成的回测下次启动继续轮询...')
+        # worker 均已结束, 立即退出时未完成的回测留待下次启动轮询, 均不算进行中
+        stats['state'] = 'stopped'
+        stats['in_flight'] = 0
+        stats['queued'] = 0
+        self.write_health(stats, health_path, metrics_path)
+        self.report(stats)
+        print(f"守护进程退出,成功{stats['success']}个,失败{stats['done']-stats['success']}...")
+
+    async def _daemon(self, stats:dict, idle_interval:float, health_path:str, metrics_path:str, commit_size:int, commit_interval:float, report_interval:float) -> dict:
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self.stop = asyncio.Event()
+
+        def on_signal():
+            if self.stop.is_set():
+                print('再次收到退出信号, 立即退出...')
+                task.cancel()
+            else:
+                print('收到退出信号, 不再提交新回测, 等待进行中的回测完成...')
+                self.stop.set()
+
+        signals = [signal.SIGINT, signal.SIGTERM]
+        for sig in signals:
+            try:
+                loop.add_signal_handler(sig, on_signal)
+            except (NotImplementedError, RuntimeError):
+                # Windows 不支持 add_signal_handler
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(on_signal))
+        try:
+            return await self._stream(
+                stats, commit_size, commit_interval, report_interval,
+                idle_interval=idle_interval, health_path=health_path, metrics_path=metrics_path,
             )
-            # index = 0
-            for idx, resp in enumerate(resps, start=0):
+        finally:
+            for sig in signals:
+                try:
+                    loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    signal.signal(sig, signal.SIG_DFL)
+            self.stop = None
+
+    def stopped(self) -> bool:
+        """守护进程是否已收到退出信号"""
+        return self.stop is not None and self.stop.is_set()
+
+    async def _stream(
+            self
+            , stats:dict
+            , commit_size:int
+            , commit_interval:float
+            , report_interval:float
+            , idle_interval:float | None = None
+            , health_path:str | None = None
+            , metrics_path:str | None = None) -> dict:
+        # 自适应时 worker 数为最大并发数, 实际并发由 controller 限制
+        workers = self.controller.max_limit if self.controller else self.concurrency
+        limiter = self.controller or asyncio.Semaphore(self.concurrency)
+        units = asyncio.Queue(maxsize=workers * 2)
+        results = asyncio.Queue()
+        # 已入队且结果尚未写入数据库的 alpha, 守护进程重新扫描时跳过, 避免重复提交
+        inflight = set()
+        stats['state'] = 'running'
+
+        def health():
+            if health_path:
+                stats['in_flight'] = len(inflight)
+                stats['queued'] = units.qsize()
+                self.write_health(stats, health_path, metrics_path)
+
+        async def produce():
+            passes = 0
+            while not self.stopped():
+                if passes > 0:
+                    # 新生成的 alpha 只与本地索引比对, 不重复请求平台
+                    await self._prepare(refresh=False)
+                    self.refresh_stats(stats)
+                passes += 1
+                queued = 0
+                for rows in self.batches(inflight):
+                    for unit in self.to_units(rows):
+                        if self.stopped():
+                            break
+                        inflight.update(row['hash_id'] for row in unit)
+                        await units.put((unit, time.monotonic()))
+                        queued += len(unit)
+                    if self.stopped():
+                        break
+                if idle_interval is None:
+                    break
+                if queued == 0 and not self.stopped():
+                    # 没有新的 alpha, 等待生成或收到退出信号
+                    stats['state'] = 'running' if inflight else 'idle'
+                    health()
+                    try:
+                        await asyncio.wait_for(self.stop.wait(), idle_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    stats['state'] = 'running'
+            if self.stopped():
+                stats['state'] = 'draining'
+                health()
+            for _ in range(workers):
+                await units.put(None)
+
+        async def work():
+            while (item := await units.get()) is not None:
+                unit, queued_at = item
+                if self.stopped() and constants.ALPHA_STATUS_SIMULATING != unit[0]['status']:
+                    # 已停止提交, 队列中未提交的保持 INIT
+                    await results.put((unit, None))
+                    continue
+                cost = sum(self.predictor.predict(row) for row in unit)
                 try:
-                    if resp and resp.status_code // 100 != 2:
-                        continue
-                    resp_json = json.loads(resp.text)
-                    children_ids = resp_json.get("children", [])
-                    if len(children_ids) == 0:
-                        continue
-            
-                    for index, child_id in enumerate(children_ids, start=0):
-                    # for child_id in children_ids:
-                        try:
-                            # 获取子模拟状态
-                            child_simulation_url = (
-                                f"{wqb.URL_SIMULATIONS}/{child_id}"  # 构建子模拟 URL
-                            )
-                            child_resp = asyncio.run(
-                                self.wqbs.retry(
-                                    wqb.GET, child_simulation_url, max_tries=range(60)
-                                )
-                            )
-                            # 获取子模拟状态
-                            if child_resp.status_code // 100 == 2:
-                                success_count += self.deal_resp(child_resp, alpha_list[idx*10+index])
-                        except Exception as e:
-                            print(f"child_resp异常{e}")
+                    updates = await self.simulate_unit(unit, limiter, queued_at)
                 except Exception as e:
-                    print(f"外层响应异常{e}")
-                        
-        else:
-            resps = asyncio.run(
-                self.wqbs.concurrent_simulate(
-                    alpha_list,
-                    self.concurrency,
-                    return_exceptions=True,
-                    on_nolocation=lambda vars: print(vars['target'], vars['resp'], sep='\n'),
-                    on_start=lambda vars: print(vars['url']),
-                    # on_finish=lambda vars: print(vars['resp']),
-                    # on_success=lambda vars: print(vars['resp']),
-                    on_failure=lambda vars: print(vars['resp']),
-                    # tags=['Alpha'],
-                    log=f'{self.__class__}#simulate'
-                )
-            )
-            for idx, resp in enumerate(resps, start=0):
-                success_count += self.deal_resp(resp, alpha_list[idx])
+                    print(f'回测异常{e}')
+                    updates = [None] * len(unit)
+                if self.stopped() and constants.ALPHA_STATUS_SIMULATING != unit[0]['status'] and not any(updates):
+                    # 等待并发名额时收到退出信号, 未提交
+                    await results.put((unit, None))
+                    continue
+                stats['predicted_done'] += cost
+                await results.put((unit, updates))
+
+        async def run_workers():
+            await asyncio.gather(*(work() for _ in range(workers)))
+            await results.put(None)
+
+        async def consume():
+            pending = []
+            committing = []
+            committed_at = reported_at = time.monotonic()
+            reported_done = stats['done']
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(results.get(), timeout=commit_interval)
+                    except asyncio.TimeoutError:
+                        item = (None, None)
+                    if item is None:
+                        break
+                    unit, updates = item
+                    if unit is not None:
+                        committing.extend(row['hash_id'] for row in unit)
+                    if updates is not None:
+                        stats['done'] += len(updates)
+                        for update in updates:
+                            if update is None:
+                                continue
+                            if update['status'] in SUCCESS_STATUSES:
+                                stats['success'] += 1
+                            pending.append(update)
+                    now = time.monotonic()
+                    if len(pending) >= commit_size or (pending and now - committed_at >= commit_interval):
+                        self.mapper.bulk_update(pending)
+                        pending = []
+                        committed_at = now
+                    if len(pending) == 0:
+                        inflight.difference_update(committing)
+                        committing = []
+                    if now - reported_at >= report_interval:
+                        # 守护进程空闲时不重复输出
+                        if idle_interval is None or stats['done'] != reported_done:
+                            self.report(stats)
+                            reported_done = stats['done']
+                        health()
+                        reported_at = now
+            finally:
+                self.mapper.bulk_update(pending)
+
+        health()
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce())
+            group.create_task(run_workers())
+            group.create_task(consume())
+        return stats
+
+    def write_health(self, stats:dict, health_path:str, metrics_path:str | None = None):
+        """写入健康状态文件(先写临时文件再替换), 并写入接口指标文件"""
+        elapsed = time.monotonic() - stats['started']
+        eta = self.eta(stats)
+        health = {
+            'pid': os.getpid(),
+            'state': stats.get('state'),
+            'updated_at': datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S'),
+            'uptime': round(elapsed, 3),
+            'done': stats['done'],
+            'success': stats['success'],
+            'pending': max(0, stats['total'] - stats['done']),
+            'in_flight': stats.get('in_flight', 0),
+            'queued': stats.get('queued', 0),
+            'throughput': round(stats['done'] / elapsed * 3600, 1) if elapsed > 0 else 0,
+            'eta': None if eta is None else round(eta),
+            'concurrency': self.controller.current if self.controller else self.concurrency,
+            'polls': self.scheduler.stats(),
+            'circuit': None if self.wqbs.circuit_breaker is None else self.wqbs.circuit_breaker.stats(),
+        }
+        directory = os.path.dirname(health_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{health_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(health, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, health_path)
+        if metrics_path and self.wqbs.metrics is not None:
+            self.wqbs.metrics.write(metrics_path)
+
+    async def simulate_unit(self, rows:list, limiter, queued_at:float | None = None) -> list:
+        """回测一组 alpha (1 个为单alpha回测, 多个为多alpha回测)
+        提交后立即保存 location_id 并置为 SIMULATING; 已是 SIMULATING 的一组按 location_id 继续轮询, 不重新提交
+        Args:
+            queued_at: 进入回测队列的时间(time.monotonic()), 默认为调用时间
+        return:
+            与 rows 一一对应的待更新数据, 无需更新为 None
+        """
+        posted = constants.ALPHA_STATUS_SIMULATING == rows[0]['status']
+        rejected = None
+        reconciled = None
+        timing = {
+            'queued_at': time.monotonic() if queued_at is None else queued_at,
+            'started_at': None,
+            'posted_at': None,
+            'polls': {},
+        }
+
+        def on_location(vars):
+            nonlocal posted
+            posted = True
+            timing['posted_at'] = time.monotonic()
+            self.save_location(rows, vars['url'])
+
+        def on_polled(entry):
+            timing['polls'][entry['url']] = entry['tries']
+
+        def on_nolocation(vars):
+            nonlocal rejected
+            rejected = vars['resp']
+            print(vars['target'], vars['resp'], sep='\n')
 
-        return success_count
+        def on_reconciled(vars):
+            nonlocal reconciled
+            reconciled = vars['alpha_ids']
 
-    def deal_resp(self, resp:Response, alpha:dict) -> int:
-        """处理回测结果"""
         try:
-            if resp.status_code // 100 != 2:
-                return
-            data = json.loads(resp.text)
-            hash_id = utils.hash(alpha)
-            print(f'{data['id']}回测成功:alpha_id={data["alpha"]}, hash_id={hash_id}')
-            self.mapper.updateByHashId(hash_id, {
-                'location_id':data['id']
-                , 'alpha_id':data['alpha']
-                , 'status':constants.ALPHA_STATUS_SIMUATED
-            })
-            return 1
+            async with limiter:
+                if not posted and self.stopped():
+                    return [None] * len(rows)
+                timing['started_at'] = time.monotonic()
+                if posted:
+                    resp = await self.scheduler.poll(f"{wqb.URL_SIMULATIONS}/{rows[0]['location_id']}", on_finish=on_polled)
+                else:
+                    targets = [self.to_target(row) for row in rows]
+                    resp = await self.wqbs.simulate(
+                        targets if len(targets) > 1 else targets[0],
+                        on_nolocation=on_nolocation,
+                        on_location=on_location,
+                        on_failure=lambda vars: print(vars['resp']),
+                        on_finish=on_polled,
+                        scheduler=self.scheduler,
+                        controller=self.controller,
+                        ledger=self.ledger,
+                        on_reconciled=on_reconciled,
+                        log=None,
+                    )
         except Exception as e:
-            print(f'回测 {alpha} 失败: {e}')
-            return 0
+            # 已提交的保持 SIMULATING 下次继续轮询, 提交结果未知的待核对, 未提交的记入失败台账
+            print(f'回测异常{e}')
+            if posted:
+                return [None] * len(rows)
+            if self.is_ambiguous(rows):
+                return [None] * len(rows)
+            return [self.to_retry(row, type(e).__name__) for row in rows]
+        if resp is None:
+            if reconciled is not None:
+                return await self.sync_metrics(self.to_reconciled([row['hash_id'] for row in rows], reconciled))
+            # 限流不计入失败次数
+            if rejected is not None and 429 == rejected.status_code:
+                return [None] * len(rows)
+            # 5xx 或上次提交结果未知且尚未核对出结果
+            if self.is_ambiguous(rows):
+                return [None] * len(rows)
+            if rejected is None:
+                return [None] * len(rows)
+            return [self.to_retry(row, f'HTTP {rejected.status_code}') for row in rows]
+        # 仍在回测中(轮询次数用尽)或平台故障(5xx 不说明回测结果), 保持 SIMULATING 下次继续轮询
+        if wqb.RETRY_AFTER in resp.headers or resp.status_code >= 500:
+            return [None] * len(rows)
+        if len(rows) == 1:
+            updates = [self.to_update(rows[0], resp)]
+            self.record_timing(rows, updates, timing)
+            return await self.sync_metrics(updates)
+        children_ids = resp.json().get('children', []) if resp.status_code // 100 == 2 else []
+        if len(children_ids) == 0:
+            return [self.to_update(row, resp) for row in rows]
+        child_urls = [f"{wqb.URL_SIMULATIONS}/{child_id}" for child_id in children_ids]
+        parent_polls = sum(timing['polls'].values())
+        child_resps = await self.scheduler.poll_many(
+            child_urls,
+            max_tries=range(60),
+            return_exceptions=True,
+            on_finish=on_polled,
+        )
+        # 同组的子回测按顺序对应, 需整组一起更新; 仍有子回测未完成或返回 5xx 时下次继续轮询父回测
+        if any(not isinstance(child_resp, BaseException) and child_resp is not None and (wqb.RETRY_AFTER in child_resp.headers or child_resp.status_code >= 500) for child_resp in child_resps):
+            return [None] * len(rows)
+        updates = []
+        for index, row in enumerate(rows):
+            child_resp = child_resps[index] if index < len(child_resps) else None
+            if isinstance(child_resp, BaseException):
+                print(f"child_resp异常{child_resp}")
+                updates.append(self.to_retry(row, type(child_resp).__name__))
+            elif child_resp is None:
+                updates.append(self.to_retry(row, 'NO_CHILD'))
+            else:
+                updates.append(self.to_update(row, child_resp))
+        timing['polls'] = [parent_polls + timing['polls'].get(url, 0) for url in child_urls]
+        self.record_timing(rows, updates, timing)
+        return await self.sync_metrics(updates)
 
+    def is_ambiguous(self, rows:list) -> bool:
+        """提交结果是否未知: 是则暂不回测, 下次 reconcile 时核对"""
+        targets = [self.to_target(row) for row in rows]
+        entry = self.ledger.get(self.ledger.key(targets if len(targets) > 1 else targets[0]))
+        if entry is None or wqb.SimulationLedger.POSTING != entry['state']:
+            return False
+        self.ambiguous.update(row['hash_id'] for row in rows)
+        return True
+
+    def record_timing(self, rows:list, updates:list, timing:dict):
+        """记录排队时间、提交耗时、轮询次数与提交到完成的回测耗时, 并用于预测回测耗时
+        继续轮询的回测无提交时间, 不记录
+        """
+        if timing['posted_at'] is None:
+            return
+        duration = round(time.monotonic() - timing['posted_at'], 3)
+        polls = timing['polls']
+        if isinstance(polls, dict):
+            polls = [sum(polls.values())] * len(rows)
+        for row, update, poll_count in zip(rows, updates, polls):
+            if update is not None and constants.ALPHA_STATUS_SIMUATED == update['status']:
+                update['queue_time'] = round(timing['started_at'] - timing['queued_at'], 3)
+                update['post_latency'] = round(timing['posted_at'] - timing['started_at'], 3)
+                update['poll_count'] = poll_count
+                update['sim_duration'] = duration
+                self.predictor.learn(row, duration)
+
+    async def sync_metrics(self, updates:list) -> list:
+        """fuse_sync 时并发获取已回测 alpha 的 IS 指标并置为 SYNC, 获取失败的保持 SIMULATED 留给同步指标阶段"""
+        if not self.fuse_sync:
+            return updates
+        simulated = [update for update in updates if update is not None and constants.ALPHA_STATUS_SIMUATED == update['status']]
+        resps = await asyncio.gather(
+            *(self.wqbs.locate_alpha(update['alpha_id'], log=None) for update in simulated),
+            return_exceptions=True,
+        )
+        for update, resp in zip(simulated, resps):
+            if isinstance(resp, BaseException) or resp is None or resp.status_code != 200:
+                print(f"同步 {update['alpha_id']} 失败: {resp}")
+                continue
+            try:
+                update |= Synchronizer.parse(resp.json())
+            except Exception as e:
+                print(f"同步 {update['alpha_id']} 失败: {e}")
+        return updates
+
+    def save_location(self, rows:list, url:str):
+        """提交成功后立即保存 location_id, 中断后可继续轮询而不必重新提交"""
+        location_id = url.rstrip('/').rsplit('/', 1)[-1]
+        self.mapper.bulk_update([
+            {'hash_id': row['hash_id'], 'location_id': location_id, 'status': constants.ALPHA_STATUS_SIMULATING}
+            for row in rows
+        ])
+
+    def to_target(self, alpha:dict) -> dict:
+        """数据库记录转换为回测数据"""
+        settings = alpha['settings'].replace("'", '"')
+        return {
+            'type': alpha['type'],
+            'settings': json.loads(settings),
+            'regular': alpha['regular']
+        }
+
+    def to_update(self, alpha:dict, resp:Response) -> dict:
+        """回测结果转换为待更新数据, 回测未产出 alpha 时记入失败台账"""
+        if resp.status_code // 100 != 2:
+            return self.to_retry(alpha, f'HTTP {resp.status_code}')
+        data = resp.json()
+        if not data.get('alpha'):
+            return self.to_retry(alpha, f"{data.get('status')}: {data.get('message', '')}")
+        return {
+            'hash_id': alpha['hash_id'],
+            'location_id': data['id'],
+            'alpha_id': data['alpha'],
+            'status': constants.ALPHA_STATUS_SIMUATED,
+        }
+
+    def to_retry(self, alpha:dict, error:str) -> dict:
+        """回测失败: 记录失败次数与原因, 按指数退避设置下次重试时间, 达到 max_attempts 次置为 DISCARDED"""
+        attempts = (alpha.get('attempts') or 0) + 1
+        update = {
+            'hash_id': alpha['hash_id'],
+            'location_id': None,
+            'attempts': attempts,
+            'last_error': error[:200],
+        }
+        if attempts >= self.max_attempts:
+            update['status'] = constants.ALPHA_STATUS_DISCARDED
+            update['next_retry_at'] = None
+        else:
+            retry_at = datetime.now() + timedelta(seconds=self.retry_backoff * 2 ** (attempts - 1))
+            update['status'] = constants.ALPHA_STATUS_INIT
+            update['next_retry_at'] = datetime.strftime(retry_at, '%Y-%m-%d %H:%M:%S')
+        print(f"{alpha['regular']}回测失败({attempts}/{self.max_attempts}): {update['last_error']}")
+        return update
+
+    def start_stats(self) -> dict:
+        """回测进度统计, predicted 为全部待回测与回测中 alpha 的预测耗时之和"""
+        stats = {
+            'started': time.monotonic(),
+            'done': 0,
+            'success': 0,
+            'predicted_done': 0.0,
+        }
+        self.refresh_stats(stats)
+        return stats
+
+    def refresh_stats(self, stats:dict):
+        """按数据库中待回测与回测中的 alpha 更新总数与预测耗时, 守护进程每轮扫描前调用"""
+        pending = self.mapper.get_pending_alphas()
+        stats['total'] = stats['done'] + len(pending)
+        stats['predicted'] = stats['predicted_done'] + sum(self.predictor.predict(alpha) for alpha in pending)
+
+    def eta(self, stats:dict) -> float | None:
+        """预计剩余时间(秒): 按预测耗时计算剩余工作量, 并以已完成部分的实际耗时校准并发与打包的影响; 无预测时按数量估算"""
+        remaining = stats['total'] - stats['done']
+        if remaining <= 0:
+            return 0.0
+        elapsed = time.monotonic() - stats['started']
+        if stats['predicted'] > 0 and stats['predicted_done'] > 0:
+            return max(0.0, stats['predicted'] - stats['predicted_done']) * elapsed / stats['predicted_done']
+        if stats['done'] > 0:
+            return remaining * elapsed / stats['done']
+        if stats['predicted'] > 0:
+            return stats['predicted'] / (self.concurrency * self.multiple)
+        return None
+
+    def report(self, stats:dict):
+        """输出吞吐量与预计剩余时间"""
+        elapsed = time.monotonic() - stats['started']
+        rate = stats['done'] / elapsed * 3600 if elapsed > 0 else 0
+        message = f"已回测{stats['done']}个, 成功{stats['success']}个, 耗时{elapsed:.0f}s, 吞吐量{rate:.0f} alphas/小时"
+        if self.controller is not None:
+            message += f", 当前并发{self.controller.current}/{self.concurrency}"
+        eta = self.eta(stats)
+        if eta is not None:
+            message += f", 预计剩余{timedelta(seconds=round(eta))}"
+        print(message)
+
+    def do_simulate(self, alphas:list) -> int:
+        """回测一批 alpha: 所有回测及多alpha回测的子回测在同一个事件循环内并发完成, 结果一次性批量更新
+        return:
+            成功数量
+        """
+        updates = [update for update in asyncio.run(self._simulate_batch(alphas)) if update is not None]
+        self.mapper.bulk_update(updates)
+        return sum(1 for update in updates if update['status'] in SUCCESS_STATUSES)
 
-            
-           
\ No newline at end of file
+    async def _simulate_batch(self, alphas:list) -> list:
+        limiter = self.controller or asyncio.Semaphore(self.concurrency)
+        units = self.to_units(alphas)
+        results = await asyncio.gather(
+            *(self.simulate_unit(unit, limiter) for unit in units),
+            return_exceptions=True,
+        )
+        updates = []
+        for unit, result in zip(units, results):
+            if isinstance(result, BaseException):
+                print(f'回测异常{result}')
+                result = [None] * len(unit)
+            updates.extend(result)
+        return updates
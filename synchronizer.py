@@ -46,28 +46,34 @@ class Synchronizer:
             if resp is None or (hasattr(resp, 'status_code') and resp.status_code != 200):
                 print(f'同步 {alpha['alpha_id']} 失败: {resp}')
                 return 1
-            data = resp.json()
-            is_data = data['is']
-            err = ''.join([f"{check['name']}:{check['result']}" for check in is_data['checks'] if check['result'] != 'PASS'])
-            grade = ''
-            if data['grade'] is not None:
-                grade = data['grade']
-           
-            update_alpha = {
-                'status': constants.ALPHA_STATUS_SYNC
-                , constants.IS_FITNESS: is_data[constants.IS_FITNESS]
-                , constants.IS_DRAWDOWN: is_data[constants.IS_DRAWDOWN]
-                , constants.IS_LONGCOUNT: is_data[constants.IS_LONGCOUNT]
-                , constants.IS_SHARPE: is_data[constants.IS_SHARPE]
-                , constants.IS_SHORTCOUNT: is_data[constants.IS_SHORTCOUNT]
-                , constants.IS_MARGIN: is_data[constants.IS_MARGIN]
-                , constants.IS_TURNOVER: is_data[constants.IS_TURNOVER]
-                , constants.IS_RETURNS: is_data[constants.IS_RETURNS]
-                , 'grade':grade
-                , 'description':err
-            }
+            update_alpha = self.parse(resp.json())
             self.mapper.updateById(alpha['id'], update_alpha)
             return 0
         except Exception as e:
             print(f'同步 {alpha_id} 失败: {e}')
-            return 1
\ No newline at end of file
+            return 1
+
+    @staticmethod
+    def parse(data:dict) -> dict:
+        """
+        alpha 详情转换为待更新的 IS 指标数据, 状态置为 SYNC
+        """
+        is_data = data['is']
+        err = ''.join([f"{check['name']}:{check['result']}" for check in is_data['checks'] if check['result'] != 'PASS'])
+        grade = ''
+        if data['grade'] is not None:
+            grade = data['grade']
+
+        return {
+            'status': constants.ALPHA_STATUS_SYNC
+            , constants.IS_FITNESS: is_data[constants.IS_FITNESS]
+            , constants.IS_DRAWDOWN: is_data[constants.IS_DRAWDOWN]
+            , constants.IS_LONGCOUNT: is_data[constants.IS_LONGCOUNT]
+            , constants.IS_SHARPE: is_data[constants.IS_SHARPE]
+            , constants.IS_SHORTCOUNT: is_data[constants.IS_SHORTCOUNT]
+            , constants.IS_MARGIN: is_data[constants.IS_MARGIN]
+            , constants.IS_TURNOVER: is_data[constants.IS_TURNOVER]
+            , constants.IS_RETURNS: is_data[constants.IS_RETURNS]
+            , 'grade':grade
+            , 'description':err
+        }
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from self_correlation import SelfCorrelation
+
+
+class FakeSession:
+    """替身会话: alphas 为 OS alpha 列表, failed 中的 alpha 获取 PnL 时返回 None 模拟下载失败"""
+
+    pool_size = 2
+
+    def __init__(self, alphas, failed=()):
+        self.alphas = alphas
+        self.failed = set(failed)
+
+    def get_os_alphas(self, limit=100, get_first=False):
+        return self.alphas
+
+    def get_alpha_pnl_arrays(self, alpha_id):
+        if alpha_id in self.failed:
+            return None
+        days = np.arange(19000, 19030, dtype=np.int32)
+        rng = np.random.default_rng(sum(map(ord, alpha_id)))
+        return days, np.cumsum(rng.normal(size=len(days)))
+
+    def pool_stats(self):
+        return {'requests': 0, 'connections': 0, 'reuse_ratio': 0.0}
+
+
+def alpha(alpha_id, region='USA'):
+    return {'id': alpha_id, 'settings': {'region': region}, 'classifications': []}
+
+
+ALPHAS = [alpha('a'), alpha('b'), alpha('c', 'CHN')]
+
+
+def test_failed_download_is_not_cached(tmp_path):
+    correlation = SelfCorrelation(FakeSession(ALPHAS, failed={'b'}), data_path=str(tmp_path))
+    os_alpha_ids, os_alpha_rets = correlation.load_data()
+    assert dict(os_alpha_ids) == {'USA': ['a'], 'CHN': ['c']}
+    assert sorted(os_alpha_rets.columns) == ['a', 'c']
+
+
+def test_failed_download_is_retried_next_run(tmp_path):
+    SelfCorrelation(FakeSession(ALPHAS, failed={'b'}), data_path=str(tmp_path))
+    correlation = SelfCorrelation(FakeSession(ALPHAS), data_path=str(tmp_path))
+    os_alpha_ids, os_alpha_rets = correlation.load_data()
+    assert os_alpha_ids['USA'] == ['a', 'b']
+    assert sorted(os_alpha_rets.columns) == ['a', 'b', 'c']
+
+
+def test_stale_ids_are_pruned(tmp_path):
+    correlation = SelfCorrelation(FakeSession(ALPHAS[:1]), data_path=str(tmp_path))
+    alpha_ids, alpha_pnls = correlation.load_obj(f'{tmp_path}/os_alpha_ids'), correlation.load_obj(f'{tmp_path}/os_alpha_pnls')
+    # 旧版本缓存: 下载失败的 id 已记录(且重复), 但没有 PnL 列
+    alpha_ids['USA'] += ['b', 'b']
+    correlation.wqbs = FakeSession([], failed={'b'})
+    alpha_ids, alpha_pnls = correlation.get_alpha_pnls([alpha('b')], alpha_pnls=alpha_pnls, alpha_ids=alpha_ids)
+    assert alpha_ids['USA'] == ['a']
+    assert list(alpha_pnls.columns) == ['a']
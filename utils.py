@@ -2,6 +2,7 @@
 import hashlib
 import json
 from os.path import expanduser
+import re
 
 from collections import defaultdict
 import time
@@ -24,45 +25,37 @@ def filter_alphas(
     others: Iterable[str] = None,
     limit: int = 2000,
     log_name: str = None,
+    concurrency: int = 4,
 ) -> list:
-    """获取alpha列表"""
+    """获取alpha列表, 按 concurrency 并发翻页"""
     if log_name is None:
-        log_name = f"{self.__class__.__name__}#{filter_alphas.__name__}"
-    
+        log_name = f"utils#{filter_alphas.__name__}"
+
     list = []
     page_size = 100
-    offset = 0
-    while True:
-        
-        resp = wqbs.filter_alphas_limited(
-            status=status,
-            region=region,
-            delay=delay,
-            universe=universe,
-            sharpe=sharpeFilterRange,
-            fitness=fitnessFilterRange,
-            turnover=turnoverFilterRange,
-            date_created=dateCreatedFilterRange,
-            order=order,
-            others=others,
-            limit=page_size,
-            offset=offset,
-            log=log_name
-        )
-        
+    resps = wqbs.filter_alphas(
+        status=status,
+        region=region,
+        delay=delay,
+        universe=universe,
+        sharpe=sharpeFilterRange,
+        fitness=fitnessFilterRange,
+        turnover=turnoverFilterRange,
+        date_created=dateCreatedFilterRange,
+        order=order,
+        others=others,
+        limit=page_size,
+        max_count=limit,
+        concurrency=concurrency,
+        log=log_name
+    )
+    for idx, resp in enumerate(resps):
         data = resp.json()
-        if not data:
-            print(f"没有符合条件的数据...")
-            break
-        if offset == 0 and data != {}:
+        if idx == 0:
             print(f"本次查询条件下共有{data['count']}条数据...")
         list.extend(data['results'])
-        if len(list) >= limit:
-            break
-        # 小于本次查询数量limit
-        if len(data['results']) < page_size:
-            break
-        offset += page_size
+    if not list:
+        print(f"没有符合条件的数据...")
     return list
 
 def submitable_alphas(wqbs: wqb.WQBSession, start_time:str, end_time:str, limit:int = 50, order:str='dateCreated', others:Iterable[str]=None) -> list:
@@ -167,6 +160,47 @@ def hash(simulation_data:dict) -> str:
     param_kv_str = ''.join(parts)
     return hashlib.md5(param_kv_str.encode('utf-8')).hexdigest()
 
+def expression_template(regular: str) -> str:
+    """表达式模板: 数据字段替换为 $, 保留运算符、参数名与数值, 用于按表达式结构统计回测耗时"""
+    return re.sub(
+        r'\b[A-Za-z_][A-Za-z0-9_.]*\b(?!\s*[(=])',
+        lambda m: m.group(0) if m.group(0) in ('true', 'false', 'nan') else '$',
+        regular or '',
+    )
+
+# 影响回测结果的设置, 用于计算表达式签名
+SIGNATURE_SETTINGS = (
+    'instrumentType', 'region', 'universe', 'delay', 'decay', 'neutralization',
+    'truncation', 'pasteurization', 'unitHandling', 'nanHandling', 'language',
+)
+
+def signature(regular: str, settings) -> str:
+    """表达式签名: 去掉空白的表达式与影响回测结果的设置, 与 payload 格式无关, 用于识别平台上已回测过的alpha
+    Args:
+        regular: 表达式
+        settings: 设置, dict 或 JSON 字符串
+    """
+    if isinstance(settings, str):
+        # 数据库中 settings 的双引号保存为单引号
+        settings = json.loads(settings.replace("'", '"'))
+    parts = [re.sub(r'\s+', '', regular or '')]
+    parts.extend(f"{key}={settings.get(key)}" for key in SIGNATURE_SETTINGS)
+    return hashlib.md5('&'.join(parts).encode('utf-8')).hexdigest()
+
+# 表达式最外层运算符
+OPERATOR_PATTERN = re.compile(r'^[\s\-]*([A-Za-z_][A-Za-z0-9_]*)\s*\(')
+# 作为参数的整数, 如 ts_rank(x, 20) 中的 20
+WINDOW_PATTERN = re.compile(r'[(,]\s*(\d+)\s*(?=[,)])')
+
+def outer_operator(regular: str) -> str:
+    """表达式最外层运算符, 无运算符为空字符串"""
+    match = OPERATOR_PATTERN.match(regular or '')
+    return match.group(1) if match else ''
+
+def lookback_window(regular: str) -> int:
+    """表达式中最大的回看窗口(整数参数), 无窗口为 0"""
+    return max((int(window) for window in WINDOW_PATTERN.findall(regular or '')), default=0)
+
 def save_lines_to_file(dest_file: str, lines: list):
     """保存内容到文件"""
     with open(dest_file, 'a') as f:
@@ -200,10 +234,11 @@ def get_dataset_fields(
     delay: int=1, 
     universe: str="TOP3000",
     order:str='-alphaCount',
-    offset:int=0
+    offset:int=0,
+    concurrency:int=4
 ) -> list:
     """
-    获取数据集的字段
+    获取数据集的字段, 按 concurrency 并发翻页
     """
 
     dataset_fields = []
@@ -215,6 +250,7 @@ def get_dataset_fields(
         dataset_id=dataset_id,
         offset=offset,
         log="utils#get_dataset_fields",
+        concurrency=concurrency,
         **kwargs
     )
     for idx, resp in enumerate(resps, start=1):
@@ -225,14 +261,15 @@ def get_dataset_fields(
 
 def get_pnl_data(wqbs: wqb.WQBSession, alpha_id: str) -> pd.DataFrame:
     """获取alpha的pnl数据"""
-    # 可能会被限流
-    resp = wqbs.get(f"{wqb.WQB_API_URL}/alphas/{alpha_id}/recordsets/pnl")
-    retry_after = float(resp.headers.get(wqb.RETRY_AFTER, 0))
-    if retry_after > 0:
+    # 429 由 wqbs.rate_limiter 统一冷却, 这里只等待数据就绪
+    while True:
+        resp = wqbs.get(f"{wqb.WQB_API_URL}/alphas/{alpha_id}/recordsets/pnl")
+        retry_after = float(resp.headers.get(wqb.RETRY_AFTER, 0))
+        if retry_after <= 0:
+            break
         time.sleep(retry_after)
-        return get_pnl_data(wqbs, alpha_id)
 
-    return resp.json()
+    return wqb.loads(resp.content)
 
 def sort_by_grade(alpha_first: dict, alpha_second: dict) -> int:
     """根据alpha的grade排序"""
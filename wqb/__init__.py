@@ -53,23 +53,59 @@ class Null:
 NULL = Null()
 
 
+from . import adaptive_concurrency
 from . import auto_auth_session
+from . import circuit_breaker
+from . import connection_pool
 from . import datetime_range
+from . import endpoints
+from . import fast_json
 from . import filter_range
+from . import idempotency
+from . import lanes
+from . import metrics
+from . import poll_scheduler
+from . import rate_limiter
+from . import response_cache
+from . import transport
 from . import wqb_session
 from . import wqb_urls
 
 __all__ = (
-    auto_auth_session.__all__
+    adaptive_concurrency.__all__
+    + auto_auth_session.__all__
+    + circuit_breaker.__all__
+    + connection_pool.__all__
     + datetime_range.__all__
+    + endpoints.__all__
+    + fast_json.__all__
     + filter_range.__all__
+    + idempotency.__all__
+    + lanes.__all__
+    + metrics.__all__
+    + poll_scheduler.__all__
+    + rate_limiter.__all__
+    + response_cache.__all__
+    + transport.__all__
     + wqb_session.__all__
     + wqb_urls.__all__
 )
 
 
+from .adaptive_concurrency import *
 from .auto_auth_session import *
+from .circuit_breaker import *
+from .connection_pool import *
 from .datetime_range import *
+from .endpoints import *
+from .fast_json import *
 from .filter_range import *
+from .idempotency import *
+from .lanes import *
+from .metrics import *
+from .poll_scheduler import *
+from .rate_limiter import *
+from .response_cache import *
+from .transport import *
 from .wqb_session import *
 from .wqb_urls import *
@@ -0,0 +1,239 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+from requests import Response
+
+__all__ = ['AdaptiveConcurrency']
+
+
+class AdaptiveConcurrency:
+    """
+    An AIMD (additive increase, multiplicative decrease) concurrency
+    limit that can replace an `asyncio.Semaphore` object in
+    `concurrent_await` and `WQBSession.concurrent_simulate`.
+
+    The limit grows by `increase` per `limit` successful responses while
+    their latency stays within `latency_tolerance` times the baseline,
+    and shrinks by `decrease` on 429 or concurrent simulation limit
+    responses, at most once per `decrease_interval` seconds.
+    """
+
+    LIMIT_MARKERS = ('CONCURRENT_SIMULATION_LIMIT',)
+
+    def __init__(
+        self,
+        max_limit: int = 10,
+        *,
+        initial: int | None = None,
+        min_limit: int = 1,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        decrease_interval: float = 5.0,
+        logger: logging.Logger = logging.root,
+    ) -> None:
+        """
+        Initializes an `AdaptiveConcurrency` object.
+
+        Parameters
+        ----------
+        max_limit: int = 10
+            The upper bound of the limit.
+        initial: int | None = None
+            The initial limit. If *None*, half of `max_limit` is used.
+        min_limit: int = 1
+            The lower bound of the limit.
+        increase: float = 1.0
+            The growth of the limit per round of `limit` successful
+            responses.
+        decrease: float = 0.5
+            The factor the limit is multiplied by on a limit response.
+        latency_tolerance: float = 2.0
+            Successful responses slower than `latency_tolerance` times
+            the baseline latency do not raise the limit.
+        decrease_interval: float = 5.0
+            The minimum number of seconds between two decreases, so that
+            a burst of limit responses counts once.
+        logger: logging.Logger = logging.root
+            The `logging.Logger` object to log limit changes.
+
+        Returns
+        -------
+        None
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        if initial is None:
+            initial = self.max_limit // 2
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.increase = max(0.0, increase)
+        self.decrease = min(1.0, max(0.0, decrease))
+        self.latency_tolerance = max(1.0, latency_tolerance)
+        self.decrease_interval = max(0.0, decrease_interval)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.baseline = None
+        self.decreased_at = float('-inf')
+        self.increases = 0
+        self.decreases = 0
+        self.loop = None
+        self.in_use = 0
+        self.waiters = collections.deque()
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<AdaptiveConcurrency [{self.current}/{self.max_limit}]>"
+
+    @property
+    def current(
+        self,
+    ) -> int:
+        """
+        The current concurrency limit.
+        """
+        return int(self.limit)
+
+    @property
+    def _value(
+        self,
+    ) -> int:
+        # The free slots, named after `asyncio.Semaphore._value` for the
+        # logs of `concurrent_simulate` and `concurrent_check`.
+        return max(0, self.current - self.in_use)
+
+    def _bind(
+        self,
+    ) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.in_use = 0
+            self.waiters.clear()
+        return loop
+
+    def _dispatch(
+        self,
+    ) -> None:
+        while self.waiters and self.in_use < self.current:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_use += 1
+                waiter.set_result(None)
+
+    async def acquire(
+        self,
+    ) -> None:
+        """
+        Waits until the number of holders is below the current limit.
+        """
+        loop = self._bind()
+        if not self.waiters and self.in_use < self.current:
+            self.in_use += 1
+            return
+        waiter = loop.create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(
+        self,
+    ) -> None:
+        """
+        Releases a slot taken by `acquire`.
+        """
+        self.in_use = max(0, self.in_use - 1)
+        self._dispatch()
+
+    async def __aenter__(
+        self,
+    ) -> None:
+        await self.acquire()
+
+    async def __aexit__(
+        self,
+        *exc_info,
+    ) -> None:
+        self.release()
+
+    def is_limited(
+        self,
+        resp: Response,
+    ) -> bool:
+        """
+        Returns whether `resp` says the server is at its concurrency
+        limit.
+        """
+        if 429 == resp.status_code:
+            return True
+        if resp.status_code < 400:
+            return False
+        return any(marker in resp.text for marker in self.LIMIT_MARKERS)
+
+    def observe(
+        self,
+        resp: Response,
+        *args,
+        **kwargs,
+    ) -> None:
+        """
+        Feeds a `Response` object of `POST /simulations` back. It can be
+        used as a `requests` response hook, and it is thread-safe.
+
+        Parameters
+        ----------
+        resp: Response
+            The `Response` object.
+
+        Returns
+        -------
+        None
+        """
+        now = time.monotonic()
+        elapsed = resp.elapsed.total_seconds()
+        with self.lock:
+            before = self.current
+            if self.is_limited(resp):
+                if self.decrease_interval <= now - self.decreased_at:
+                    self.decreased_at = now
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self.decreases += 1
+            elif resp.ok:
+                if self.baseline is None:
+                    self.baseline = elapsed
+                stable = elapsed <= self.latency_tolerance * self.baseline
+                self.baseline = 0.9 * self.baseline + 0.1 * elapsed
+                if stable and self.limit < self.max_limit:
+                    self.limit = min(
+                        self.max_limit, self.limit + self.increase / self.limit
+                    )
+                    if before < self.current:
+                        self.increases += 1
+            after = self.current
+        if after != before:
+            self.logger.info(f"{self}.observe(...) [{before} -> {after}]")
+            loop = self.loop
+            if after > before and loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self._dispatch)
+
+    def stats(
+        self,
+    ) -> dict[str, int | float | None]:
+        """
+        Returns the current limit, the slots in use, the numbers of
+        increases and decreases and the baseline latency.
+        """
+        return {
+            'limit': self.current,
+            'max_limit': self.max_limit,
+            'in_use': self.in_use,
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'baseline_latency': self.baseline,
+        }
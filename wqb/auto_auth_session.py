@@ -1,8 +1,20 @@
+import asyncio
+import functools
+import json
 import logging
+import os
+import threading
 import time
-from collections.abc import Callable
+from collections.abc import Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
 from requests import Response, Session
 
+from .circuit_breaker import CircuitBreaker
+from .lanes import RequestLanes
+from .metrics import Metrics
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+
 __all__ = ['AutoAuthSession']
 
 
@@ -16,9 +28,20 @@ class AutoAuthSession(Session):
         auth_expected: Callable[[Response], bool] = lambda _: True,
         auth_max_tries: int = 3,
         auth_delay_unexpected: float = 2.0,
+        auth_expiry: Callable[[Response], float | None] = lambda _: None,
+        auth_refresh_margin: float = 300.0,
+        auth_refresh_backoff: float = 60.0,
+        auth_cache: str | None = None,
+        auth_cache_key: str = '',
         expected: Callable[[Response], bool] = lambda _: True,
         max_tries: int = 3,
         delay_unexpected: float = 2.0,
+        async_workers: int = 16,
+        rate_limiter: RateLimiter | None = None,
+        lanes: RequestLanes | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        response_cache: ResponseCache | None = None,
+        metrics: Metrics | None = None,
         logger: logging.Logger = logging.root,
         **kwargs,
     ) -> None:
@@ -29,10 +52,25 @@ class AutoAuthSession(Session):
         self.auth_expected = auth_expected
         self.auth_max_tries = auth_max_tries
         self.auth_delay_unexpected = auth_delay_unexpected
+        self.auth_expiry = auth_expiry
+        self.auth_refresh_margin = max(0.0, auth_refresh_margin)
+        self.auth_refresh_backoff = max(0.0, auth_refresh_backoff)
+        self.auth_lock = threading.Lock()
+        self.auth_generation = 0
+        self.auth_expires_at = None
+        self.auth_cache = None if auth_cache is None else os.path.expanduser(auth_cache)
+        self.auth_cache_key = auth_cache_key
         self.expected = expected
         self.max_tries = max(1, max_tries)
         self.delay_unexpected = max(0.0, delay_unexpected)
+        self.async_workers = max(1, async_workers)
+        self.rate_limiter = rate_limiter
+        self.lanes = lanes
+        self.circuit_breaker = circuit_breaker
+        self.response_cache = response_cache
+        self.metrics = metrics
         self.logger = logger
+        self._executor = None
 
     def __repr__(
         self,
@@ -47,6 +85,76 @@ class AutoAuthSession(Session):
         """
         return f"<AutoAuthSession []>"
 
+    @property
+    def executor(
+        self,
+    ) -> ThreadPoolExecutor:
+        """
+        The `ThreadPoolExecutor` object that runs `arequest` calls. It is
+        created lazily with `async_workers` threads.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.async_workers,
+                thread_name_prefix='AutoAuthSession',
+            )
+        return self._executor
+
+    def close(
+        self,
+    ) -> None:
+        """
+        Closes the session and shuts down `executor` if it was created.
+
+        Returns
+        -------
+        None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        super().close()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        *args,
+        **kwargs,
+    ) -> Response:
+        """
+        Sends a single request with `Session.request`, holding a slot of
+        `lanes` and recording it in `metrics` if set.
+        """
+        if self.lanes is None:
+            return self._send_tracked(method, url, *args, **kwargs)
+        lane, waited = self.lanes.acquire(method, url)
+        try:
+            if self.metrics is not None and 0.0 < waited:
+                self.metrics.increment('lane_waits', method, url)
+            return self._send_tracked(method, url, *args, **kwargs)
+        finally:
+            self.lanes.release(lane)
+
+    def _send_tracked(
+        self,
+        method: str,
+        url: str,
+        *args,
+        **kwargs,
+    ) -> Response:
+        if self.metrics is None:
+            return super().request(method, url, *args, **kwargs)
+        with self.metrics.track(method, url):
+            start = time.monotonic()
+            try:
+                resp = super().request(method, url, *args, **kwargs)
+            except Exception as e:
+                self.metrics.observe_error(method, url, e)
+                raise
+        self.metrics.observe(method, url, resp, time.monotonic() - start)
+        return resp
+
     def auth_request(
         self,
         method: str | None = None,
@@ -72,8 +180,14 @@ class AutoAuthSession(Session):
         max_tries = max(1, max_tries)
         delay_unexpected = max(0.0, delay_unexpected)
         for tries in range(1, 1 + max_tries):
-            resp = super().request(method, url, *args, **kwargs)
+            resp = self._send(method, url, *args, **kwargs)
             if expected(resp):
+                expires_in = self.auth_expiry(resp)
+                self.auth_expires_at = (
+                    None if expires_in is None else time.monotonic() + expires_in
+                )
+                if self.auth_cache is not None:
+                    self.save_auth_cache()
                 break
             time.sleep(delay_unexpected)
         else:
@@ -96,10 +210,163 @@ class AutoAuthSession(Session):
                     )
                 )
             )
+        self.auth_generation += 1
         if log is not None:
             self.logger.info(f"{self}.auth_request(...) [{tries} tries]: {log}")
         return resp
 
+    def save_auth_cache(
+        self,
+    ) -> None:
+        """
+        Writes the session cookies and the token expiry to `auth_cache`.
+
+        The file is created with mode 0o600 and replaced atomically, so a
+        concurrent reader never sees a partial file.
+
+        Returns
+        -------
+        None
+        """
+        expires_at = None
+        if self.auth_expires_at is not None:
+            expires_at = time.time() + self.auth_expires_at - time.monotonic()
+        data = {
+            'key': self.auth_cache_key,
+            'expires_at': expires_at,
+            'cookies': [
+                {
+                    'name': cookie.name,
+                    'value': cookie.value,
+                    'domain': cookie.domain,
+                    'path': cookie.path,
+                    'expires': cookie.expires,
+                    'secure': cookie.secure,
+                }
+                for cookie in self.cookies
+            ],
+        }
+        directory = os.path.dirname(self.auth_cache)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.auth_cache}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.auth_cache)
+        except OSError as e:
+            self.logger.warning(f"{self}.save_auth_cache(...) [{self.auth_cache}]: {e}")
+
+    def load_auth_cache(
+        self,
+    ) -> bool:
+        """
+        Restores the session cookies from `auth_cache`.
+
+        The cache is skipped if it belongs to another `auth_cache_key`,
+        or if it expires within `auth_refresh_margin` seconds. A restored
+        session is validated lazily: the first request that comes back
+        unexpected (e.g. 401) logs in again and rewrites the cache.
+
+        Returns
+        -------
+        bool
+            *True* if the cookies were restored, otherwise *False*.
+        """
+        if self.auth_cache is None:
+            return False
+        try:
+            with open(self.auth_cache, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('key') != self.auth_cache_key:
+            return False
+        expires_at = data.get('expires_at')
+        if expires_at is not None:
+            expires_in = expires_at - time.time()
+            if expires_in <= self.auth_refresh_margin:
+                return False
+            self.auth_expires_at = time.monotonic() + expires_in
+        for cookie in data.get('cookies', []):
+            self.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie['domain'],
+                path=cookie['path'],
+                expires=cookie['expires'],
+                secure=cookie['secure'],
+            )
+        self.auth_generation += 1
+        self.logger.info(f"{self}.load_auth_cache(...) [{self.auth_cache}]: restored")
+        return True
+
+    def auth_expired(
+        self,
+    ) -> bool:
+        """
+        Returns whether the authentication expires within
+        `auth_refresh_margin` seconds.
+
+        Returns
+        -------
+        bool
+            *True* if the expiry is known and close, otherwise *False*.
+        """
+        return (
+            self.auth_expires_at is not None
+            and self.auth_expires_at - self.auth_refresh_margin <= time.monotonic()
+        )
+
+    def reauthenticate(
+        self,
+        generation: int | None = None,
+    ) -> Response | None:
+        """
+        Calls `auth_request` once on behalf of every concurrent caller.
+
+        Callers that observed the same `auth_generation` share a single
+        login: the first one sends it while holding `auth_lock`, and the
+        others return as soon as they see that the generation moved on.
+
+        If the login fails or raises while the expiry is known, the
+        proactive refresh of `auth_expired` is put off for
+        `auth_refresh_backoff` seconds, so that every request during an
+        authentication outage does not log in again. Requests rejected
+        with 401 still log in right away.
+
+        Parameters
+        ----------
+        generation: int | None = None
+            The `auth_generation` the caller observed before its failed
+            request. If *None*, the login is sent unconditionally.
+
+        Returns
+        -------
+        Response | None
+            The `Response` object of the login, or *None* if another
+            caller already logged in.
+        """
+        with self.auth_lock:
+            if generation is not None and generation != self.auth_generation:
+                return None
+            resp = None
+            try:
+                resp = self.auth_request()
+            finally:
+                if self.auth_expires_at is not None and (
+                    resp is None or not self.auth_expected(resp)
+                ):
+                    self.auth_expires_at = max(
+                        self.auth_expires_at,
+                        time.monotonic()
+                        + self.auth_refresh_margin
+                        + self.auth_refresh_backoff,
+                    )
+            return resp
+
     def request(
         self,
         method: str,
@@ -119,12 +386,56 @@ class AutoAuthSession(Session):
             delay_unexpected = self.delay_unexpected
         max_tries = max(1, max_tries)
         delay_unexpected = max(0.0, delay_unexpected)
+        cache = self.response_cache if 'GET' == method.upper() else None
+        if cache is not None:
+            cached, validators = cache.lookup(url, kwargs.get('params'))
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.increment('cache_hits', method, url)
+                if log is not None:
+                    self.logger.info(f"{self}.request(...) [cached]: {log}")
+                return cached
+            if validators:
+                kwargs['headers'] = (kwargs.get('headers') or {}) | validators
+        if self.auth_expired():
+            self.reauthenticate(self.auth_generation)
         for tries in range(1, 1 + max_tries):
-            resp = super().request(method, url, *args, **kwargs)
+            generation = self.auth_generation
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.acquire()
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(method, url)
+                resp = self._send(method, url, *args, **kwargs)
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.observe_error(e)
+                raise
+            except BaseException:
+                # Interrupted or cancelled: no outcome, but a probe must
+                # not keep every other caller waiting.
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.release()
+                raise
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.observe(resp)
+            if self.rate_limiter is not None:
+                self.rate_limiter.observe(resp)
             if expected(resp):
                 break
+            if self.metrics is not None and tries < max_tries:
+                self.metrics.retry(
+                    method,
+                    url,
+                    str(resp.status_code) if resp.status_code in (401, 429) else 'unexpected',
+                )
+            if 429 == resp.status_code:
+                # Throttling is not an authentication problem.
+                if self.rate_limiter is None:
+                    time.sleep(delay_unexpected)
+                continue
             time.sleep(delay_unexpected)
-            auth_resp = self.auth_request()
+            auth_resp = self.reauthenticate(generation)
         else:
             self.logger.warning(
                 '\n'.join(
@@ -145,6 +456,43 @@ class AutoAuthSession(Session):
                     )
                 )
             )
+        if cache is not None:
+            resp = cache.store(url, kwargs.get('params'), resp)
         if log is not None:
             self.logger.info(f"{self}.request(...) [{tries} tries]: {log}")
         return resp
+
+    async def arequest(
+        self,
+        method: str,
+        url: str,
+        *args,
+        **kwargs,
+    ) -> Coroutine[None, None, Response]:
+        """
+        Returns a `Coroutine` object that runs `request` on `executor`,
+        so that the event loop is free while waiting on the network.
+
+        Parameters
+        ----------
+        method: str
+            The HTTP method.
+        url: str
+            The URL.
+
+        Returns
+        -------
+        Coroutine[None, None, Response]
+            A `Coroutine` object that returns a `Response` object.
+
+        Notes
+        -----
+        `args` and `kwargs` are passed to `request`, therefore `expected`,
+        `max_tries`, `delay_unexpected` and re-authentication behave
+        exactly as in the blocking call.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(self.request, method, url, *args, **kwargs),
+        )
@@ -0,0 +1,305 @@
+import collections
+import logging
+import threading
+import time
+from requests import Response
+
+__all__ = [
+    'CIRCUIT_CLOSED',
+    'CIRCUIT_OPEN',
+    'CIRCUIT_HALF_OPEN',
+    'CircuitBreaker',
+    'get_circuit_breaker',
+]
+
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    A process-wide circuit breaker that pauses every caller while the
+    platform is degraded.
+
+    Responses with a 5xx status and requests that raised (timeouts,
+    connection errors) count as failures. Once at least `min_requests`
+    outcomes were seen within the last `window` seconds and the share of
+    failures reaches `failure_rate`, the circuit opens: `acquire` blocks
+    every caller for `open_for` seconds. Then a single caller is let
+    through as a probe while the others keep waiting. A successful probe
+    closes the circuit, a failed one opens it again for twice as long,
+    up to `max_open_for` seconds. A probe that is given up with `release`
+    or has no outcome within `probe_timeout` seconds is handed to the
+    next caller.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_rate: float = 0.5,
+        min_requests: int = 10,
+        window: float = 60.0,
+        open_for: float = 15.0,
+        max_open_for: float = 300.0,
+        probe_timeout: float = 300.0,
+        logger: logging.Logger = logging.root,
+    ) -> None:
+        """
+        Initializes a `CircuitBreaker` object.
+
+        Parameters
+        ----------
+        failure_rate: float = 0.5
+            The share of failures within `window` that opens the
+            circuit.
+        min_requests: int = 10
+            The minimum number of outcomes within `window` before the
+            circuit may open, so that a few unlucky requests do not.
+        window: float = 60.0
+            The number of seconds of outcomes taken into account.
+        open_for: float = 15.0
+            The pause before the first probe.
+        max_open_for: float = 300.0
+            The upper bound of the pause, which doubles on every failed
+            probe.
+        probe_timeout: float = 300.0
+            The number of seconds after which a probe without an outcome
+            is handed to the next caller, e.g. because its thread died.
+        logger: logging.Logger = logging.root
+            The `logging.Logger` object to log state changes.
+
+        Returns
+        -------
+        None
+        """
+        self.failure_rate = min(1.0, max(0.0, failure_rate))
+        self.min_requests = max(1, min_requests)
+        self.window = max(0.0, window)
+        self.open_for = max(0.0, open_for)
+        self.max_open_for = max(self.open_for, max_open_for)
+        self.probe_timeout = max(0.0, probe_timeout)
+        self.logger = logger
+        self.cond = threading.Condition()
+        self.outcomes = collections.deque()
+        self.failures = 0
+        self.state = CIRCUIT_CLOSED
+        self.pause = self.open_for
+        self.opened_until = 0.0
+        self.prober = None
+        self.probe_deadline = 0.0
+        self.opens = 0
+        self.probes = 0
+        self.blocked = 0
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<CircuitBreaker [{self.state}]>"
+
+    def _expire(
+        self,
+        now: float,
+    ) -> None:
+        while self.outcomes and self.outcomes[0][0] < now - self.window:
+            _, failed = self.outcomes.popleft()
+            self.failures -= failed
+
+    def _open(
+        self,
+        now: float,
+        reason: str,
+    ) -> None:
+        self.state = CIRCUIT_OPEN
+        self.opened_until = now + self.pause
+        self.opens += 1
+        self.outcomes.clear()
+        self.failures = 0
+        self.logger.warning(
+            f"{self}._open(...) [{reason}]: pausing all callers for {self.pause:.1f}s"
+        )
+
+    def acquire(
+        self,
+    ) -> float:
+        """
+        Blocks while the circuit is open, or while another caller is
+        probing it.
+
+        Returns
+        -------
+        float
+            The number of seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self.cond:
+            if CIRCUIT_CLOSED == self.state:
+                return 0.0
+            self.blocked += 1
+            while True:
+                now = time.monotonic()
+                if CIRCUIT_CLOSED == self.state:
+                    break
+                if CIRCUIT_HALF_OPEN == self.state and self.probe_deadline <= now:
+                    self.logger.warning(
+                        f"{self}.acquire(...) [probe timed out]: probing again"
+                    )
+                    self._give_up_probe(now)
+                if CIRCUIT_OPEN == self.state and self.opened_until <= now:
+                    # This caller sends the probe.
+                    self.state = CIRCUIT_HALF_OPEN
+                    self.prober = threading.get_ident()
+                    self.probe_deadline = now + self.probe_timeout
+                    self.probes += 1
+                    break
+                if CIRCUIT_OPEN == self.state:
+                    timeout = self.opened_until - now
+                else:
+                    timeout = self.probe_deadline - now
+                self.cond.wait(timeout)
+        return time.monotonic() - start
+
+    def record(
+        self,
+        failed: bool,
+    ) -> None:
+        """
+        Records the outcome of a request sent after `acquire`, from the
+        thread that sent it.
+
+        Parameters
+        ----------
+        failed: bool
+            Whether the request failed.
+
+        Returns
+        -------
+        None
+        """
+        now = time.monotonic()
+        with self.cond:
+            if CIRCUIT_HALF_OPEN == self.state:
+                if threading.get_ident() != self.prober:
+                    # Sent before the circuit opened.
+                    return
+                self.prober = None
+                if failed:
+                    self.pause = min(self.max_open_for, 2.0 * self.pause)
+                    self._open(now, 'probe failed')
+                else:
+                    self.state = CIRCUIT_CLOSED
+                    self.pause = self.open_for
+                    self.logger.info(f"{self}.record(...) [probe succeeded]: resuming")
+                self.cond.notify_all()
+                return
+            if CIRCUIT_OPEN == self.state:
+                # Sent before the circuit opened.
+                return
+            self.outcomes.append((now, failed))
+            self.failures += failed
+            self._expire(now)
+            total = len(self.outcomes)
+            if self.min_requests <= total and self.failure_rate <= self.failures / total:
+                self._open(now, f"{self.failures}/{total} failed")
+
+    def release(
+        self,
+    ) -> None:
+        """
+        Gives up the probe taken by `acquire` without an outcome, from
+        the thread that took it, e.g. because the request was interrupted
+        or cancelled, so that the next caller sends the probe instead of
+        everyone waiting on it. Does nothing for other callers.
+        """
+        with self.cond:
+            if CIRCUIT_HALF_OPEN == self.state and threading.get_ident() == self.prober:
+                self._give_up_probe(time.monotonic())
+
+    def _give_up_probe(
+        self,
+        now: float,
+    ) -> None:
+        self.state = CIRCUIT_OPEN
+        self.opened_until = now
+        self.prober = None
+        self.cond.notify_all()
+
+    def retry_in(
+        self,
+    ) -> float:
+        """
+        Returns the number of seconds until the next probe, *0.0* unless
+        the circuit is open.
+        """
+        with self.cond:
+            return self._retry_in(time.monotonic())
+
+    def _retry_in(
+        self,
+        now: float,
+    ) -> float:
+        if CIRCUIT_OPEN != self.state:
+            return 0.0
+        return round(max(0.0, self.opened_until - now), 3)
+
+    def observe(
+        self,
+        resp: Response,
+    ) -> None:
+        """
+        Feeds a `Response` object back. A 5xx status counts as a
+        failure.
+        """
+        self.record(500 <= resp.status_code)
+
+    def observe_error(
+        self,
+        error: BaseException,
+    ) -> None:
+        """
+        Records a request that raised `error` instead of returning.
+        """
+        self.record(True)
+
+    def stats(
+        self,
+    ) -> dict[str, str | int | float]:
+        """
+        Returns the state, the seconds left until the next probe, the
+        failures and outcomes within `window`, and the numbers of opens,
+        probes and blocked callers.
+        """
+        with self.cond:
+            now = time.monotonic()
+            self._expire(now)
+            return {
+                'state': self.state,
+                'retry_in': self._retry_in(now),
+                'failures': self.failures,
+                'requests': len(self.outcomes),
+                'opens': self.opens,
+                'probes': self.probes,
+                'blocked': self.blocked,
+            }
+
+
+_circuit_breaker = None
+_circuit_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """
+    Returns the process-wide `CircuitBreaker` object, creating it on
+    first use.
+
+    Returns
+    -------
+    CircuitBreaker
+        The process-wide `CircuitBreaker` object.
+    """
+    global _circuit_breaker
+    with _circuit_breaker_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker()
+        return _circuit_breaker
@@ -0,0 +1,132 @@
+import threading
+from requests.adapters import HTTPAdapter
+
+__all__ = ['PooledHTTPAdapter']
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    An `HTTPAdapter` whose per-host connection pool is sized to the
+    configured concurrency and blocks instead of discarding connections
+    when every connection is busy.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        *,
+        pool_hosts: int = 8,
+        **kwargs,
+    ) -> None:
+        """
+        Initializes a `PooledHTTPAdapter` object.
+
+        Parameters
+        ----------
+        pool_size: int = 10
+            The maximum number of connections kept per host.
+        pool_hosts: int = 8
+            The maximum number of hosts whose pools are kept.
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        `kwargs` are passed to `HTTPAdapter.__init__`.
+        """
+        self.pool_size = max(1, pool_size)
+        self.stats_lock = threading.Lock()
+        self.retired = {'connections': 0, 'requests': 0}
+        kwargs.setdefault('pool_block', True)
+        super().__init__(
+            pool_connections=max(1, pool_hosts),
+            pool_maxsize=self.pool_size,
+            **kwargs,
+        )
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<PooledHTTPAdapter [{self.pool_size}]>"
+
+    def init_poolmanager(
+        self,
+        *args,
+        **kwargs,
+    ) -> None:
+        """
+        Creates the pool manager and keeps the counters of pools that get
+        evicted from it.
+        """
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        dispose_func = pools.dispose_func
+
+        def retire(pool) -> None:
+            with self.stats_lock:
+                self.retired['connections'] += pool.num_connections
+                self.retired['requests'] += pool.num_requests
+            if dispose_func is not None:
+                dispose_func(pool)
+
+        pools.dispose_func = retire
+
+    def resize(
+        self,
+        pool_size: int,
+    ) -> None:
+        """
+        Replaces the pool manager with one of `pool_size` connections per
+        host, keeping the counters of the old pools.
+
+        Parameters
+        ----------
+        pool_size: int
+            The maximum number of connections kept per host.
+
+        Returns
+        -------
+        None
+        """
+        pool_size = max(1, pool_size)
+        if pool_size == self.pool_size:
+            return
+        old = self.poolmanager
+        self.pool_size = pool_size
+        self._pool_maxsize = pool_size
+        self.init_poolmanager(self._pool_connections, pool_size, block=self._pool_block)
+        old.clear()
+
+    def stats(
+        self,
+    ) -> dict[str, int | float]:
+        """
+        Returns the connection reuse counters of the adapter.
+
+        Returns
+        -------
+        dict[str, int | float]
+            `pool_size`, `connections` (new connections, i.e. TCP/TLS
+            handshakes), `requests`, `reused` (requests served by an
+            existing connection) and `reuse_ratio`.
+        """
+        with self.stats_lock:
+            connections = self.retired['connections']
+            requests = self.retired['requests']
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests += pool.num_requests
+        reused = max(0, requests - connections)
+        return {
+            'pool_size': self.pool_size,
+            'connections': connections,
+            'requests': requests,
+            'reused': reused,
+            'reuse_ratio': reused / requests if 0 < requests else 0.0,
+        }
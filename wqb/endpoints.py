@@ -0,0 +1,97 @@
+from urllib.parse import urlsplit
+
+__all__ = [
+    'ENDPOINT_AUTH',
+    'ENDPOINT_SIMULATE',
+    'ENDPOINT_POLL',
+    'ENDPOINT_CHECK',
+    'ENDPOINT_SUBMIT',
+    'ENDPOINT_READ',
+    'endpoint_class',
+    'endpoint_template',
+]
+
+
+ENDPOINT_AUTH = 'auth'
+ENDPOINT_SIMULATE = 'simulate'
+ENDPOINT_POLL = 'poll'
+ENDPOINT_CHECK = 'check'
+ENDPOINT_SUBMIT = 'submit'
+ENDPOINT_READ = 'read'
+
+
+def endpoint_class(
+    method: str,
+    url: str,
+) -> str:
+    """
+    Returns the class of the endpoint that a request targets.
+
+    Parameters
+    ----------
+    method: str
+        The HTTP method.
+    url: str
+        The URL.
+
+    Returns
+    -------
+    str
+        One of `ENDPOINT_AUTH`, `ENDPOINT_SIMULATE`, `ENDPOINT_POLL`,
+        `ENDPOINT_CHECK`, `ENDPOINT_SUBMIT` and `ENDPOINT_READ`.
+
+    Examples
+    --------
+    >>> wqb.endpoint_class('POST', wqb.URL_SIMULATIONS)
+    'simulate'
+    >>> wqb.endpoint_class('GET', wqb.URL_SIMULATIONS + '/abc')
+    'poll'
+    """
+    path = urlsplit(url).path.rstrip('/')
+    if path.startswith('/authentication'):
+        return ENDPOINT_AUTH
+    if path.startswith('/simulations'):
+        return ENDPOINT_SIMULATE if 'POST' == method.upper() else ENDPOINT_POLL
+    if path.startswith('/alphas/'):
+        if path.endswith('/check'):
+            return ENDPOINT_CHECK
+        if path.endswith('/submit'):
+            return ENDPOINT_SUBMIT
+    return ENDPOINT_READ
+
+
+# The collections whose next path segment is an identifier.
+_ID_COLLECTIONS = frozenset(
+    ('alphas', 'simulations', 'data-sets', 'data-fields', 'users', 'competitions')
+)
+
+
+def endpoint_template(
+    url: str,
+) -> str:
+    """
+    Returns the path of `url` with identifiers replaced by `{id}`, so that
+    requests to the same endpoint share one label.
+
+    Parameters
+    ----------
+    url: str
+        The URL.
+
+    Returns
+    -------
+    str
+        The endpoint template.
+
+    Examples
+    --------
+    >>> wqb.endpoint_template(wqb.URL_ALPHAS_ALPHAID_CHECK.format('abc'))
+    '/alphas/{id}/check'
+    >>> wqb.endpoint_template(wqb.URL_USERS_SELF_ALPHAS + '?limit=100')
+    '/users/self/alphas'
+    """
+    segments = urlsplit(url).path.strip('/').split('/')
+    for idx in range(1, len(segments)):
+        if segments[idx - 1] in _ID_COLLECTIONS and 'self' != segments[idx]:
+            segments[idx] = '{id}'
+    return '/' + '/'.join(segments)
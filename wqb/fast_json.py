@@ -0,0 +1,179 @@
+import json
+from collections.abc import Iterable, Mapping
+from typing import Any
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+__all__ = [
+    'JSON_BACKEND',
+    'loads',
+    'decode_recordset',
+    'decode_pnl',
+    'align_pnls',
+    'days_to_dates',
+]
+
+
+JSON_BACKEND = 'json' if orjson is None else 'orjson'
+
+
+def loads(
+    data: bytes | str,
+) -> Any:
+    """
+    Parses JSON with `orjson` if it is installed, otherwise with `json`.
+
+    Parameters
+    ----------
+    data: bytes | str
+        The JSON document, e.g. `resp.content`. Passing the raw bytes
+        skips the charset detection of `resp.text`.
+
+    Returns
+    -------
+    Any
+        The parsed object.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _floats(
+    values: Iterable[Any],
+    count: int,
+) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.float64)
+    except TypeError:
+        # *None* cannot be cast directly.
+        return np.fromiter(
+            (np.nan if value is None else value for value in values),
+            dtype=np.float64,
+            count=count,
+        )
+
+
+def decode_recordset(
+    data: bytes | str | Mapping[str, Any],
+) -> dict[str, np.ndarray]:
+    """
+    Decodes a recordset (`{"schema": {"properties": [...]}, "records":
+    [[...], ...]}`) into one typed array per column.
+
+    Columns of type *'date'* become `int32` day numbers since
+    1970-01-01, numeric columns become `float64` with *None* as NaN, and
+    any other column is kept as an `object` array.
+
+    Parameters
+    ----------
+    data: bytes | str | Mapping[str, Any]
+        The raw JSON document or the parsed object.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The arrays keyed by column name, in schema order.
+    """
+    if not isinstance(data, Mapping):
+        data = loads(data)
+    properties = data['schema']['properties']
+    records = data['records']
+    count = len(records)
+    columns = list(zip(*records)) if count else [()] * len(properties)
+    arrays = {}
+    for prop, column in zip(properties, columns):
+        kind = prop.get('type')
+        if 'date' == kind:
+            arrays[prop['name']] = (
+                np.array(column, dtype='datetime64[D]').astype(np.int32)
+            )
+        elif kind in ('string', 'text'):
+            arrays[prop['name']] = np.array(column, dtype=object)
+        else:
+            try:
+                arrays[prop['name']] = _floats(column, count)
+            except (TypeError, ValueError):
+                arrays[prop['name']] = np.array(column, dtype=object)
+    return arrays
+
+
+def decode_pnl(
+    data: bytes | str | Mapping[str, Any],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decodes a PnL recordset into day numbers and PnL values.
+
+    The PnL column is *'pnl'*, or the first numeric column that is not a
+    date or an identifier.
+
+    Parameters
+    ----------
+    data: bytes | str | Mapping[str, Any]
+        The raw JSON document or the parsed object.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        `int32` day numbers since 1970-01-01 and `float64` PnL values.
+
+    Raises
+    ------
+    KeyError
+        If the recordset has no date or PnL column.
+    """
+    arrays = decode_recordset(data)
+    if 'date' not in arrays:
+        raise KeyError('date')
+    values = arrays.get('pnl')
+    if values is None:
+        for name, array in arrays.items():
+            if name.lower() not in ('date', 'id', 'alphaid') and np.float64 == array.dtype:
+                values = array
+                break
+        else:
+            raise KeyError('pnl')
+    return arrays['date'], values
+
+
+def align_pnls(
+    pnls: Mapping[str, tuple[np.ndarray, np.ndarray]],
+) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """
+    Aligns the PnL arrays of many alphas on the union of their days.
+
+    Parameters
+    ----------
+    pnls: Mapping[str, tuple[np.ndarray, np.ndarray]]
+        The `(days, values)` pairs from `decode_pnl`, keyed by alpha ID.
+
+    Returns
+    -------
+    tuple[np.ndarray, list[str], np.ndarray]
+        The sorted day numbers, the alpha IDs, and a `float64` matrix of
+        shape `(len(days), len(alpha_ids))` with NaN where an alpha has
+        no record.
+    """
+    alpha_ids = list(pnls)
+    if not alpha_ids:
+        return np.empty(0, dtype=np.int32), alpha_ids, np.empty((0, 0))
+    days = np.unique(np.concatenate([pnls[alpha_id][0] for alpha_id in alpha_ids]))
+    matrix = np.full((len(days), len(alpha_ids)), np.nan)
+    for col, alpha_id in enumerate(alpha_ids):
+        alpha_days, values = pnls[alpha_id]
+        matrix[np.searchsorted(days, alpha_days), col] = values
+    return days, alpha_ids, matrix
+
+
+def days_to_dates(
+    days: np.ndarray,
+) -> np.ndarray:
+    """
+    Converts day numbers since 1970-01-01 back to `datetime64[D]`.
+    """
+    return np.asarray(days).astype('datetime64[D]')
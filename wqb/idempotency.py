@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+__all__ = ['SimulationLedger']
+
+
+class SimulationLedger:
+    """
+    A persistent record of simulation POSTs keyed by the hash of their
+    payload, so that a retried POST never creates a second simulation.
+
+    A key is *'POSTING'* from just before the POST until the outcome is
+    known, and *'LOCATED'* once the `Location` URL is known. A key still
+    *'POSTING'* after a crash, an exception or a 5xx response is
+    ambiguous: the simulation may or may not exist. `WQBSession.simulate`
+    reconciles such a key against the alphas created since the POST and
+    only POSTs again once `settle` seconds have passed without a match.
+    Finished keys are removed.
+    """
+
+    POSTING = 'POSTING'
+    LOCATED = 'LOCATED'
+
+    def __init__(
+        self,
+        path: str = ':memory:',
+        *,
+        settle: float = 900.0,
+    ) -> None:
+        """
+        Initializes a `SimulationLedger` object.
+
+        Parameters
+        ----------
+        path: str = ':memory:'
+            The SQLite database file. The default keeps the ledger in
+            memory, for the lifetime of the object only.
+        settle: float = 900.0
+            The number of seconds after an ambiguous POST without a
+            matching alpha after which the POST is considered lost.
+
+        Returns
+        -------
+        None
+        """
+        if ':memory:' != path:
+            path = os.path.expanduser(path)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.settle = max(0.0, settle)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS simulations ('
+                'key TEXT NOT NULL PRIMARY KEY, '
+                'state TEXT NOT NULL, '
+                'location TEXT DEFAULT NULL, '
+                'posted_at REAL NOT NULL, '
+                'tries INTEGER NOT NULL DEFAULT 0, '
+                'payload TEXT DEFAULT NULL)'
+            )
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<SimulationLedger [{self.path}]>"
+
+    @staticmethod
+    def _canonical(
+        target: Any,
+    ) -> str:
+        return json.dumps(target, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    @classmethod
+    def key(
+        cls,
+        target: Any,
+    ) -> str:
+        """
+        Returns the SHA-256 hex digest of the canonical JSON of `target`,
+        an `Alpha` or a `MultiAlpha` object.
+        """
+        return hashlib.sha256(cls._canonical(target).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _entry(
+        row: tuple,
+    ) -> dict[str, Any]:
+        entry = dict(zip(('key', 'state', 'location', 'posted_at', 'tries', 'payload'), row))
+        if entry['payload'] is not None:
+            entry['payload'] = json.loads(entry['payload'])
+        return entry
+
+    def get(
+        self,
+        key: str,
+    ) -> dict[str, Any] | None:
+        """
+        Returns the entry of `key` as a `dict` of `key`, `state`,
+        `location`, `posted_at`, `tries` and `payload`, or *None*.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT key, state, location, posted_at, tries, payload FROM simulations WHERE key = ?',
+                (key,),
+            ).fetchone()
+        return None if row is None else self._entry(row)
+
+    def begin(
+        self,
+        key: str,
+        target: Any = None,
+    ) -> None:
+        """
+        Marks `key` as *'POSTING'* right before its POST is sent, keeping
+        `target` so that the POST can be reconciled after a restart.
+        """
+        payload = None if target is None else self._canonical(target)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO simulations (key, state, posted_at, tries, payload) VALUES (?, ?, ?, 1, ?) '
+                'ON CONFLICT(key) DO UPDATE SET state = excluded.state, location = NULL, '
+                'posted_at = excluded.posted_at, tries = tries + 1, payload = excluded.payload',
+                (key, self.POSTING, time.time(), payload),
+            )
+
+    def locate(
+        self,
+        key: str,
+        location: str,
+    ) -> None:
+        """
+        Records the `Location` URL of `key`.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE simulations SET state = ?, location = ? WHERE key = ?',
+                (self.LOCATED, location, key),
+            )
+
+    def finish(
+        self,
+        key: str,
+    ) -> None:
+        """
+        Removes `key`, once its simulation finished or its POST was
+        definitely rejected.
+        """
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM simulations WHERE key = ?', (key,))
+
+    def settled(
+        self,
+        entry: dict[str, Any],
+    ) -> bool:
+        """
+        Returns whether an ambiguous POST is old enough to be considered
+        lost.
+        """
+        return time.time() - entry['posted_at'] >= self.settle
+
+    def entries(
+        self,
+        state: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Returns every entry, or those in `state`.
+        """
+        sql = 'SELECT key, state, location, posted_at, tries, payload FROM simulations'
+        params = ()
+        if state is not None:
+            sql += ' WHERE state = ?'
+            params = (state,)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def close(
+        self,
+    ) -> None:
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,255 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from .endpoints import (
+    ENDPOINT_AUTH,
+    ENDPOINT_CHECK,
+    ENDPOINT_POLL,
+    ENDPOINT_READ,
+    ENDPOINT_SIMULATE,
+    ENDPOINT_SUBMIT,
+    endpoint_class,
+)
+
+__all__ = ['RequestLanes']
+
+
+class RequestLanes:
+    """
+    Thread-safe concurrency budgets per endpoint class over a shared
+    number of connections, with priority lanes.
+
+    Every request takes a slot of `total` and a slot of its lane for the
+    duration of the send. A lane never holds more than its budget, so
+    the default budget of *'read'* (half of `total`) keeps connections
+    free for polls and checks while bulk PnL downloads or catalog paging
+    run. When slots free up, they are granted to the waiter of the
+    highest-priority lane that is within budget, first come first served
+    within a lane. In-flight requests are never interrupted, so bulk
+    traffic is preempted at the next free slot.
+    """
+
+    # Lower values are served first.
+    DEFAULT_PRIORITIES = {
+        ENDPOINT_AUTH: 0,
+        ENDPOINT_POLL: 1,
+        ENDPOINT_CHECK: 1,
+        ENDPOINT_SUBMIT: 2,
+        ENDPOINT_SIMULATE: 3,
+        ENDPOINT_READ: 4,
+    }
+
+    def __init__(
+        self,
+        total: int = 16,
+        budgets: dict[str, int | None] | None = None,
+        *,
+        priorities: dict[str, int] | None = None,
+    ) -> None:
+        """
+        Initializes a `RequestLanes` object.
+
+        Parameters
+        ----------
+        total: int = 16
+            The number of requests in flight across every lane, usually
+            the connection pool size.
+        budgets: dict[str, int | None] | None = None
+            The maximum numbers of requests in flight keyed by endpoint
+            class, which override `default_budgets`. *None* means only
+            `total` applies. See also `endpoint_class`.
+        priorities: dict[str, int] | None = None
+            The priorities keyed by endpoint class, which override
+            `DEFAULT_PRIORITIES`. Lower values are served first.
+
+        Returns
+        -------
+        None
+        """
+        self.cond = threading.Condition()
+        self.overrides = dict(budgets or {})
+        self.priorities = self.DEFAULT_PRIORITIES | (priorities or {})
+        self.total = 0
+        self.budgets = {}
+        self.in_use = dict.fromkeys(self.priorities, 0)
+        self.in_use_total = 0
+        self.waiters = []
+        self.seq = 0
+        self.waits = dict.fromkeys(self.priorities, 0)
+        self.waited = dict.fromkeys(self.priorities, 0.0)
+        self.resize(total)
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<RequestLanes [{self.in_use_total}/{self.total}]>"
+
+    @staticmethod
+    def default_budgets(
+        total: int,
+    ) -> dict[str, int | None]:
+        """
+        Returns the default budgets for `total` slots: one login at a
+        time, polls and checks up to `total`, and simulations, submits
+        and reads limited so that they cannot take every slot.
+        """
+        return {
+            ENDPOINT_AUTH: 1,
+            ENDPOINT_POLL: None,
+            ENDPOINT_CHECK: None,
+            ENDPOINT_SUBMIT: max(1, total // 4),
+            ENDPOINT_SIMULATE: max(1, total // 2),
+            ENDPOINT_READ: max(1, total // 2),
+        }
+
+    def resize(
+        self,
+        total: int,
+    ) -> None:
+        """
+        Sets `total` and recomputes the budgets. Slots in use are kept;
+        a lane above its new budget just gets no new slot until it is
+        back within budget.
+
+        Parameters
+        ----------
+        total: int
+            The number of requests in flight across every lane.
+
+        Returns
+        -------
+        None
+        """
+        with self.cond:
+            self.total = max(1, total)
+            budgets = self.default_budgets(self.total) | self.overrides
+            self.budgets = {
+                lane: self.total if budget is None else min(self.total, max(1, budget))
+                for lane, budget in budgets.items()
+            }
+            self.cond.notify_all()
+
+    def _fits(
+        self,
+        lane: str,
+    ) -> bool:
+        return (
+            self.in_use_total < self.total
+            and self.in_use.get(lane, 0) < self.budgets.get(lane, self.total)
+        )
+
+    def _next(
+        self,
+    ) -> tuple | None:
+        # The waiters are few, so a scan is cheaper than keeping a heap
+        # per lane.
+        best = None
+        for waiter in self.waiters:
+            if self._fits(waiter[2]) and (best is None or waiter < best):
+                best = waiter
+        return best
+
+    def acquire(
+        self,
+        method: str,
+        url: str,
+    ) -> tuple[str, float]:
+        """
+        Blocks until a request to `url` may be sent.
+
+        Parameters
+        ----------
+        method: str
+            The HTTP method.
+        url: str
+            The URL.
+
+        Returns
+        -------
+        tuple[str, float]
+            The lane, to be passed to `release`, and the number of
+            seconds spent waiting.
+        """
+        lane = endpoint_class(method, url)
+        priority = self.priorities.get(lane, len(self.priorities))
+        with self.cond:
+            if self._fits(lane):
+                ahead = self._next()
+                if ahead is None or priority < ahead[0]:
+                    self._take(lane)
+                    return lane, 0.0
+            self.seq += 1
+            waiter = (priority, self.seq, lane)
+            self.waiters.append(waiter)
+            start = time.monotonic()
+            try:
+                self.cond.wait_for(lambda: self._next() is waiter)
+            finally:
+                self.waiters.remove(waiter)
+            self._take(lane)
+            waited = time.monotonic() - start
+            self.waits[lane] = self.waits.get(lane, 0) + 1
+            self.waited[lane] = self.waited.get(lane, 0.0) + waited
+            # Another waiter may fit too, e.g. one of a lane with room.
+            self.cond.notify_all()
+        return lane, waited
+
+    def _take(
+        self,
+        lane: str,
+    ) -> None:
+        self.in_use[lane] = self.in_use.get(lane, 0) + 1
+        self.in_use_total += 1
+
+    def release(
+        self,
+        lane: str,
+    ) -> None:
+        """
+        Releases a slot of `lane` taken by `acquire`.
+        """
+        with self.cond:
+            self.in_use[lane] = max(0, self.in_use.get(lane, 0) - 1)
+            self.in_use_total = max(0, self.in_use_total - 1)
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(
+        self,
+        method: str,
+        url: str,
+    ):
+        """
+        Holds a slot for a request to `url` for the duration of the
+        `with` block.
+        """
+        lane, _ = self.acquire(method, url)
+        try:
+            yield lane
+        finally:
+            self.release(lane)
+
+    def stats(
+        self,
+    ) -> dict[str, dict[str, int | float]]:
+        """
+        Returns the budget, the slots in use, the number of waiting
+        requests, the number of requests that had to wait and the total
+        seconds waited of every lane.
+        """
+        with self.cond:
+            waiting = {}
+            for _, _, lane in self.waiters:
+                waiting[lane] = waiting.get(lane, 0) + 1
+            return {
+                lane: {
+                    'budget': self.budgets.get(lane, self.total),
+                    'priority': priority,
+                    'in_use': self.in_use.get(lane, 0),
+                    'waiting': waiting.get(lane, 0),
+                    'waits': self.waits.get(lane, 0),
+                    'waited': round(self.waited.get(lane, 0.0), 6),
+                }
+                for lane, priority in self.priorities.items()
+            }
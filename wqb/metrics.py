@@ -0,0 +1,418 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from contextlib import contextmanager
+from typing import Any
+from requests import Response
+
+from .endpoints import endpoint_template
+
+__all__ = ['Histogram', 'Metrics', 'get_metrics']
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed upper bounds, as in Prometheus.
+    """
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(
+        self,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<Histogram [{self.count}]>"
+
+    def observe(
+        self,
+        value: float,
+    ) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(
+        self,
+    ) -> list[tuple[str, int]]:
+        """
+        Returns the `(le, count)` pairs, the last of which is *'+Inf'*.
+        """
+        result = []
+        total = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else f"{bound:g}", total))
+        return result
+
+    def quantile(
+        self,
+        q: float,
+    ) -> float | None:
+        """
+        Returns the upper bound of the bucket holding quantile `q`, or
+        *None* if nothing was observed.
+        """
+        if 0 == self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            if rank <= total:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """
+    Thread-safe request instrumentation keyed by HTTP method and endpoint
+    template: latency histograms, status counts, retries, bytes in and
+    out, in-flight gauges and named counters, exportable as JSON or in
+    the Prometheus text format.
+    """
+
+    def __init__(
+        self,
+        buckets: tuple[float, ...] = Histogram.DEFAULT_BUCKETS,
+    ) -> None:
+        """
+        Initializes a `Metrics` object.
+
+        Parameters
+        ----------
+        buckets: tuple[float, ...] = Histogram.DEFAULT_BUCKETS
+            The upper bounds in seconds of the latency histograms.
+
+        Returns
+        -------
+        None
+        """
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.latency = defaultdict(lambda: Histogram(self.buckets))
+        self.statuses = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.bytes_in = defaultdict(int)
+        self.bytes_out = defaultdict(int)
+        self.in_flight = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.gauges = {}
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<Metrics [{len(self.latency)} endpoints]>"
+
+    @staticmethod
+    def _key(
+        method: str,
+        url: str,
+    ) -> tuple[str, str]:
+        return method.upper(), endpoint_template(url)
+
+    @contextmanager
+    def track(
+        self,
+        method: str,
+        url: str,
+    ):
+        """
+        Counts a request as in flight for the duration of the `with`
+        block.
+        """
+        key = self._key(method, url)
+        with self.lock:
+            self.in_flight[key] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_flight[key] -= 1
+
+    def observe(
+        self,
+        method: str,
+        url: str,
+        resp: Response,
+        elapsed: float | None = None,
+    ) -> None:
+        """
+        Records the latency, status and sizes of a `Response` object.
+
+        Parameters
+        ----------
+        method: str
+            The HTTP method.
+        url: str
+            The URL.
+        resp: Response
+            The `Response` object.
+        elapsed: float | None = None
+            The latency in seconds. If *None*, `resp.elapsed` is used.
+
+        Returns
+        -------
+        None
+        """
+        key = self._key(method, url)
+        if elapsed is None:
+            elapsed = resp.elapsed.total_seconds()
+        body = getattr(resp.request, 'body', None)
+        sent = len(body.encode('utf-8') if isinstance(body, str) else body or b'')
+        received = len(resp.content or b'')
+        with self.lock:
+            self.latency[key].observe(elapsed)
+            self.statuses[(*key, str(resp.status_code))] += 1
+            self.bytes_in[key] += received
+            self.bytes_out[key] += sent
+
+    def observe_error(
+        self,
+        method: str,
+        url: str,
+        error: BaseException,
+    ) -> None:
+        """
+        Counts a request that raised `error` instead of returning.
+        """
+        with self.lock:
+            self.errors[(*self._key(method, url), type(error).__name__)] += 1
+
+    def retry(
+        self,
+        method: str,
+        url: str,
+        reason: str,
+    ) -> None:
+        """
+        Counts a retry of a request, e.g. for *'429'*, *'401'* or
+        *'unexpected'*.
+        """
+        with self.lock:
+            self.retries[(*self._key(method, url), reason)] += 1
+
+    def increment(
+        self,
+        name: str,
+        method: str,
+        url: str,
+        value: int = 1,
+    ) -> None:
+        """
+        Adds `value` to the counter `name` of an endpoint, e.g.
+        *'cache_hits'* or *'polls'*.
+        """
+        with self.lock:
+            self.counters[(name, *self._key(method, url))] += value
+
+    def register_gauge(
+        self,
+        name: str,
+        func: Callable[[], float | int | None],
+    ) -> None:
+        """
+        Registers a gauge that is read by `func` when a snapshot is
+        taken, e.g. the current limit of an `AdaptiveConcurrency` object.
+        """
+        with self.lock:
+            self.gauges[name] = func
+
+    def snapshot(
+        self,
+    ) -> dict[str, Any]:
+        """
+        Returns every metric as a JSON-serializable `dict`.
+        """
+        with self.lock:
+            endpoints = defaultdict(dict)
+            for (method, template), hist in self.latency.items():
+                endpoints[f"{method} {template}"] |= {
+                    'requests': hist.count,
+                    'latency_sum': round(hist.sum, 6),
+                    'latency_avg': round(hist.sum / hist.count, 6) if hist.count else None,
+                    'latency_p50': hist.quantile(0.5),
+                    'latency_p95': hist.quantile(0.95),
+                    'latency_buckets': dict(hist.cumulative()),
+                    'bytes_in': self.bytes_in[(method, template)],
+                    'bytes_out': self.bytes_out[(method, template)],
+                }
+            for (method, template), value in self.in_flight.items():
+                endpoints[f"{method} {template}"]['in_flight'] = value
+            for (method, template, status), value in self.statuses.items():
+                endpoints[f"{method} {template}"].setdefault('statuses', {})[status] = value
+            for (method, template, reason), value in self.retries.items():
+                endpoints[f"{method} {template}"].setdefault('retries', {})[reason] = value
+            for (method, template, error), value in self.errors.items():
+                endpoints[f"{method} {template}"].setdefault('errors', {})[error] = value
+            for (name, method, template), value in self.counters.items():
+                endpoints[f"{method} {template}"][name] = value
+            gauges = dict(self.gauges)
+        return {
+            'started_at': self.started_at,
+            'uptime': round(time.time() - self.started_at, 3),
+            'endpoints': dict(endpoints),
+            'gauges': {name: func() for name, func in gauges.items()},
+        }
+
+    def to_json(
+        self,
+    ) -> str:
+        """
+        Returns `snapshot` as a JSON string.
+        """
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(
+        self,
+        prefix: str = 'wqb',
+    ) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+
+        def labels(**kwargs) -> str:
+            return ','.join(f'{k}="{v}"' for k, v in kwargs.items())
+
+        lines = []
+
+        def family(name: str, kind: str, help: str, samples) -> None:
+            samples = list(samples)
+            if not samples:
+                return
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, label, value in samples:
+                lines.append(f"{prefix}_{name}{suffix}{{{label}}} {value}")
+
+        with self.lock:
+            latency = {key: (hist.cumulative(), hist.sum, hist.count) for key, hist in self.latency.items()}
+            statuses = dict(self.statuses)
+            retries = dict(self.retries)
+            errors = dict(self.errors)
+            bytes_in = dict(self.bytes_in)
+            bytes_out = dict(self.bytes_out)
+            in_flight = dict(self.in_flight)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        family(
+            'request_duration_seconds',
+            'histogram',
+            'Request latency by endpoint.',
+            (
+                sample
+                for (method, template), (cumulative, total, count) in latency.items()
+                for sample in (
+                    *(
+                        ('_bucket', labels(method=method, endpoint=template, le=le), value)
+                        for le, value in cumulative
+                    ),
+                    ('_sum', labels(method=method, endpoint=template), f"{total:.6f}"),
+                    ('_count', labels(method=method, endpoint=template), count),
+                )
+            ),
+        )
+        family(
+            'responses_total',
+            'counter',
+            'Responses by endpoint and status code.',
+            (('', labels(method=m, endpoint=t, status=s), v) for (m, t, s), v in statuses.items()),
+        )
+        family(
+            'retries_total',
+            'counter',
+            'Retries by endpoint and reason.',
+            (('', labels(method=m, endpoint=t, reason=r), v) for (m, t, r), v in retries.items()),
+        )
+        family(
+            'errors_total',
+            'counter',
+            'Requests that raised, by endpoint and exception.',
+            (('', labels(method=m, endpoint=t, error=e), v) for (m, t, e), v in errors.items()),
+        )
+        family(
+            'received_bytes_total',
+            'counter',
+            'Response body bytes by endpoint.',
+            (('', labels(method=m, endpoint=t), v) for (m, t), v in bytes_in.items()),
+        )
+        family(
+            'sent_bytes_total',
+            'counter',
+            'Request body bytes by endpoint.',
+            (('', labels(method=m, endpoint=t), v) for (m, t), v in bytes_out.items()),
+        )
+        family(
+            'in_flight_requests',
+            'gauge',
+            'Requests in flight by endpoint.',
+            (('', labels(method=m, endpoint=t), v) for (m, t), v in in_flight.items()),
+        )
+        for name in sorted({name for name, _, _ in counters}):
+            family(
+                f"{name}_total",
+                'counter',
+                f"{name} by endpoint.",
+                (
+                    ('', labels(method=m, endpoint=t), v)
+                    for (n, m, t), v in counters.items()
+                    if n == name
+                ),
+            )
+        for name, func in gauges.items():
+            value = func()
+            if value is not None:
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(
+        self,
+        path: str,
+    ) -> None:
+        """
+        Writes the metrics to `path` atomically, in the Prometheus text
+        format if `path` ends with *'.prom'*, otherwise as JSON.
+        """
+        path = os.path.expanduser(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns the process-wide `Metrics` object, creating it on first use.
+
+    Returns
+    -------
+    Metrics
+        The process-wide `Metrics` object.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
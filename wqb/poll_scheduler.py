@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Callable, Coroutine, Iterable
+from typing import Any
+from requests import Response
+
+from . import GET, RETRY_AFTER
+from .circuit_breaker import CIRCUIT_CLOSED
+
+__all__ = ['PollScheduler']
+
+
+class PollScheduler:
+    """
+    A single polling loop for every in-flight URL (e.g. simulation
+    `Location` URLs), which keeps the URLs in a min-heap keyed by their
+    next due time and sends a GET only when one is due.
+
+    Callers await `poll`, which resolves once the response has no
+    `Retry-After` header, the same condition `WQBSession.retry` uses.
+    Concurrent callers of the same URL share one poll. If the session
+    has a `circuit_breaker`, a 5xx response is polled again instead,
+    and does not count against `max_tries` while the circuit is not
+    closed.
+    """
+
+    def __init__(
+        self,
+        wqbs: Any,
+        *,
+        max_inflight: int | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        """
+        Initializes a `PollScheduler` object.
+
+        Parameters
+        ----------
+        wqbs: WQBSession
+            The session to send polls with.
+        max_inflight: int | None = None
+            The maximum number of polls sent at the same time. If *None*,
+            `wqbs.pool_size` is used.
+        logger: logging.Logger | None = None
+            The `logging.Logger` object to log exhausted URLs. If *None*,
+            `wqbs.logger` is used.
+
+        Returns
+        -------
+        None
+        """
+        self.wqbs = wqbs
+        self.max_inflight = max_inflight
+        self.logger = wqbs.logger if logger is None else logger
+        self.seq = itertools.count()
+        self.polls = 0
+        self.resolved = 0
+        self._reset(None)
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<PollScheduler [{len(self.entries)} in flight]>"
+
+    def _reset(
+        self,
+        loop: asyncio.AbstractEventLoop | None,
+    ) -> None:
+        self.loop = loop
+        self.heap = []
+        self.entries = {}
+        self.wakeup = None
+        self.task = None
+        self.semaphore = None
+        self.pending = set()
+
+    def _ensure_running(
+        self,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self._reset(loop)
+            self.wakeup = asyncio.Event()
+            self.semaphore = asyncio.Semaphore(
+                max(1, self.max_inflight or self.wqbs.pool_size)
+            )
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._run())
+
+    def _push(
+        self,
+        due: float,
+        url: str,
+    ) -> None:
+        heapq.heappush(self.heap, (due, next(self.seq), url))
+        self.wakeup.set()
+
+    async def poll(
+        self,
+        url: str,
+        *,
+        max_tries: int | Iterable[Any] = range(600),
+        on_start: Callable[[dict[str, Any]], None] | None = None,
+        on_finish: Callable[[dict[str, Any]], None] | None = None,
+        on_success: Callable[[dict[str, Any]], None] | None = None,
+        on_failure: Callable[[dict[str, Any]], None] | None = None,
+        **kwargs,
+    ) -> Coroutine[None, None, Response | None]:
+        """
+        Polls `url` until the response has no `Retry-After` header.
+
+        Parameters
+        ----------
+        url: str
+            The URL.
+        max_tries: int | Iterable[Any] = range(600)
+            The maximum number of polls. Only the first caller of a URL
+            sets it.
+        on_start: Callable[[dict[str, Any]], None] | None = None
+        on_finish: Callable[[dict[str, Any]], None] | None = None
+        on_success: Callable[[dict[str, Any]], None] | None = None
+        on_failure: Callable[[dict[str, Any]], None] | None = None
+            The callbacks, called with a dict of `url`, `resp` and
+            `tries` like those of `WQBSession.retry`.
+
+        Returns
+        -------
+        Response | None
+            The final `Response` object, or the last one if `max_tries`
+            ran out.
+
+        Notes
+        -----
+        Other `kwargs` are ignored and accepted only for compatibility
+        with `WQBSession.retry`.
+        """
+        self._ensure_running()
+        if isinstance(max_tries, int):
+            max_tries = range(max_tries)
+        entry = self.entries.get(url)
+        if entry is None:
+            entry = {
+                'url': url,
+                'resp': None,
+                'tries': 0,
+                'max_tries': iter(max_tries),
+                'future': self.loop.create_future(),
+            }
+            self.entries[url] = entry
+            self._push(time.monotonic(), url)
+        if on_start is not None:
+            on_start(entry)
+        resp, exhausted = await asyncio.shield(entry['future'])
+        if exhausted:
+            if on_failure is not None:
+                on_failure(entry)
+        elif on_success is not None:
+            on_success(entry)
+        if on_finish is not None:
+            on_finish(entry)
+        return resp
+
+    async def poll_many(
+        self,
+        urls: Iterable[str],
+        *,
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> Coroutine[None, None, list[Response | None | BaseException]]:
+        """
+        Polls every URL of `urls` at the same time. See also `poll`.
+        """
+        return await asyncio.gather(
+            *(self.poll(url, **kwargs) for url in urls),
+            return_exceptions=return_exceptions,
+        )
+
+    async def _run(
+        self,
+    ) -> None:
+        # An entry leaves `entries` only once its future is resolved, so
+        # the loop may stop as soon as `entries` is empty.
+        while self.entries:
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, url = heapq.heappop(self.heap)
+                task = asyncio.create_task(self._poll_once(url))
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _resolve(
+        self,
+        url: str,
+        result: Any,
+        exhausted: bool = False,
+        exception: BaseException | None = None,
+    ) -> None:
+        entry = self.entries.pop(url)
+        self.resolved += 1
+        if exception is not None:
+            entry['future'].set_exception(exception)
+        else:
+            entry['future'].set_result((result, exhausted))
+        self.wakeup.set()
+
+    async def _poll_once(
+        self,
+        url: str,
+    ) -> None:
+        entry = self.entries[url]
+        if next(entry['max_tries'], self) is self:
+            self.logger.warning(
+                f"{self}._poll_once(...) [max {entry['tries']} tries ran out]: {url}"
+            )
+            self._resolve(url, entry['resp'], exhausted=True)
+            return
+        try:
+            async with self.semaphore:
+                resp = await self.wqbs.arequest(GET, url)
+        except Exception as e:
+            self._resolve(url, None, exception=e)
+            return
+        self.polls += 1
+        if self.wqbs.metrics is not None:
+            self.wqbs.metrics.increment('polls', GET, url)
+        entry['resp'] = resp
+        entry['tries'] += 1
+        breaker = getattr(self.wqbs, 'circuit_breaker', None)
+        if 500 <= resp.status_code and breaker is not None:
+            # The platform is degraded: poll again once the breaker
+            # probes, without using up a try while it is not closed.
+            if CIRCUIT_CLOSED != breaker.state:
+                entry['max_tries'] = itertools.chain((None,), entry['max_tries'])
+            delay = max(self.wqbs.delay_unexpected, breaker.retry_in())
+            self._push(time.monotonic() + delay, url)
+            return
+        try:
+            retry_after = float(resp.headers[RETRY_AFTER])
+        except (KeyError, ValueError):
+            self._resolve(url, resp)
+            return
+        self._push(time.monotonic() + max(0.0, retry_after), url)
+
+    def stats(
+        self,
+    ) -> dict[str, int]:
+        """
+        Returns the number of URLs in flight, polls sent and URLs
+        resolved.
+        """
+        return {
+            'in_flight': len(self.entries),
+            'polls': self.polls,
+            'resolved': self.resolved,
+        }
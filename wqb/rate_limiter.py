@@ -0,0 +1,288 @@
+import logging
+import threading
+import time
+from requests import Response
+
+from . import RETRY_AFTER
+from .endpoints import (
+    ENDPOINT_AUTH,
+    ENDPOINT_CHECK,
+    ENDPOINT_POLL,
+    ENDPOINT_READ,
+    ENDPOINT_SIMULATE,
+    ENDPOINT_SUBMIT,
+    endpoint_class,
+)
+
+__all__ = ['TokenBucket', 'RateLimiter', 'get_rate_limiter']
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that refills at `rate` tokens per second
+    up to `capacity` tokens.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+    ) -> None:
+        self.rate = max(1e-6, rate)
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<TokenBucket [{self.rate}/s, {self.capacity}]>"
+
+    def reserve(
+        self,
+    ) -> float:
+        """
+        Takes one token and returns how long the caller must wait before
+        using it.
+
+        Returns
+        -------
+        float
+            The number of seconds to wait. *0.0* if a token was
+            available.
+
+        Notes
+        -----
+        The balance may go negative, so that concurrent callers are
+        served in the order they reserved.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1.0
+            if 0.0 <= self.tokens:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    A process-wide rate limiter with one `TokenBucket` per endpoint class
+    and a global cooldown that pauses every caller after a 429 response.
+
+    The `DEFAULT_RATES` are conservative `(rate, capacity)` pairs, e.g. at
+    most one simulation POST per second (each carrying up to 10 alphas
+    when packed) after a burst of 5. Raise them with `configure` if the
+    account allows more.
+    """
+
+    DEFAULT_RATES = {
+        ENDPOINT_AUTH: (0.2, 2),
+        ENDPOINT_SIMULATE: (1.0, 5),
+        ENDPOINT_POLL: (10.0, 20),
+        ENDPOINT_CHECK: (2.0, 5),
+        ENDPOINT_SUBMIT: (0.5, 2),
+        ENDPOINT_READ: (8.0, 16),
+    }
+
+    def __init__(
+        self,
+        rates: dict[str, tuple[float, float]] | None = None,
+        *,
+        cooldown: float = 5.0,
+        max_cooldown: float = 120.0,
+        logger: logging.Logger = logging.root,
+    ) -> None:
+        """
+        Initializes a `RateLimiter` object.
+
+        Parameters
+        ----------
+        rates: dict[str, tuple[float, float]] | None = None
+            The `(rate, capacity)` pairs keyed by endpoint class, which
+            override `DEFAULT_RATES`. See also `endpoint_class`.
+        cooldown: float = 5.0
+            The pause after a 429 response without a valid `Retry-After`
+            header. It doubles on every consecutive 429 response.
+        max_cooldown: float = 120.0
+            The upper bound of a single pause.
+        logger: logging.Logger = logging.root
+            The `logging.Logger` object to log cooldowns.
+
+        Returns
+        -------
+        None
+        """
+        rates = self.DEFAULT_RATES | (rates or {})
+        self.buckets = {
+            key: TokenBucket(rate, capacity) for key, (rate, capacity) in rates.items()
+        }
+        self.cooldown = max(0.0, cooldown)
+        self.max_cooldown = max(self.cooldown, max_cooldown)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.strikes = 0
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<RateLimiter [{', '.join(self.buckets)}]>"
+
+    def configure(
+        self,
+        rates: dict[str, tuple[float, float]],
+    ) -> None:
+        """
+        Replaces the buckets of the endpoint classes in `rates`, e.g.
+        `configure({'simulate': (2.0, 10)})`. Other buckets are kept.
+
+        Parameters
+        ----------
+        rates: dict[str, tuple[float, float]]
+            The `(rate, capacity)` pairs keyed by endpoint class. See
+            also `endpoint_class`.
+
+        Returns
+        -------
+        None
+        """
+        buckets = {
+            key: TokenBucket(rate, capacity) for key, (rate, capacity) in rates.items()
+        }
+        with self.lock:
+            self.buckets = self.buckets | buckets
+
+    def rates(
+        self,
+    ) -> dict[str, tuple[float, float]]:
+        """
+        Returns the `(rate, capacity)` pairs keyed by endpoint class.
+        """
+        return {
+            key: (bucket.rate, bucket.capacity) for key, bucket in self.buckets.items()
+        }
+
+    def pause_remaining(
+        self,
+    ) -> float:
+        """
+        Returns the number of seconds left in the global cooldown.
+        """
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def acquire(
+        self,
+        method: str,
+        url: str,
+    ) -> float:
+        """
+        Blocks until a request to `url` may be sent.
+
+        Parameters
+        ----------
+        method: str
+            The HTTP method.
+        url: str
+            The URL.
+
+        Returns
+        -------
+        float
+            The number of seconds spent waiting.
+        """
+        waited = 0.0
+        while 0.0 < (pause := self.pause_remaining()):
+            time.sleep(pause)
+            waited += pause
+        bucket = self.buckets.get(endpoint_class(method, url))
+        if bucket is not None and 0.0 < (delay := bucket.reserve()):
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    def penalize(
+        self,
+        retry_after: float | None = None,
+    ) -> float:
+        """
+        Starts (or extends) the global cooldown.
+
+        Parameters
+        ----------
+        retry_after: float | None = None
+            The pause suggested by the server. If *None*, an exponential
+            backoff based on `cooldown` is used.
+
+        Returns
+        -------
+        float
+            The length of the pause.
+        """
+        with self.lock:
+            self.strikes += 1
+            if retry_after is None:
+                retry_after = self.cooldown * 2 ** (self.strikes - 1)
+            pause = min(self.max_cooldown, max(0.0, retry_after))
+            paused_until = time.monotonic() + pause
+            extended = self.paused_until < paused_until
+            if extended:
+                self.paused_until = paused_until
+        if extended:
+            self.logger.warning(
+                f"{self}.penalize(...) [429 x{self.strikes}]: pausing all callers for {pause:.1f}s"
+            )
+        return pause
+
+    def observe(
+        self,
+        resp: Response,
+    ) -> None:
+        """
+        Feeds a `Response` object back, starting a cooldown on 429 and
+        resetting the backoff otherwise.
+
+        Parameters
+        ----------
+        resp: Response
+            The `Response` object.
+
+        Returns
+        -------
+        None
+        """
+        if 429 != resp.status_code:
+            if 0 < self.strikes:
+                with self.lock:
+                    self.strikes = 0
+            return
+        try:
+            retry_after = float(resp.headers[RETRY_AFTER])
+        except (KeyError, ValueError):
+            retry_after = None
+        self.penalize(retry_after)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Returns the process-wide `RateLimiter` object, creating it on first
+    use.
+
+    Returns
+    -------
+    RateLimiter
+        The process-wide `RateLimiter` object.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
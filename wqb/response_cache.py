@@ -0,0 +1,327 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from . import RETRY_AFTER
+
+__all__ = ['ResponseCache']
+
+
+class ResponseCache:
+    """
+    A size-bounded, on-disk LRU cache of GET responses with per-endpoint
+    time-to-live and conditional revalidation.
+    """
+
+    DEFAULT_TTLS = (
+        (r'/alphas/[^/]+/recordsets/pnl$', 12 * 3600.0),
+        (r'/operators$', 24 * 3600.0),
+        (r'/data-sets(/[^/]+)?$', 24 * 3600.0),
+        (r'/data-fields(/[^/]+)?$', 24 * 3600.0),
+    )
+
+    def __init__(
+        self,
+        directory: str = '~/.cache/wqb',
+        *,
+        ttls: Iterable[tuple[str, float]] | None = None,
+        max_bytes: int = 512 * 1024 * 1024,
+        logger: logging.Logger = logging.root,
+    ) -> None:
+        """
+        Initializes a `ResponseCache` object.
+
+        Parameters
+        ----------
+        directory: str = '~/.cache/wqb'
+            The directory of the cache files.
+        ttls: Iterable[tuple[str, float]] | None = None
+            The `(pattern, seconds)` pairs. A URL is cached only if the
+            regular expression `pattern` matches its path, and the first
+            match decides its time-to-live. If *None*, `DEFAULT_TTLS` is
+            used.
+        max_bytes: int = 512 * 1024 * 1024
+            The total size of the cache files. The least recently used
+            entries are evicted beyond it.
+        logger: logging.Logger = logging.root
+            The `logging.Logger` object to log evictions.
+
+        Returns
+        -------
+        None
+        """
+        self.directory = os.path.expanduser(directory)
+        self.ttls = [
+            (re.compile(pattern), ttl)
+            for pattern, ttl in (self.DEFAULT_TTLS if ttls is None else ttls)
+        ]
+        self.max_bytes = max(0, max_bytes)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, name[: -len('.cache')], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+        self.evict()
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<ResponseCache [{self.directory}]>"
+
+    def ttl(
+        self,
+        url: str,
+    ) -> float | None:
+        """
+        Returns the time-to-live of `url`, or *None* if it is not
+        cacheable.
+        """
+        path = urlsplit(url).path.rstrip('/')
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return None
+
+    @staticmethod
+    def key(
+        url: str,
+        params: Mapping[str, Any] | None = None,
+    ) -> str:
+        """
+        Returns the cache key of `url` and `params`, in which the order of
+        query parameters does not matter.
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        if params:
+            query.extend((str(k), str(v)) for k, v in params.items())
+        canonical = urlunsplit(
+            (parts.scheme, parts.netloc, parts.path.rstrip('/'), urlencode(sorted(query)), '')
+        )
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _path(
+        self,
+        key: str,
+    ) -> str:
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def _read(
+        self,
+        key: str,
+    ) -> tuple[dict[str, Any], bytes] | None:
+        try:
+            with open(self._path(key), 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        return meta, body
+
+    def _touch(
+        self,
+        key: str,
+    ) -> None:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _response(
+        meta: dict[str, Any],
+        body: bytes,
+    ) -> Response:
+        resp = Response()
+        resp.status_code = meta['status_code']
+        resp.reason = meta.get('reason', 'OK')
+        resp.url = meta['url']
+        resp.headers = CaseInsensitiveDict(meta['headers'])
+        resp.encoding = meta.get('encoding')
+        resp.elapsed = datetime.timedelta(0)
+        resp._content = body
+        resp.from_cache = True
+        return resp
+
+    def lookup(
+        self,
+        url: str,
+        params: Mapping[str, Any] | None = None,
+    ) -> tuple[Response | None, dict[str, str]]:
+        """
+        Looks up a fresh entry of `url` and `params`.
+
+        Parameters
+        ----------
+        url: str
+            The URL.
+        params: Mapping[str, Any] | None = None
+            The query parameters passed besides `url`.
+
+        Returns
+        -------
+        tuple[Response | None, dict[str, str]]
+            The cached `Response` object if the entry is fresh, otherwise
+            *None* and the conditional headers (`If-None-Match`,
+            `If-Modified-Since`) to revalidate a stale entry with.
+        """
+        ttl = self.ttl(url)
+        if ttl is None:
+            return None, {}
+        key = self.key(url, params)
+        if key not in self.entries or (entry := self._read(key)) is None:
+            self.misses += 1
+            return None, {}
+        meta, body = entry
+        if time.time() - meta['stored_at'] < ttl:
+            self.hits += 1
+            self._touch(key)
+            return self._response(meta, body), {}
+        headers = CaseInsensitiveDict(meta['headers'])
+        validators = {}
+        if headers.get('ETag'):
+            validators['If-None-Match'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = headers['Last-Modified']
+        self.misses += 1
+        return None, validators
+
+    def store(
+        self,
+        url: str,
+        params: Mapping[str, Any] | None,
+        resp: Response,
+    ) -> Response:
+        """
+        Stores a `Response` object of `url` and `params` if it is
+        cacheable, or resolves a 304 response from the stale entry.
+
+        Parameters
+        ----------
+        url: str
+            The URL.
+        params: Mapping[str, Any] | None
+            The query parameters passed besides `url`.
+        resp: Response
+            The `Response` object.
+
+        Returns
+        -------
+        Response
+            The cached `Response` object on 304, otherwise `resp`.
+        """
+        if self.ttl(url) is None:
+            return resp
+        key = self.key(url, params)
+        if 304 == resp.status_code:
+            entry = self._read(key)
+            if entry is None:
+                return resp
+            meta, body = entry
+            meta['stored_at'] = time.time()
+            self._write(key, meta, body)
+            self.revalidations += 1
+            return self._response(meta, body)
+        if 200 != resp.status_code or RETRY_AFTER in resp.headers:
+            return resp
+        meta = {
+            'url': resp.url,
+            'status_code': resp.status_code,
+            'reason': resp.reason,
+            'encoding': resp.encoding,
+            'headers': dict(resp.headers),
+            'stored_at': time.time(),
+        }
+        self._write(key, meta, resp.content)
+        return resp
+
+    def _write(
+        self,
+        key: str,
+        meta: dict[str, Any],
+        body: bytes,
+    ) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        data = json.dumps(meta).encode('utf-8') + b'\n' + body
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            self.logger.warning(f"{self}._write(...) [{path}]: {e}")
+            return
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+        self.evict()
+
+    def evict(
+        self,
+    ) -> int:
+        """
+        Removes the least recently used entries until the cache fits in
+        `max_bytes`.
+
+        Returns
+        -------
+        int
+            The number of removed entries.
+        """
+        removed = 0
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes or not self.entries:
+                    break
+                key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            removed += 1
+        if 0 < removed:
+            self.logger.info(f"{self}.evict(...) [{removed} entries]")
+        return removed
+
+    def stats(
+        self,
+    ) -> dict[str, int]:
+        """
+        Returns the entry count, total size, hits, misses and
+        revalidations of the cache.
+        """
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+        }
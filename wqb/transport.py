@@ -0,0 +1,288 @@
+import base64
+import datetime
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+from requests import PreparedRequest, Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .connection_pool import PooledHTTPAdapter
+from .wqb_urls import HTTP_API_WORLDQUANTBRAIN_COM, WQB_API_URL
+
+__all__ = [
+    'API_PREFIXES',
+    'Latency',
+    'RedirectAdapter',
+    'RecordingAdapter',
+    'ReplayAdapter',
+]
+
+
+API_PREFIXES = (WQB_API_URL, HTTP_API_WORLDQUANTBRAIN_COM)
+
+
+class Latency:
+    """
+    A latency distribution in seconds.
+
+    Examples
+    --------
+    >>> wqb.Latency.parse('const:0.1').sample()
+    0.1
+    >>> 0.05 <= wqb.Latency.parse('uniform:0.05,0.2').sample() <= 0.2
+    True
+    >>> wqb.Latency.parse('lognormal:-2,0.5').sample() > 0
+    True
+    """
+
+    KINDS = ('const', 'uniform', 'lognormal', 'exp')
+
+    def __init__(
+        self,
+        kind: str = 'const',
+        *params: float,
+        seed: int | None = None,
+    ) -> None:
+        if kind not in self.KINDS:
+            raise ValueError(f"{kind} is not one of {self.KINDS}")
+        self.kind = kind
+        self.params = params or (0.0,)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<Latency [{self.kind}:{','.join(map(str, self.params))}]>"
+
+    @classmethod
+    def parse(
+        cls,
+        spec: 'str | float | Latency',
+        *,
+        seed: int | None = None,
+    ) -> 'Latency':
+        """
+        Parses a specification such as '0.1', 'const:0.1',
+        'uniform:0.05,0.2', 'lognormal:-2,0.5' (mu, sigma of the
+        underlying normal) or 'exp:0.1' (mean).
+        """
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls('const', float(spec), seed=seed)
+        kind, _, params = spec.partition(':')
+        if not params:
+            kind, params = 'const', kind
+        return cls(kind, *(float(p) for p in params.split(',')), seed=seed)
+
+    def sample(
+        self,
+    ) -> float:
+        """
+        Returns a non-negative sample in seconds.
+        """
+        with self.lock:
+            if 'uniform' == self.kind:
+                value = self.random.uniform(*self.params[:2])
+            elif 'lognormal' == self.kind:
+                value = self.random.lognormvariate(*self.params[:2])
+            elif 'exp' == self.kind:
+                value = self.random.expovariate(1.0 / max(1e-9, self.params[0]))
+            else:
+                value = self.params[0]
+        return max(0.0, value)
+
+
+class RedirectAdapter(PooledHTTPAdapter):
+    """
+    A `PooledHTTPAdapter` that rewrites the BRAIN API host (any scheme or
+    port, see `URL_ALPHAS_ALPHAID_SUBMIT`) to another base URL, e.g. a
+    local stand-in server.
+    """
+
+    API_HOST = urlsplit(WQB_API_URL).hostname
+
+    def __init__(
+        self,
+        base_url: str | None,
+        pool_size: int = 10,
+        **kwargs,
+    ) -> None:
+        super().__init__(pool_size, **kwargs)
+        self.base_url = None if base_url is None else base_url.rstrip('/')
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<RedirectAdapter [{self.base_url}]>"
+
+    def send(
+        self,
+        request: PreparedRequest,
+        *args,
+        **kwargs,
+    ) -> Response:
+        parts = urlsplit(request.url)
+        if self.base_url is not None and self.API_HOST == parts.hostname:
+            request.url = self.base_url + request.url[len(f"{parts.scheme}://{parts.netloc}") :]
+        return super().send(request, *args, **kwargs)
+
+
+class RecordingAdapter(RedirectAdapter):
+    """
+    A `RedirectAdapter` that appends every exchange to a JSON Lines
+    fixture file, which `ReplayAdapter` can serve later. URLs are
+    recorded before they are rewritten, and nothing is rewritten unless
+    `base_url` is given.
+
+    Credentials are never written: `Authorization`, `Cookie` and
+    `Set-Cookie` headers are dropped.
+    """
+
+    SECRET_HEADERS = ('Authorization', 'Cookie', 'Set-Cookie')
+
+    def __init__(
+        self,
+        path: str,
+        pool_size: int = 10,
+        *,
+        base_url: str | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(base_url, pool_size, **kwargs)
+        self.path = path
+        self.file_lock = threading.Lock()
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<RecordingAdapter [{self.path}]>"
+
+    def send(
+        self,
+        request: PreparedRequest,
+        *args,
+        **kwargs,
+    ) -> Response:
+        url = request.url
+        resp = super().send(request, *args, **kwargs)
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='replace')
+        record = {
+            'method': request.method,
+            'url': url,
+            'body': body,
+            'status_code': resp.status_code,
+            'reason': resp.reason,
+            'headers': {
+                key: value
+                for key, value in resp.headers.items()
+                if key not in self.SECRET_HEADERS
+            },
+            'content': base64.b64encode(resp.content).decode('ascii'),
+            'elapsed': resp.elapsed.total_seconds(),
+        }
+        with self.file_lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return resp
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    An adapter that serves the exchanges recorded by `RecordingAdapter`
+    without any network access.
+
+    Responses of the same method and URL are served in recorded order,
+    and the last one repeats once they run out, so polling loops replay
+    their `Retry-After` progress faithfully.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        latency: 'str | float | Latency | None' = None,
+    ) -> None:
+        """
+        Initializes a `ReplayAdapter` object.
+
+        Parameters
+        ----------
+        path: str
+            The fixture file written by `RecordingAdapter`.
+        latency: str | float | Latency | None = None
+            The latency added to every response. If *'recorded'*, the
+            recorded `elapsed` is replayed. If *None*, responses are
+            served immediately. See also `Latency.parse`.
+
+        Returns
+        -------
+        None
+        """
+        super().__init__()
+        self.path = path
+        self.recorded_latency = 'recorded' == latency
+        self.latency = (
+            None if latency is None or self.recorded_latency else Latency.parse(latency)
+        )
+        self.lock = threading.Lock()
+        self.records = defaultdict(deque)
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.records[(record['method'], record['url'])].append(record)
+
+    def __repr__(
+        self,
+    ) -> str:
+        return f"<ReplayAdapter [{self.path}]>"
+
+    def send(
+        self,
+        request: PreparedRequest,
+        *args,
+        **kwargs,
+    ) -> Response:
+        with self.lock:
+            records = self.records.get((request.method, request.url))
+            record = None
+            if records:
+                record = records.popleft() if 1 < len(records) else records[0]
+        resp = Response()
+        resp.request = request
+        resp.url = request.url
+        if record is None:
+            resp.status_code = 501
+            resp.reason = 'Not Recorded'
+            resp.headers = CaseInsensitiveDict()
+            resp._content = b''
+            resp.elapsed = datetime.timedelta(0)
+            return resp
+        if self.recorded_latency:
+            delay = record['elapsed']
+        elif self.latency is not None:
+            delay = self.latency.sample()
+        else:
+            delay = 0.0
+        if 0.0 < delay:
+            time.sleep(delay)
+        resp.status_code = record['status_code']
+        resp.reason = record['reason']
+        resp.headers = CaseInsensitiveDict(record['headers'])
+        resp._content = base64.b64decode(record['content'])
+        resp.encoding = 'utf-8'
+        resp.elapsed = datetime.timedelta(seconds=delay)
+        return resp
+
+    def close(
+        self,
+    ) -> None:
+        pass
@@ -1,10 +1,11 @@
 import json
 import os
 import asyncio
+import collections
 import datetime
 import itertools
 import logging
-from collections.abc import Awaitable, Callable, Coroutine, Generator, Iterable, Sized
+from collections.abc import Awaitable, Callable, Coroutine, Generator, Hashable, Iterable, Sized
 import time
 from typing import Any, Dict, List, Type, Optional, Tuple
 import concurrent
@@ -14,6 +15,7 @@ from requests.auth import HTTPBasicAuth
 
 from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 from . import (
     GET,
@@ -43,8 +45,24 @@ from . import (
     Pasteurization,
     AlphasOrder,
 )
+from .adaptive_concurrency import AdaptiveConcurrency
 from .auto_auth_session import AutoAuthSession
+from .circuit_breaker import CIRCUIT_CLOSED, get_circuit_breaker
+from .connection_pool import PooledHTTPAdapter
+from .fast_json import align_pnls, days_to_dates, decode_pnl, loads
 from .filter_range import FilterRange
+from .idempotency import SimulationLedger
+from .lanes import RequestLanes
+from .poll_scheduler import PollScheduler
+from .metrics import get_metrics
+from .rate_limiter import get_rate_limiter
+from .transport import (
+    API_PREFIXES,
+    Latency,
+    RecordingAdapter,
+    RedirectAdapter,
+    ReplayAdapter,
+)
 from .wqb_urls import (
     URL_ALPHAS,
     URL_ALPHAS_ALPHAID,
@@ -61,7 +79,14 @@ from .wqb_urls import (
     WQB_API_URL,
 )
 
-__all__ = ['print', 'wqb_logger', 'to_multi_alphas', 'concurrent_await', 'WQBSession']
+__all__ = [
+    'print',
+    'wqb_logger',
+    'to_multi_alphas',
+    'pack_multi_alphas',
+    'concurrent_await',
+    'WQBSession',
+]
 
 
 _print = print
@@ -193,10 +218,78 @@ def to_multi_alphas(
             yield multi_alpha
 
 
+def _settings_key(
+    alpha: Alpha,
+) -> tuple[Any, ...]:
+    settings = alpha.get('settings') or {}
+    return tuple(
+        settings.get(name)
+        for name in ('instrumentType', 'region', 'universe', 'delay')
+    )
+
+
+def pack_multi_alphas(
+    alphas: Iterable[Any],
+    multiple: int = 10,
+    *,
+    key: Callable[[Any], Hashable] | None = None,
+    cost: Callable[[Any], float] | None = None,
+) -> list[list[Any]]:
+    """
+    Packs alphas into multi-alpha groups of compatible settings and
+    similar predicted runtime.
+
+    A multi-simulation finishes with its slowest child, so alphas are
+    first grouped by `key`, then sorted by `cost` within each group and
+    cut into packs of `multiple`, which keeps slow alphas from holding
+    up fast ones. The packs are returned slowest first, so that the
+    longest ones start early and the concurrency slots finish together.
+
+    Parameters
+    ----------
+    alphas: Iterable[Any]
+        The alphas, e.g. `Alpha` objects or database rows.
+    multiple: int = 10
+        The maximum number of alphas per pack.
+    key: Callable[[Any], Hashable] | None = None
+        The compatibility key. Alphas with different keys never share a
+        pack. If *None*, the instrument type, region, universe and delay
+        in `alpha['settings']` are used.
+    cost: Callable[[Any], float] | None = None
+        The predicted runtime of an alpha. If *None*, every alpha costs
+        the same and the input order is kept within each group.
+
+    Returns
+    -------
+    list[list[Any]]
+        The packs.
+
+    Examples
+    --------
+    >>> packs = wqb.pack_multi_alphas(alphas, 10, cost=lambda alpha: 1.0)
+    """
+    if key is None:
+        key = _settings_key
+    multiple = max(1, multiple)
+    groups = {}
+    for alpha in alphas:
+        groups.setdefault(key(alpha), []).append(
+            (1.0 if cost is None else cost(alpha), alpha)
+        )
+    packs = []
+    for items in groups.values():
+        items.sort(key=lambda item: item[0], reverse=True)
+        for idx in range(0, len(items), multiple):
+            chunk = items[idx : idx + multiple]
+            packs.append((chunk[0][0], [alpha for _, alpha in chunk]))
+    packs.sort(key=lambda pack: pack[0], reverse=True)
+    return [pack for _, pack in packs]
+
+
 async def concurrent_await(
     awaitables: Iterable[Awaitable[Any]],
     *,
-    concurrency: int | asyncio.Semaphore | None = None,
+    concurrency: int | asyncio.Semaphore | AdaptiveConcurrency | None = None,
     return_exceptions: bool = False,
 ) -> Coroutine[None, None, list[Any | BaseException]]:
     """
@@ -209,10 +302,11 @@ async def concurrent_await(
     ----------
     awaitables: Iterable[Awaitable[Any]]
         The iterable series of `Awaitable` objects.
-    concurrency: int | asyncio.Semaphore | None = None
+    concurrency: int | asyncio.Semaphore | AdaptiveConcurrency | None = None
         The maximum number of `Awaitable` objects that can be awaited at
         the same time. If *int | asyncio.Semaphore*, the concurrency
-        limit is set to it. If *None*, there is no concurrency limit.
+        limit is set to it. If *AdaptiveConcurrency*, the limit follows
+        its current value. If *None*, there is no concurrency limit.
     return_exceptions: bool = False
         Whether to return exceptions instead of raising them.
 
@@ -263,6 +357,9 @@ class WQBSession(AutoAuthSession):
         self,
         wqb_auth: tuple[str, str] | HTTPBasicAuth,
         *,
+        auth_cache: str | None = None,
+        pool_size: int = 16,
+        rates: dict[str, tuple[float, float]] | None = None,
         logger: logging.Logger = logging.root,
         **kwargs,
     ) -> None:
@@ -274,6 +371,20 @@ class WQBSession(AutoAuthSession):
         wqb_auth: tuple[str, str] | HTTPBasicAuth
             The authentication credentials that consist of email and
             password.
+        auth_cache: str | None = None
+            The path of a file that persists the session cookies between
+            runs, e.g. '~/.brain_session.json'. If *None*, every run logs
+            in from scratch.
+        pool_size: int = 16
+            The number of pooled connections per host, which is also the
+            default number of `arequest` worker threads and the total of
+            the default `RequestLanes` object. See also `resize_pool`.
+        rates: dict[str, tuple[float, float]] | None = None
+            The `(rate, capacity)` pairs keyed by endpoint class applied
+            to `rate_limiter` with `RateLimiter.configure`, e.g.
+            `{'simulate': (2.0, 10)}`. Unlisted classes keep their rates,
+            see `RateLimiter.DEFAULT_RATES`. As the default `rate_limiter`
+            is shared, so are the rates.
         logger: logging.Logger = logging.root
             The `logging.Logger` object to log requests.
 
@@ -284,7 +395,15 @@ class WQBSession(AutoAuthSession):
         Notes
         -----
         No `args` are accepted, while `kwargs` are passed to
-        `AutoAuthSession.__init__`.
+        `AutoAuthSession.__init__`. Unless `rate_limiter`,
+        `circuit_breaker` or `metrics` is given, every `WQBSession`
+        object shares the process-wide `RateLimiter`, `CircuitBreaker`
+        and `Metrics` objects returned by `get_rate_limiter`,
+        `get_circuit_breaker` and `get_metrics`, so that an outage
+        pauses every stage at once. Unless `lanes` is given,
+        each `WQBSession` object gets its own `RequestLanes` object, so
+        that polls and checks are served before bulk reads; pass
+        `lanes=None` to disable it.
 
         Examples
         --------
@@ -299,21 +418,57 @@ class WQBSession(AutoAuthSession):
         ...     ('<email>', '<password>'),
         ...     logger=logger,
         ... )
+
+        Caching catalogs and PnL recordsets on disk:
+
+        >>> wqbs = wqb.WQBSession(
+        ...     ('<email>', '<password>'),
+        ...     response_cache=wqb.ResponseCache('~/.cache/wqb'),
+        ... )
+
+        Reusing the login of a previous run:
+
+        >>> wqbs = wqb.WQBSession(
+        ...     ('<email>', '<password>'),
+        ...     auth_cache='~/.brain_session.json',
+        ... )
         """
         if not isinstance(wqb_auth, HTTPBasicAuth):
             wqb_auth = HTTPBasicAuth(*wqb_auth)
         kwargs['auth'] = wqb_auth
+        kwargs.setdefault('rate_limiter', get_rate_limiter())
+        kwargs.setdefault('circuit_breaker', get_circuit_breaker())
+        kwargs.setdefault('metrics', get_metrics())
+        kwargs.setdefault('async_workers', pool_size)
+        kwargs.setdefault('lanes', RequestLanes(pool_size))
         super().__init__(
             POST,
             URL_AUTHENTICATION,
             auth_expected=lambda resp: 201 == resp.status_code,
+            auth_expiry=self._auth_expiry,
+            auth_cache=auth_cache,
+            auth_cache_key=wqb_auth.username,
             expected=lambda resp: resp.status_code not in (204, 401, 429),
             logger=logger,
             **kwargs,
         )
+        self.pool_size = 0
+        self.resize_pool(pool_size)
+        if rates and self.rate_limiter is not None:
+            self.rate_limiter.configure(rates)
+        if self.metrics is not None and self.circuit_breaker is not None:
+            breaker = self.circuit_breaker
+            self.metrics.register_gauge(
+                'circuit_open', lambda: int(CIRCUIT_CLOSED != breaker.state)
+            )
+        self.load_auth_cache()
         self.expected_location = (
             lambda resp: self.expected(resp) and LOCATION in resp.headers
         )
+        # A 5xx response to a POST is ambiguous: the simulation may exist.
+        self.expected_location_or_ambiguous = (
+            lambda resp: self.expected_location(resp) or 500 <= resp.status_code
+        )
 
     def __repr__(
         self,
@@ -328,6 +483,190 @@ class WQBSession(AutoAuthSession):
         """
         return f"<WQBSession [{repr(self.wqb_auth.username)}]>"
 
+    def resize_pool(
+        self,
+        pool_size: int,
+    ) -> None:
+        """
+        Resizes the mounted `PooledHTTPAdapter` objects (or mounts new
+        ones) to `pool_size` connections per host and makes
+        `async_workers` and `lanes` follow it.
+
+        Parameters
+        ----------
+        pool_size: int
+            The number of pooled connections per host. It should be at
+            least the number of threads or coroutines that send requests
+            at the same time.
+
+        Returns
+        -------
+        None
+        """
+        pool_size = max(1, pool_size)
+        if pool_size == self.pool_size:
+            return
+        for prefix in ('https://', 'http://'):
+            if not isinstance(self.adapters.get(prefix), PooledHTTPAdapter):
+                self.mount(prefix, PooledHTTPAdapter(pool_size))
+        for adapter in self.adapters.values():
+            if isinstance(adapter, PooledHTTPAdapter):
+                adapter.resize(pool_size)
+        self.pool_size = pool_size
+        if self.lanes is not None:
+            self.lanes.resize(pool_size)
+        if self.async_workers < pool_size:
+            self.async_workers = pool_size
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def pool_stats(
+        self,
+    ) -> dict[str, int | float]:
+        """
+        Returns the connection reuse counters of every mounted
+        `PooledHTTPAdapter` object.
+
+        Returns
+        -------
+        dict[str, int | float]
+            See also `PooledHTTPAdapter.stats`.
+        """
+        adapters = {
+            id(adapter): adapter
+            for adapter in self.adapters.values()
+            if isinstance(adapter, PooledHTTPAdapter)
+        }
+        stats = [adapter.stats() for adapter in adapters.values()]
+        connections = sum(item['connections'] for item in stats)
+        requests = sum(item['requests'] for item in stats)
+        reused = sum(item['reused'] for item in stats)
+        return {
+            'pool_size': self.pool_size,
+            'connections': connections,
+            'requests': requests,
+            'reused': reused,
+            'reuse_ratio': reused / requests if 0 < requests else 0.0,
+        }
+
+    def degraded(
+        self,
+        method: str,
+        resp: Response,
+    ) -> bool:
+        """
+        Returns whether `resp` is a 5xx response to a GET that should be
+        polled again, i.e. the session has a `circuit_breaker`.
+        """
+        return (
+            self.circuit_breaker is not None
+            and GET == method.upper()
+            and 500 <= resp.status_code
+        )
+
+    def circuit_closed(
+        self,
+    ) -> bool:
+        """
+        Returns whether requests flow normally, i.e. there is no
+        `circuit_breaker` or it is closed.
+
+        Returns
+        -------
+        bool
+            *False* while the circuit is open or being probed.
+        """
+        return self.circuit_breaker is None or CIRCUIT_CLOSED == self.circuit_breaker.state
+
+    def redirect(
+        self,
+        base_url: str,
+    ) -> None:
+        """
+        Sends every request to `WQB_API_URL` to `base_url` instead, e.g. a
+        local stand-in server.
+
+        Parameters
+        ----------
+        base_url: str
+            The base URL that replaces `WQB_API_URL`.
+
+        Returns
+        -------
+        None
+        """
+        adapter = RedirectAdapter(base_url, self.pool_size)
+        for prefix in API_PREFIXES:
+            self.mount(prefix, adapter)
+
+    def record(
+        self,
+        path: str,
+    ) -> None:
+        """
+        Appends every exchange with `WQB_API_URL` to the fixture file
+        `path`, which `replay` can serve later. A `redirect` in place is
+        kept.
+
+        Parameters
+        ----------
+        path: str
+            The fixture file in JSON Lines.
+
+        Returns
+        -------
+        None
+
+        Examples
+        --------
+        >>> wqbs.record('fixtures/simulate.jsonl')
+        >>> resp = asyncio.run(wqbs.simulate(alpha))
+        """
+        current = self.get_adapter(WQB_API_URL)
+        base_url = current.base_url if isinstance(current, RedirectAdapter) else None
+        adapter = RecordingAdapter(path, self.pool_size, base_url=base_url)
+        for prefix in API_PREFIXES:
+            self.mount(prefix, adapter)
+
+    def replay(
+        self,
+        path: str,
+        *,
+        latency: 'str | float | Latency | None' = None,
+    ) -> None:
+        """
+        Serves every request to `WQB_API_URL` from the fixture file `path`
+        written by `record`, without any network access.
+
+        Parameters
+        ----------
+        path: str
+            The fixture file in JSON Lines.
+        latency: str | float | Latency | None = None
+            See also `ReplayAdapter.__init__`.
+
+        Returns
+        -------
+        None
+        """
+        adapter = ReplayAdapter(path, latency=latency)
+        for prefix in API_PREFIXES:
+            self.mount(prefix, adapter)
+
+    @staticmethod
+    def _auth_expiry(
+        resp: Response,
+    ) -> float | None:
+        """
+        Reads the token lifetime in seconds from an authentication
+        response, e.g. `{"token": {"expiry": 14400.0}, ...}`.
+        """
+        try:
+            return float(resp.json()['token']['expiry'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
     @property
     def wqb_auth(
         self,
@@ -617,6 +956,69 @@ class WQBSession(AutoAuthSession):
             )
         return resp
 
+    def _paginate(
+        self,
+        name: str,
+        fetch: Callable[[int, str | None], Response],
+        offsets: range,
+        *,
+        concurrency: int = 1,
+        ordered: bool = True,
+        log: str | None = '',
+        log_gap: int = 100,
+    ) -> Generator[Response, None, None]:
+        """
+        Yields `fetch(offset, page_log)` for every offset of `offsets`,
+        with at most `concurrency` pages in flight on a private thread
+        pool. If `ordered` is *False*, pages are yielded as they arrive.
+        Pages not yet yielded are cancelled when the generator is closed.
+        """
+        if log is None:
+            log_gap = 0
+        if log is not None:
+            self.logger.info(f"{self}.{name}(...) [start {offsets}]: {log}")
+        total = len(offsets)
+
+        def page_log(idx: int) -> str | None:
+            if 0 != log_gap and 0 == idx % log_gap:
+                return f"{idx}/{total} = {int(100*idx/total)}%"
+            return None
+
+        pages = enumerate(offsets, start=1)
+        if concurrency <= 1:
+            for idx, offset in pages:
+                yield fetch(offset, page_log(idx))
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=min(concurrency, max(1, total)),
+                thread_name_prefix=name,
+            )
+            pending = collections.deque()
+
+            def submit() -> None:
+                for idx, offset in itertools.islice(pages, 1):
+                    pending.append(executor.submit(fetch, offset, page_log(idx)))
+
+            try:
+                for _ in range(concurrency):
+                    submit()
+                while pending:
+                    if ordered:
+                        future = pending.popleft()
+                    else:
+                        done, _ = concurrent.futures.wait(
+                            pending, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        future = next(f for f in pending if f in done)
+                        pending.remove(future)
+                    resp = future.result()
+                    submit()
+                    yield resp
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        if log is not None:
+            self.logger.info(f"{self}.{name}(...) [finish {offsets}]: {log}")
+
     def search_datasets_limited(
         self,
         region: Region,
@@ -690,34 +1092,31 @@ class WQBSession(AutoAuthSession):
         offset: int = 0,
         log: str | None = '',
         log_gap: int = 100,
+        concurrency: int = 1,
+        ordered: bool = True,
         **kwargs,
     ) -> Generator[Response, None, None]:
-        if log is None:
-            log_gap = 0
         count = self.search_datasets_limited(
             region, delay, universe, *args, limit=1, offset=offset, log=log, **kwargs
         ).json()['count']
-        offsets = range(offset, count, limit)
-        if log is not None:
-            self.logger.info(f"{self}.search_datasets(...) [start {offsets}]: {log}")
-        total = len(offsets)
-        for idx, offset in enumerate(offsets, start=1):
-            yield self.search_datasets_limited(
+        yield from self._paginate(
+            'search_datasets',
+            lambda offset, page_log: self.search_datasets_limited(
                 region,
                 delay,
                 universe,
                 *args,
                 limit=limit,
                 offset=offset,
-                log=(
-                    f"{idx}/{total} = {int(100*idx/total)}%"
-                    if 0 != log_gap and 0 == idx % log_gap
-                    else None
-                ),
+                log=page_log,
                 **kwargs,
-            )
-        if log is not None:
-            self.logger.info(f"{self}.search_datasets(...) [finish {offsets}]: {log}")
+            ),
+            range(offset, count, limit),
+            concurrency=concurrency,
+            ordered=ordered,
+            log=log,
+            log_gap=log_gap,
+        )
 
     def locate_field(
         self,
@@ -816,34 +1215,31 @@ class WQBSession(AutoAuthSession):
         offset: int = 0,
         log: str | None = '',
         log_gap: int = 100,
+        concurrency: int = 1,
+        ordered: bool = True,
         **kwargs,
     ) -> Generator[Response, None, None]:
-        if log is None:
-            log_gap = 0
         count = self.search_fields_limited(
             region, delay, universe, *args, limit=1, offset=offset, log=log, **kwargs
         ).json()['count']
-        offsets = range(offset, count, limit)
-        if log is not None:
-            self.logger.info(f"{self}.search_fields(...) [start {offsets}]: {log}")
-        total = len(offsets)
-        for idx, offset in enumerate(offsets, start=1):
-            yield self.search_fields_limited(
+        yield from self._paginate(
+            'search_fields',
+            lambda offset, page_log: self.search_fields_limited(
                 region,
                 delay,
                 universe,
                 *args,
                 limit=limit,
                 offset=offset,
-                log=(
-                    f"{idx}/{total} = {int(100*idx/total)}%"
-                    if 0 != log_gap and 0 == idx % log_gap
-                    else None
-                ),
+                log=page_log,
                 **kwargs,
-            )
-        if log is not None:
-            self.logger.info(f"{self}.search_fields(...) [finish {offsets}]: {log}")
+            ),
+            range(offset, count, limit),
+            concurrency=concurrency,
+            ordered=ordered,
+            log=log,
+            log_gap=log_gap,
+        )
 
     async def locate_alpha(  # 改为 async def
         self,
@@ -876,9 +1272,8 @@ class WQBSession(AutoAuthSession):
 
         for attempt in range(max_retries + 1):  # 0次重试意味着总共尝试1次
             try:
-                # 如果 self.get 是同步方法，使用 asyncio.to_thread 在线程池中运行
-                # 假设 self.get 是同步的，模仿 patch_properties 的做法
-                final_resp = await asyncio.to_thread(self.get, url, *args, **kwargs)
+                # 在 self.executor 线程池中运行同步请求, 不阻塞事件循环
+                final_resp = await self.arequest(GET, url, *args, **kwargs)
 
                 if final_resp.status_code < 400:  # 例如 2xx 表示成功
                     if (
@@ -1180,31 +1575,31 @@ class WQBSession(AutoAuthSession):
         offset: int = 0,
         log: str | None = '',
         log_gap: int = 100,
+        concurrency: int = 1,
+        ordered: bool = True,
+        max_count: int | None = None,
         **kwargs,
     ) -> Generator[Response, None, None]:
-        if log is None:
-            log_gap = 0
         count = self.filter_alphas_limited(
             *args, limit=1, offset=offset, log=log, **kwargs
         ).json()['count']
-        offsets = range(offset, count, limit)
-        if log is not None:
-            self.logger.info(f"{self}.filter_alphas(...) [start {offsets}]: {log}")
-        total = len(offsets)
-        for idx, offset in enumerate(offsets, start=1):
-            yield self.filter_alphas_limited(
+        if max_count is not None:
+            count = min(count, offset + max(0, max_count))
+        yield from self._paginate(
+            'filter_alphas',
+            lambda offset, page_log: self.filter_alphas_limited(
                 *args,
                 limit=limit,
                 offset=offset,
-                log=(
-                    f"{idx}/{total} = {int(100*idx/total)}%"
-                    if 0 != log_gap and 0 == idx % log_gap
-                    else None
-                ),
+                log=page_log,
                 **kwargs,
-            )
-        if log is not None:
-            self.logger.info(f"{self}.filter_alphas(...) [finish {offsets}]: {log}")
+            ),
+            range(offset, count, limit),
+            concurrency=concurrency,
+            ordered=ordered,
+            log=log,
+            log_gap=log_gap,
+        )
 
     def patch_properties(
         self,
@@ -1285,7 +1680,22 @@ class WQBSession(AutoAuthSession):
         if on_start is not None:
             on_start(locals())
         for tries, _ in enumerate(max_tries, start=1):
-            resp = self.request(method, url, *args, **kwargs)
+            resp = await self.arequest(method, url, *args, **kwargs)
+            if self.metrics is not None:
+                self.metrics.increment('polls', method, url)
+            while self.degraded(method, resp) and not self.circuit_closed():
+                # The platform is degraded: keep polling once the breaker
+                # probes, without using up a try.
+                await asyncio.sleep(
+                    max(delay_key_error, self.circuit_breaker.retry_in())
+                )
+                resp = await self.arequest(method, url, *args, **kwargs)
+                if self.metrics is not None:
+                    self.metrics.increment('polls', method, url)
+            if self.degraded(method, resp):
+                # A sporadic 5xx: poll again instead of taking it as final.
+                await asyncio.sleep(delay_key_error)
+                continue
             try:
                 await asyncio.sleep(float(resp.headers[RETRY_AFTER]))
             except KeyError as e:
@@ -1315,7 +1725,7 @@ class WQBSession(AutoAuthSession):
                 '\n'.join(
                     (
                         f"{self}.retry(...) [max {tries} tries ran out]",
-                        f"self.request(method, url, *args, **kwargs):",
+                        f"self.arequest(method, url, *args, **kwargs):",
                         f"    method: {method}",
                         f"    url: {url}",
                         f"    args: {args}",
@@ -1344,19 +1754,85 @@ class WQBSession(AutoAuthSession):
         *args,
         max_tries: int | Iterable[Any] = range(600),
         on_nolocation: Callable[[dict[str, Any]], None] | None = None,
+        on_location: Callable[[dict[str, Any]], None] | None = None,
+        scheduler: PollScheduler | None = None,
+        controller: AdaptiveConcurrency | None = None,
+        ledger: SimulationLedger | None = None,
+        on_reconciled: Callable[[dict[str, Any]], None] | None = None,
         log: str | None = '',
         retry_log: str | None = None,
         **kwargs,
     ) -> Coroutine[None, None, Response | None]:
-        resp = self.post(
-            URL_SIMULATIONS,
-            json=target,
-            expected=self.expected_location,
-            max_tries=60,
-            delay_unexpected=5.0,
-        )
+        """
+        POSTs `target` and polls its `Location` URL until it finishes.
+
+        `on_location` is called with the local variables, including
+        `url`, as soon as the `Location` URL is known and before polling
+        starts, so that callers can persist it and resume polling after
+        a restart instead of POSTing again.
+
+        If `ledger` is given, the POST is made idempotent: a `target`
+        already located in `ledger` is polled instead of POSTed, a 5xx
+        response is not retried, and a `target` whose earlier POST is
+        ambiguous is first reconciled with `areconcile_simulation`. If
+        alphas are found, `on_reconciled` is called with the local
+        variables, including `alpha_ids`, and *None* is returned. If
+        none are found, *None* is returned until the POST is settled
+        (see `SimulationLedger`), after which `target` is POSTed again.
+
+        If `scheduler` is given, the `Location` URL is polled by the
+        shared `PollScheduler` object instead of a polling loop of its
+        own; `args` are then ignored, while `max_tries` and the `on_*`
+        callbacks in `kwargs` keep their meaning. If `controller` is
+        given, every POST response, including retried ones, is fed to
+        `controller.observe`.
+        """
+        url = None
+        if ledger is not None:
+            key = ledger.key(target)
+            entry = ledger.get(key)
+            if entry is not None and entry['location']:
+                url = entry['location']
+            elif entry is not None:
+                alpha_ids = await self.areconcile_simulation(
+                    target, entry['posted_at']
+                )
+                if alpha_ids is not None:
+                    self.logger.info(
+                        f"{self}.simulate(...) [reconciled {alpha_ids}]: {key}"
+                    )
+                    ledger.finish(key)
+                    if on_reconciled is not None:
+                        on_reconciled(locals())
+                    return None
+                if not ledger.settled(entry):
+                    self.logger.info(
+                        f"{self}.simulate(...) [ambiguous POST not settled]: {key}"
+                    )
+                    return None
+        if url is None:
+            if ledger is not None:
+                ledger.begin(key, target)
+            resp = await self.arequest(
+                POST,
+                URL_SIMULATIONS,
+                json=target,
+                expected=(
+                    self.expected_location
+                    if ledger is None
+                    else self.expected_location_or_ambiguous
+                ),
+                max_tries=60,
+                delay_unexpected=5.0,
+                hooks=(
+                    {'response': controller.observe} if controller is not None else None
+                ),
+            )
         try:
-            url = resp.headers[LOCATION]
+            if url is None:
+                url = resp.headers[LOCATION]
+                if ledger is not None:
+                    ledger.locate(key, url)
         except KeyError as e:
             self.logger.warning(
                 '\n'.join(
@@ -1375,12 +1851,29 @@ class WQBSession(AutoAuthSession):
                     )
                 )
             )
+            if ledger is not None and resp.status_code < 500:
+                # Definitely rejected, e.g. 4xx or 429 that ran out of tries.
+                ledger.finish(key)
             if on_nolocation is not None:
                 on_nolocation(locals())
             return None
-        resp = await self.retry(
-            GET, url, *args, max_tries=max_tries, log=retry_log, **kwargs
-        )
+        if on_location is not None:
+            on_location(locals())
+        if scheduler is not None:
+            resp = await scheduler.poll(url, max_tries=max_tries, **kwargs)
+        else:
+            resp = await self.retry(
+                GET, url, *args, max_tries=max_tries, log=retry_log, **kwargs
+            )
+        if (
+            ledger is not None
+            and resp is not None
+            and RETRY_AFTER not in resp.headers
+            and resp.status_code < 500
+        ):
+            # A 5xx poll says nothing about the simulation, which keeps
+            # its `Location` URL.
+            ledger.finish(key)
         if log is not None:
             self.logger.info(
                 '\n'.join(
@@ -1394,10 +1887,118 @@ class WQBSession(AutoAuthSession):
             )
         return resp
 
+    def reconcile_simulation(
+        self,
+        target: Alpha | MultiAlpha,
+        since: float,
+        *,
+        skew: float = 300.0,
+        max_count: int = 1000,
+    ) -> list[str] | None:
+        """
+        Looks for the alphas an earlier POST of `target` may have
+        created, i.e. alphas created since `since` with the same code
+        and settings.
+
+        Parameters
+        ----------
+        target: Alpha | MultiAlpha
+            The `Alpha` or `MultiAlpha` object.
+        since: float
+            The POSIX timestamp of the earlier POST.
+        skew: float = 300.0
+            The number of seconds the search window is widened by on
+            both ends, for clock differences.
+        max_count: int = 1000
+            The maximum number of alphas searched.
+
+        Returns
+        -------
+        list[str] | None
+            The alpha IDs in the order of `target`, or *None* unless
+            every alpha of `target` is found.
+        """
+        targets = target if isinstance(target, list) else [target]
+        tz = datetime.timezone(datetime.timedelta(hours=-5))
+        date_created = FilterRange(
+            datetime.datetime.fromtimestamp(since - skew, tz).replace(microsecond=0),
+            datetime.datetime.now(tz).replace(microsecond=0)
+            + datetime.timedelta(seconds=skew),
+            lo_eq=True,
+            hi_eq=True,
+        )
+
+        alphas = []
+        for resp in self.filter_alphas(
+            date_created=date_created,
+            order='dateCreated',
+            max_count=max_count,
+            log=None,
+        ):
+            alphas.extend(resp.json().get('results', []))
+
+        def code(regular: Any) -> str:
+            if isinstance(regular, dict):
+                regular = regular.get('code')
+            return ''.join((regular or '').split())
+
+        alpha_ids = []
+        for item in targets:
+            settings = item.get('settings') or {}
+            for alpha in alphas:
+                alpha_settings = alpha.get('settings') or {}
+                if (
+                    alpha['id'] not in alpha_ids
+                    and code(alpha.get('regular')) == code(item.get('regular'))
+                    and all(
+                        alpha_settings.get(name, value) == value
+                        for name, value in settings.items()
+                    )
+                ):
+                    alpha_ids.append(alpha['id'])
+                    break
+            else:
+                return None
+        return alpha_ids
+
+    async def areconcile_simulation(
+        self,
+        target: Alpha | MultiAlpha,
+        since: float,
+        **kwargs,
+    ) -> list[str] | None:
+        """
+        Runs `reconcile_simulation` in a worker thread, so that the
+        event loop is free while `filter_alphas` pages through the
+        results.
+
+        Parameters
+        ----------
+        target: Alpha | MultiAlpha
+            The `Alpha` or `MultiAlpha` object.
+        since: float
+            The POSIX timestamp of the earlier POST.
+
+        Returns
+        -------
+        list[str] | None
+            The alpha IDs in the order of `target`, or *None* unless
+            every alpha of `target` is found.
+
+        Notes
+        -----
+        `kwargs` are passed to `reconcile_simulation`. The default
+        executor is used rather than `executor`, so that the paging does
+        not hold a worker `arequest` calls are waiting for.
+        """
+        return await asyncio.to_thread(
+            self.reconcile_simulation, target, since, **kwargs
+        )
+
     async def concurrent_simulate(
         self,
         targets: Iterable[Alpha | MultiAlpha],
-        concurrency: int | asyncio.Semaphore,
+        concurrency: int | asyncio.Semaphore | AdaptiveConcurrency,
         *args,
         return_exceptions: bool = False,
         log: str | None = '',
@@ -1410,6 +2011,12 @@ class WQBSession(AutoAuthSession):
             log_gap = 0
         if isinstance(concurrency, int):
             concurrency = asyncio.Semaphore(value=concurrency)
+        if isinstance(concurrency, AdaptiveConcurrency):
+            kwargs.setdefault('controller', concurrency)
+            if self.metrics is not None:
+                self.metrics.register_gauge(
+                    'concurrency_limit', lambda: concurrency.current
+                )
         total = len(targets)
         if log is not None:
             self.logger.info(
@@ -1443,14 +2050,18 @@ class WQBSession(AutoAuthSession):
         alpha_id: str,
         *args,
         max_tries: int | Iterable[Any] = range(600),
+        scheduler: PollScheduler | None = None,
         log: str | None = '',
         retry_log: str | None = None,
         **kwargs,
     ) -> Coroutine[None, None, Response | None]:
         url = URL_ALPHAS_ALPHAID_CHECK.format(alpha_id)
-        resp = await self.retry(
-            GET, url, *args, max_tries=max_tries, log=retry_log, **kwargs
-        )
+        if scheduler is not None:
+            resp = await scheduler.poll(url, max_tries=max_tries, **kwargs)
+        else:
+            resp = await self.retry(
+                GET, url, *args, max_tries=max_tries, log=retry_log, **kwargs
+            )
         if log is not None:
             self.logger.info(
                 '\n'.join(
@@ -1666,12 +2277,15 @@ class WQBSession(AutoAuthSession):
             try:
                 response = self.get(url, timeout=timeout)  # 使用 session 的 get 方法
                 retry_after = response.headers.get("Retry-After")
-                if response.status_code == 429 or retry_after:
-                    # sleep_time = float(retry_after) if retry_after else (2 ** retries)
-                    sleep_time = min(2**retries, 64)
-                    # self.logger.info(f"Rate limit for {url}. Retrying in {sleep_time:.1f}s ({retries+1}/{max_retries})")
-                    # print(f"Rate limit for {url}. Retrying in {sleep_time:.1f}s ({retries+1}/{max_retries})")
-                    time.sleep(sleep_time)
+                if response.status_code == 429:
+                    # 限流由 rate_limiter 统一冷却, 没有 rate_limiter 时才自行退避
+                    if self.rate_limiter is None:
+                        time.sleep(min(2**retries, 64))
+                    retries += 1
+                    continue
+                if retry_after:
+                    # 数据尚未就绪, 按服务器给出的 Retry-After 等待
+                    time.sleep(float(retry_after))
                     retries += 1
                     continue
                 response.raise_for_status()
@@ -1681,6 +2295,11 @@ class WQBSession(AutoAuthSession):
                     pass
                 return response
             except requests.exceptions.Timeout as e:
+                if not self.circuit_closed():
+                    # 平台故障期间由熔断器统一暂停与探测, 不计重试次数, 不再自行退避和逐个报错
+                    last_exception = e
+                    time.sleep(self.circuit_breaker.retry_in())
+                    continue
                 self.logger.warning(
                     f"Timeout for {url}. Retrying ({retries+1}/{max_retries})"
                 )
@@ -1689,6 +2308,10 @@ class WQBSession(AutoAuthSession):
                 retries += 1
                 time.sleep(1 + 2**retries)
             except requests.exceptions.RequestException as e:
+                if not self.circuit_closed():
+                    last_exception = e
+                    time.sleep(self.circuit_breaker.retry_in())
+                    continue
                 self.logger.error(
                     f"Request failed for {url}: {e}. Retrying ({retries+1}/{max_retries})"
                 )
@@ -1721,60 +2344,35 @@ class WQBSession(AutoAuthSession):
             print(f"Failed to get details for alpha {alpha_id}: {e}")
             return None
 
-    def get_alpha_pnl(self, alpha_id: str) -> Optional[pd.DataFrame]:
+    def get_alpha_pnl_arrays(
+        self,
+        alpha_id: str,
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Returns the PnL of `alpha_id` as `int32` day numbers since
+        1970-01-01 and `float64` values, decoded straight from the
+        response bytes. See also `decode_pnl`.
+        """
         pnl_url = f"{URL_ALPHAS}/{alpha_id}/recordsets/pnl"
         try:
             response = self._wait_get_response(pnl_url)
-            pnl_data = response.json()
-
-            if (
-                "records" in pnl_data
-                and isinstance(pnl_data["records"], list)
-                and "schema" in pnl_data
-                and "properties" in pnl_data["schema"]
-            ):
-                columns = [item["name"] for item in pnl_data["schema"]["properties"]]
-                df = pd.DataFrame(pnl_data["records"], columns=columns)
-
-                if df.empty:
-                    return None
-
-                rename_map = {}
-                if "date" in df.columns:
-                    rename_map["date"] = "Date"
-                if "pnl" in df.columns:
-                    rename_map["pnl"] = alpha_id
-                else:
-                    for col in df.columns:
-                        if col.lower() not in [
-                            "date",
-                            "id",
-                            "alphaid",
-                        ]:  # 避免常用非pnl列
-                            rename_map[col] = alpha_id
-                            break
-                df = df.rename(columns=rename_map)
-
-                if "Date" not in df.columns or alpha_id not in df.columns:
-                    self.logger.error(
-                        f"PNL rename failed for {alpha_id}. Cols: {df.columns}"
-                    )
-                    print(f"PNL rename failed for {alpha_id}. Cols: {df.columns}")
-                    return None
-
-                df = df[["Date", alpha_id]]
-                df["Date"] = pd.to_datetime(df["Date"])
-                df[alpha_id] = pd.to_numeric(df[alpha_id], errors="coerce")
-
-                return df if not df.empty else None
-            else:
-                self.logger.error(f"Unexpected PNL JSON for {alpha_id}")
-                print(f"Unexpected PNL JSON for {alpha_id}")
-                return None
+            days, values = decode_pnl(response.content)
         except Exception as e:
             self.logger.error(f"Failed to fetch/process PNL for {alpha_id}: {e}")
             print(f"Failed to fetch/process PNL for {alpha_id}: {e}")
             return None
+        if 0 == len(days):
+            return None
+        return days, values
+
+    def get_alpha_pnl(self, alpha_id: str) -> Optional[pd.DataFrame]:
+        arrays = self.get_alpha_pnl_arrays(alpha_id)
+        if arrays is None:
+            return None
+        days, values = arrays
+        return pd.DataFrame(
+            {"Date": pd.to_datetime(days_to_dates(days)), alpha_id: values}
+        )
 
     def get_os_alphas(
         self, limit: int = 100, get_first: bool = False, stage: str = "OS"
@@ -1788,7 +2386,7 @@ class WQBSession(AutoAuthSession):
             url = f"{WQB_API_URL}/users/self/alphas?stage={stage}&limit={limit}&offset={offset}&order=-dateSubmitted"
             try:
                 response = self._wait_get_response(url)
-                res_json = response.json()
+                res_json = loads(response.content)
             except Exception as e:
                 self.logger.error(f"Failed to fetch alpha list {url}: {e}")
                 print(f"Failed to fetch alpha list {url}: {e}")
@@ -1820,35 +2418,37 @@ class WQBSession(AutoAuthSession):
         )
 
     def get_alpha_pnls_bulk(
-        self, alphas_metadata_list: list[dict], max_workers: int = 10
+        self, alphas_metadata_list: list[dict], max_workers: int | None = None
     ) -> pd.DataFrame:
-        all_pnls_list = []
+        if max_workers is None:
+            max_workers = self.pool_size
+        pnls = {}
 
         fetch_pnl_func = lambda alpha_meta: (
             alpha_meta["id"],
-            self.get_alpha_pnl(alpha_meta["id"]),
+            self.get_alpha_pnl_arrays(alpha_meta["id"]),
         )
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             results_iter = executor.map(fetch_pnl_func, alphas_metadata_list)
-            for alpha_id, pnl_df in results_iter:
-                if pnl_df is not None and not pnl_df.empty:
-                    pnl_df_indexed = pnl_df.set_index("Date")
-                    all_pnls_list.append(pnl_df_indexed)
+            for alpha_id, arrays in results_iter:
+                if arrays is not None:
+                    pnls.setdefault(alpha_id, arrays)
                 else:
                     self.logger.warning(
                         f"PNL for {alpha_id} empty/failed, skipping in bulk."
                     )
                     print(f"PNL for {alpha_id} empty/failed, skipping in bulk.")
 
-        if not all_pnls_list:
+        if not pnls:
             return pd.DataFrame()
-        combined_pnls_df = pd.concat(all_pnls_list, axis=1)
-        combined_pnls_df = combined_pnls_df.loc[
-            :, ~combined_pnls_df.columns.duplicated(keep="first")
-        ]
-        combined_pnls_df.sort_index(inplace=True)
-        return combined_pnls_df
+        # 按日期并集一次性对齐成矩阵, 避免逐个 DataFrame concat
+        days, alpha_ids, matrix = align_pnls(pnls)
+        return pd.DataFrame(
+            matrix,
+            index=pd.DatetimeIndex(days_to_dates(days), name="Date"),
+            columns=alpha_ids,
+        )
 
     # --- 原有的 update_local_pnl_storage 和 save_pnl ---
     # 这些方法在新自相关流程中不直接管理OS Alpha的整体PNL缓存（后者使用pickle），
@@ -1858,9 +2458,11 @@ class WQBSession(AutoAuthSession):
         self,
         submitted_alphas_list: List[Dict[str, Any]],
         storage_base_dir: str,
-        max_workers: int = 10,
+        max_workers: int | None = None,
         force_to_update_all_pnl=False,  # 变量名统一
     ) -> int:
+        if max_workers is None:
+            max_workers = self.pool_size  # 线程数与连接池大小一致, 避免连接被丢弃
         new_pnl_count = 0
         alphas_to_fetch = []
 